@@ -0,0 +1,199 @@
+from storage import STORAGE_FILES, addStorageArguments, openStorageFromArgs
+from term_store import normalizeTerm
+from bisect import bisect_left, bisect_right
+from time import monotonic
+import argparse
+import json
+import os
+
+SORT_FIELDS = ["rating", "reviewCount", "title"]
+
+def isFreeApp(record):
+	# the scraper stores ["Free"] exactly when the app page says "Price: Free"
+	return record.get('pricePlans') == ["Free"]
+
+class RangeIndex:
+	"""
+    Records of a numeric field sorted by value, so a range is two binary searches
+    """
+	def __init__(self, pairs):
+		pairs = sorted((value, url) for url, value in pairs if value is not None)
+		self.values = [value for value, url in pairs]
+		self.urls = [url for value, url in pairs]
+
+	def between(self, low=None, high=None):
+		start = bisect_left(self.values, low) if low is not None else 0
+		end = bisect_right(self.values, high) if high is not None else len(self.values)
+		return set(self.urls[start:end])
+
+class AppIndex:
+	"""
+    Read-side index over scraped apps. Only app metadata is loaded, never review
+    content, and only on the first query; categories and developers are looked
+    up by their normalized name, rating and review count by range
+    @params:
+        storage     - Required  : app storage to index (Storage)
+    """
+	def __init__(self, storage):
+		self.storage = storage
+		self.records = None
+		self.loadTime = None
+
+	def load(self):
+		if self.records is not None: return
+		startTime = monotonic()
+
+		self.records = {}
+		self.byCategory = {}
+		self.byDeveloper = {}
+		self.categoryNames = {}
+		self.developerNames = {}
+		self.freeApps = set()
+		# a few hundred distinct names cover thousands of apps, normalize each once
+		normalizedNames = {}
+		def normalize(name):
+			if name not in normalizedNames: normalizedNames[name] = normalizeTerm(name)
+			return normalizedNames[name]
+
+		for record in self.storage.metadataRecords():
+			url = record['url']
+			self.records[url] = record
+			for category in record.get('categories') or []:
+				key = normalize(category)
+				self.byCategory.setdefault(key, set()).add(url)
+				self.categoryNames.setdefault(key, category)
+			if record.get('developerName'):
+				key = normalize(record['developerName'])
+				self.byDeveloper.setdefault(key, set()).add(url)
+				self.developerNames.setdefault(key, record['developerName'])
+			if isFreeApp(record): self.freeApps.add(url)
+		self.byRating = RangeIndex((url, record.get('rating')) for url, record in self.records.items())
+		self.byReviewCount = RangeIndex((url, record.get('reviewCount')) for url, record in self.records.items())
+
+		self.loadTime = monotonic() - startTime
+
+	def query(self, category=None, developer=None, minRating=None, maxRating=None, minReviews=None, maxReviews=None, free=None, sortBy=None, descending=True, limit=None):
+		"""
+        Metadata of the apps matching every given filter
+        @params:
+            category    - Optional  : category the app is listed in (Str)
+            developer   - Optional  : developer name (Str)
+            minRating   - Optional  : lowest rating, inclusive (Float)
+            maxRating   - Optional  : highest rating, inclusive (Float)
+            minReviews  - Optional  : lowest review count, inclusive (Int)
+            maxReviews  - Optional  : highest review count, inclusive (Int)
+            free        - Optional  : True for free apps only, False for paid apps only (Bool)
+            sortBy      - Optional  : rating, reviewCount or title (Str)
+            descending  - Optional  : sort order (Bool)
+            limit       - Optional  : maximum number of apps returned (Int)
+        """
+		self.load()
+
+		candidateSets = []
+		if category is not None: candidateSets.append(self.byCategory.get(normalizeTerm(category), set()))
+		if developer is not None: candidateSets.append(self.byDeveloper.get(normalizeTerm(developer), set()))
+		if minRating is not None or maxRating is not None: candidateSets.append(self.byRating.between(minRating, maxRating))
+		if minReviews is not None or maxReviews is not None: candidateSets.append(self.byReviewCount.between(minReviews, maxReviews))
+
+		if len(candidateSets) > 0:
+			# intersect starting from the most selective filter
+			candidateSets.sort(key=len)
+			urls = set(candidateSets[0]).intersection(*candidateSets[1:])
+		else:
+			urls = set(self.records)
+		if free is True: urls &= self.freeApps
+		elif free is False: urls -= self.freeApps
+
+		results = [self.records[url] for url in urls]
+		if sortBy is not None:
+			missing = "" if sortBy == "title" else float("-inf")
+			results.sort(key=lambda record: record.get(sortBy) if record.get(sortBy) is not None else missing, reverse=descending)
+		else:
+			# storage order, so unsorted results are stable between runs
+			order = {url: index for index, url in enumerate(self.records)}
+			results.sort(key=lambda record: order[record['url']])
+		return results[:limit] if limit is not None else results
+
+	def categories(self):
+		"""
+        Number of apps per category, largest first
+        """
+		self.load()
+		return sorted(((self.categoryNames[key], len(urls)) for key, urls in self.byCategory.items()), key=lambda item: -item[1])
+
+	def developers(self):
+		self.load()
+		return sorted(((self.developerNames[key], len(urls)) for key, urls in self.byDeveloper.items()), key=lambda item: -item[1])
+
+	def get(self, url):
+		"""
+        Full stored record of `url`, reviews included
+        """
+		return self.storage.get(url)
+
+	def __len__(self):
+		self.load()
+		return len(self.records)
+
+def printApps(apps, outputFormat):
+	if outputFormat == "json":
+		print(json.dumps(apps, indent=4, ensure_ascii=False))
+		return
+	if outputFormat == "urls":
+		for app in apps:
+			print(app['url'])
+		return
+
+	print("{:<40} {:>6} {:>8}  {:<28} {}".format("title", "rating", "reviews", "developer", "url"))
+	for app in apps:
+		rating = "{:.1f}".format(app['rating']) if app.get('rating') is not None else "-"
+		reviewCount = app.get('reviewCount') if app.get('reviewCount') is not None else "-"
+		print("{:<40} {:>6} {:>8}  {:<28} {}".format((app.get('title') or "")[:40], rating, reviewCount, (app.get('developerName') or "")[:28], app['url']))
+
+def main():
+	parser = argparse.ArgumentParser(description='Query scraped Shopify apps by category, developer, rating, review count and price')
+	addStorageArguments(parser, writing=False)
+	parser.add_argument("-c", "--category", default=None, help="Apps listed in this category")
+	parser.add_argument("-d", "--developer", default=None, help="Apps by this developer")
+	parser.add_argument("--min-rating", type=float, default=None, help="Lowest rating")
+	parser.add_argument("--max-rating", type=float, default=None, help="Highest rating")
+	parser.add_argument("--min-reviews", type=int, default=None, help="Lowest review count")
+	parser.add_argument("--max-reviews", type=int, default=None, help="Highest review count")
+	parser.add_argument("--free", default=None, action=argparse.BooleanOptionalAction, help="Only free apps (--no-free for paid apps only)")
+	parser.add_argument("--sort", default=None, choices=SORT_FIELDS, help="Sort the apps by this field, highest first")
+	parser.add_argument("--ascending", default=False, action=argparse.BooleanOptionalAction, help="Sort lowest first")
+	parser.add_argument("-n", "--limit", type=int, default=None, help="Maximum number of apps listed")
+	parser.add_argument("-f", "--format", default="table", choices=["table", "json", "urls"], help="Output format of the matching apps")
+	parser.add_argument("--list-categories", default=False, action=argparse.BooleanOptionalAction, help="List the categories and their app counts instead")
+	parser.add_argument("--list-developers", default=False, action=argparse.BooleanOptionalAction, help="List the developers and their app counts instead")
+	args = parser.parse_args()
+
+	storagePath = STORAGE_FILES[args.storage]
+	if not os.path.isfile(storagePath):
+		print("[-] No scraped apps found at " + storagePath)
+		return
+
+	storage = openStorageFromArgs(args, readOnly=True)
+	try:
+		index = AppIndex(storage)
+		if args.list_categories or args.list_developers:
+			for name, count in (index.categories() if args.list_categories else index.developers()):
+				print("{:>6}  {}".format(count, name))
+			return
+
+		startTime = monotonic()
+		apps = index.query(
+			category=args.category, developer=args.developer,
+			minRating=args.min_rating, maxRating=args.max_rating,
+			minReviews=args.min_reviews, maxReviews=args.max_reviews,
+			free=args.free, sortBy=args.sort, descending=not args.ascending, limit=args.limit
+		)
+		queryTime = monotonic() - startTime - index.loadTime
+		printApps(apps, args.format)
+		if args.format == "table":
+			print("\n[+] {} of {} apps matched in {:.1f} ms (index loaded in {:.0f} ms)".format(len(apps), len(index), queryTime * 1000, index.loadTime * 1000))
+	finally:
+		storage.close()
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,45 @@
+from dataclasses import dataclass, field
+
+@dataclass(frozen=True, slots=True)
+class AppRecord:
+	"""
+    Extracted fields of one scraped app, without the parse trees or options of
+    the ShopifyApp that produced it. Storage keeps these in its write batch and
+    only builds the dict form when the batch is written
+    """
+	url: str
+	title: str = ""
+	imageUrl: str = ""
+	rating: float = None
+	reviewCount: int = None
+	developerName: str = ""
+	developerLink: str = ""
+	dateLaunched: str = ""
+	categories: tuple = ()
+	pricePlans: tuple = ()
+	reviews: dict = field(default_factory=dict)
+	reviewsFile: str = None
+
+	def toDict(self):
+		data = {
+			'url': self.url,
+			'title': self.title,
+			'imageUrl': self.imageUrl,
+			'rating': self.rating,
+			'reviewCount': self.reviewCount,
+			'developerName': self.developerName,
+			'developerLink': self.developerLink,
+			'dateLaunched': self.dateLaunched,
+			'categories': list(self.categories),
+			'pricePlans': list(self.pricePlans),
+			'reviews': self.reviews
+		}
+		if self.reviewsFile is not None:
+			data['reviewsFile'] = self.reviewsFile
+		return data
+
+def toRecordDict(record):
+	return record.toDict() if isinstance(record, AppRecord) else record
+
+def getRecordUrl(record):
+	return record.url if isinstance(record, AppRecord) else record['url']
@@ -0,0 +1,140 @@
+import random
+import json
+import zlib
+import os
+
+# Synthetic stand-ins for apps.shopify.com pages. They follow the markup the scrapers navigate
+# (h1 -> header section, app-reviews-metrics, p.tw-break-words review cards, search links) and
+# carry roughly the same amount of page chrome, so parse timings are comparable to the live site.
+# Recorded pages can be dropped into a directory and loaded with loadRecordedFixture instead.
+
+REVIEWS_PER_PAGE = 10
+REVIEWS_FRAME_ID = "reviews_list"
+WORDS = ("app great support easy setup store sales customers team helpful feature shipping "
+	"orders email marketing fast recommend price works theme product checkout").split()
+
+def pageChrome(body, seed=0):
+	rng = random.Random(seed)
+	navLinks = "".join('<li class="nav-item"><a class="tw-text-body-md" href="/categories/c{0}">Category {0}</a></li>\n'.format(i) for i in range(150))
+	footerLinks = "".join('<li><a class="tw-link" href="/footer/{0}">Footer link {0}</a></li>\n'.format(i) for i in range(80))
+	script = "window.__APP_STATE__ = {};".format(json.dumps({"k{}".format(i): rng.random() for i in range(400)}))
+	return """<!DOCTYPE html>
+<html lang="en">
+<head>
+<meta charset="utf-8">
+<title>Shopify App Store</title>
+<script>{script}</script>
+</head>
+<body>
+<header class="tw-bg-canvas-primary"><nav><ul>
+{navLinks}</ul></nav></header>
+<main>
+{body}
+</main>
+<footer><ul>
+{footerLinks}</ul></footer>
+</body>
+</html>""".format(script=script, navLinks=navLinks, body=body, footerLinks=footerLinks)
+
+def reviewText(rng, words=40):
+	return " ".join(rng.choice(WORDS) for _ in range(words)).capitalize() + "."
+
+def pricingSection(plans):
+	cards = "".join('<div><div class="app-details-pricing-plan-card"><h3>{}</h3><p>Plan details</p></div></div>\n'.format(plan) for plan in plans)
+	return """<section id="adp-pricing">
+<h2>Pricing</h2>
+<div>
+<div class="tw-grid">
+{}</div>
+</div>
+</section>""".format(cards)
+
+def appPage(handle, counts, plans=None):
+	"""
+    App page for `handle` with `counts` mapping star rating (5..1) to review count.
+    `plans` is None for a free app or a list of plan names
+    """
+	ratingBlocks = ""
+	for star in range(5, 0, -1):
+		count = counts.get(star, 0)
+		link = '<a href="/{}/reviews?ratings%5B%5D={}">{}</a>'.format(handle, star, count) if count > 0 else ""
+		ratingBlocks += '<li>\n<span>{} stars</span>\n<div><span>{}</span>{}</div>\n</li>\n'.format(star, count, link)
+
+	totalReviews = sum(counts.values())
+	average = sum(star * count for star, count in counts.items()) / totalReviews if totalReviews > 0 else 0
+	price = "Price: Free" if plans is None else "Price: $9.99/month"
+
+	body = """<div>
+<div><div><img src="https://cdn.shopify.com/app-store/listing_images/{handle}/icon.png"/></div><div><h1>{title}</h1></div></div>
+<div>
+<div>{price}</div>
+<div>
+<div><span>Rating ({average:.1f})</span></div>
+<div><a href="/{handle}/reviews">{totalReviews:,} reviews</a></div>
+<div><a href="/partners/{handle}-dev">{title} Developer</a></div>
+</div>
+</div>
+</div>
+<section><h2>About this app</h2><div>
+<div><p>Launched</p><p>March 1, 2020</p></div>
+<div><p>Categories</p><a href="/categories/marketing">Marketing</a><a href="/categories/sales">Sales</a></div>
+</div></section>
+{pricing}
+<div class="app-reviews-metrics"><ul>
+{ratingBlocks}</ul></div>""".format(
+		handle=handle, title="App " + handle, price=price, average=average, totalReviews=totalReviews,
+		pricing=pricingSection(plans) if plans is not None else "", ratingBlocks=ratingBlocks
+	)
+	return pageChrome(body, seed=zlib.crc32(handle.encode('utf8')))
+
+def reviewCard(rng, index):
+	return """<div class="review-listing" data-review-id="{index}">
+<div class="tw-flex"><div>Merchant {index}</div><div>United States</div><div>January 1, 2024</div></div>
+<div><div><div class="tw-text-body-md"><p class="tw-break-words">{first}</p><p class="tw-break-words">{second}</p></div></div></div>
+</div>
+""".format(index=index, first=reviewText(rng), second=reviewText(rng, 20))
+
+def reviewPage(handle, star, page, count, fragment=False):
+	"""
+    Page `page` of the `star` bucket, reviews numbered newest first. Pages past `count` are empty.
+    The reviews sit in a turbo-frame, `fragment` returns just that frame like the site does for Turbo-Frame requests
+    """
+	rng = random.Random("{}-{}-{}".format(handle, star, page))
+	start = (page - 1) * REVIEWS_PER_PAGE
+	cards = "".join(reviewCard(rng, count - 1 - index) for index in range(start, min(count, start + REVIEWS_PER_PAGE)))
+	frame = '<turbo-frame id="{}">\n<div id="reviews">\n{}</div>\n</turbo-frame>'.format(REVIEWS_FRAME_ID, cards)
+	if fragment: return frame
+	return pageChrome(frame, seed=page)
+
+def searchPage(query, page, resultsPerPage=24, lastPage=3):
+	numberOfResults = resultsPerPage if page < lastPage else resultsPerPage // 3
+	slug = "-".join(query.split())
+	links = "".join('<div class="app-card"><a href="https://apps.shopify.com/{}-{}-{}?search_id=abc&surface_type=search">App</a></div>\n'.format(slug, page, index) for index in range(numberOfResults))
+	return '<turbo-frame id="search_page">\n{}</turbo-frame>'.format(links)
+
+def searchVocabulary(size=500, seed=0):
+	"""
+    Sorted, distinct search terms of one to three words the autocomplete fixture completes from
+    """
+	rng = random.Random(seed)
+	terms = set()
+	while len(terms) < min(size, len(WORDS) ** 3):
+		terms.add(" ".join(rng.choice(WORDS) for _ in range(rng.randint(1, 3))))
+	return sorted(terms)
+
+def autocompleteResponse(query, numberOfSearches=10, vocabulary=None):
+	"""
+    Autocomplete JSON for `query`. With a `vocabulary` it returns the first terms starting with
+    the query, so longer prefixes stop saturating like on the site; without one it is always full
+    """
+	if vocabulary is None:
+		names = ["{} {}".format(query, WORDS[index % len(WORDS)]) for index in range(numberOfSearches)]
+	else:
+		names = [term for term in vocabulary if term.startswith(query.lower())][:numberOfSearches]
+	return json.dumps({"searches": [{"name": name} for name in names]})
+
+def loadRecordedFixture(directory, name):
+	path = os.path.join(directory, name)
+	if not os.path.isfile(path): return None
+	with open(path, 'rb') as file:
+		return file.read()
@@ -0,0 +1,58 @@
+from timeit import Timer
+import argparse
+import sys
+import os
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from shopify import ShopifyApp, parseReviewPage, PARSERS
+from fixtures import appPage, reviewPage, loadRecordedFixture
+
+parser = argparse.ArgumentParser(description='Per-page parse time of each HTML parser backend')
+parser.add_argument("-n", "--iterations", type=int, default=50, help="Parses per measurement")
+parser.add_argument("-f", "--fixtures-dir", default=None, help="Directory with recorded app_page.html and review_page.html to use instead of the synthetic pages")
+
+def measure(function, iterations):
+	# best of 3 runs, in milliseconds per call
+	return min(Timer(function).repeat(repeat=3, number=iterations)) / iterations * 1000
+
+def parseAppPage(html, backend):
+	app = ShopifyApp("https://apps.shopify.com/benchmark", parser=backend, html=html, deferReviews=True)
+	if len(app.errors) > 0:
+		raise RuntimeError("{} failed to parse the app page: {}".format(backend, app.errors))
+	return app.getData(), app.reviewBuckets
+
+def main():
+	args = parser.parse_args()
+
+	appHtml = reviewHtml = None
+	if args.fixtures_dir is not None:
+		appHtml = loadRecordedFixture(args.fixtures_dir, "app_page.html")
+		reviewHtml = loadRecordedFixture(args.fixtures_dir, "review_page.html")
+	if appHtml is None: appHtml = appPage("benchmark", {5: 900, 4: 80, 3: 20, 2: 10, 1: 40}).encode('utf8')
+	if reviewHtml is None: reviewHtml = reviewPage("benchmark", 5, 1, 900).encode('utf8')
+
+	backends = PARSERS
+	print("app page {:.0f} KB, review page {:.0f} KB, {} iterations\n".format(len(appHtml) / 1024, len(reviewHtml) / 1024, args.iterations))
+	print("{:<12} {:>16} {:>19}".format("backend", "app page (ms)", "review page (ms)"))
+
+	results = {}
+	for backend in backends:
+		results[backend] = (
+			measure(lambda: parseAppPage(appHtml, backend), args.iterations),
+			measure(lambda: parseReviewPage(reviewHtml, backend), args.iterations)
+		)
+		print("{:<12} {:>16.2f} {:>19.2f}".format(backend, *results[backend]))
+
+	if "lxml" in results:
+		baseline, fast = results["html.parser"], results["lxml"]
+		print("\nlxml speedup: {:.1f}x app page, {:.1f}x review page".format(baseline[0] / fast[0], baseline[1] / fast[1]))
+		# lxml is only safe to opt into when it extracts exactly what html.parser does from the same page
+		for page, extract, html in [("app page", parseAppPage, appHtml), ("review page", parseReviewPage, reviewHtml)]:
+			same = extract(html, "html.parser") == extract(html, "lxml")
+			print("[{}] {} {}".format("+" if same else "-", page, "extracted identically by both backends" if same else "extracted differently by lxml"))
+	else:
+		print("\nlxml is not installed, only html.parser was measured")
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,159 @@
+from time import monotonic
+import subprocess
+import tempfile
+import argparse
+import shutil
+import shlex
+import json
+import sys
+import os
+
+from fixtures import searchVocabulary
+from stand_in_server import addServerArguments, configFromArgs, startServer
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# every run goes as fast as the stand-in answers and starts without a response cache
+UNTHROTTLED_ARGS = ["-rps", "0", "--no-adaptive", "--no-cache"]
+
+parser = argparse.ArgumentParser(description='End-to-end scraper throughput against the local stand-in server')
+addServerArguments(parser)
+parser.add_argument("-b", "--benchmarks", nargs="+", default=["app", "market", "autocomplete"], choices=["app", "market", "autocomplete"], help="Scrapers to run")
+parser.add_argument("-a", "--apps", type=int, default=50, help="Number of apps the app scraper scrapes")
+parser.add_argument("-st", "--search-terms", type=int, default=100, help="Number of terms the market scraper searches")
+parser.add_argument("--max-depth", type=int, default=3, help="Longest prefix the autocompleter expands to")
+parser.add_argument("--app-args", default="", help="Extra arguments for shopify_app_scraper.py, e.g. \"-c 8 -p html.parser\"")
+parser.add_argument("--market-args", default="", help="Extra arguments for shopify_market_scraper.py")
+parser.add_argument("--autocomplete-args", default="", help="Extra arguments for shopify_market_autocompleter.py")
+parser.add_argument("-o", "--output", default=None, help="Write the results as JSON to this file, to compare runs")
+parser.add_argument("-k", "--keep", default=False, action=argparse.BooleanOptionalAction, help="Keep the working directories of the runs")
+
+def writeLines(path, lines):
+	os.makedirs(os.path.dirname(path), exist_ok=True)
+	with open(path, 'w', encoding='utf8') as file:
+		for line in lines:
+			file.write(line + "\n")
+
+def runScript(script, scriptArgs, workDir, baseUrl):
+	"""
+    Runs `script` in `workDir` against the stand-in and returns its wall time, peak RSS in MB,
+    exit status and metrics snapshot
+    """
+	metricsFile = os.path.join(workDir, "metrics.json")
+	command = [sys.executable, os.path.join(REPO_DIR, script)] + UNTHROTTLED_ARGS + ["--metrics-file", metricsFile, "--metrics-interval", "3600"] + scriptArgs
+	environment = dict(os.environ, SHOPIFY_BASE_URL=baseUrl)
+
+	with open(os.path.join(workDir, "stdout.log"), 'w') as outputFile:
+		startTime = monotonic()
+		process = subprocess.Popen(command, cwd=workDir, env=environment, stdout=outputFile, stderr=subprocess.STDOUT)
+		# wait4 reports the resource usage of this child alone, unlike getrusage(RUSAGE_CHILDREN)
+		_, status, usage = os.wait4(process.pid, 0)
+		process.returncode = os.waitstatus_to_exitcode(status)
+		wallTime = monotonic() - startTime
+
+	snapshot = None
+	if os.path.isfile(metricsFile):
+		with open(metricsFile, 'r') as file:
+			snapshot = json.load(file)
+	# ru_maxrss is in kilobytes on Linux and in bytes on macOS
+	peakRss = usage.ru_maxrss / (1024 * 1024 if sys.platform == "darwin" else 1024)
+	return wallTime, peakRss, process.returncode, snapshot
+
+def getCounter(snapshot, name, **labels):
+	series = snapshot['counters'].get(name, [])
+	return sum(entry['value'] for entry in series if all(str(entry['labels'].get(key)) == str(value) for key, value in labels.items()))
+
+def getStage(snapshot, *stages):
+	"""
+    Number of calls and total seconds of `stages` in the stage_seconds histogram
+    """
+	count, total = 0, 0.0
+	for entry in snapshot['histograms'].get("stage_seconds", []):
+		if entry['labels'].get("stage") in stages:
+			count += entry['count']
+			total += entry['sum']
+	return count, total
+
+def summarize(name, wallTime, peakRss, returnCode, snapshot, unit, unitCounter, parseStages):
+	result = {'benchmark': name, 'wallTime': wallTime, 'peakRssMb': peakRss, 'returnCode': returnCode}
+	if snapshot is None: return result
+
+	numberOfUnits = getCounter(snapshot, unitCounter)
+	numberOfPages, parseTime = getStage(snapshot, *parseStages)
+	numberOfReviews = getCounter(snapshot, "reviews_total")
+	result.update({
+		'unit': unit,
+		'units': numberOfUnits,
+		'unitsPerSecond': numberOfUnits / wallTime,
+		'reviews': numberOfReviews,
+		'reviewsPerSecond': numberOfReviews / wallTime,
+		'pagesParsed': numberOfPages,
+		# None when the pages were parsed in worker processes, whose timings don't reach the metrics file
+		'parseMsPerPage': parseTime / numberOfPages * 1000 if numberOfPages > 0 else None,
+		'requests': getCounter(snapshot, "http_requests_total"),
+		'throttled': getCounter(snapshot, "http_requests_total", status=429)
+	})
+	return result
+
+def benchmarkAppScraper(args, workDir, baseUrl):
+	writeLines(os.path.join(workDir, "output", "shopify_app_links.txt"), ("https://apps.shopify.com/bench-app-{}".format(index) for index in range(args.apps)))
+	run = runScript("shopify_app_scraper.py", ["-t", "0"] + shlex.split(args.app_args), workDir, baseUrl)
+	return summarize("app", *run, "apps", "apps_total", ("parseAppPage", "parseReviewPage"))
+
+def benchmarkMarketScraper(args, workDir, baseUrl):
+	writeLines(os.path.join(workDir, "output", "shopify_search_terms.txt"), searchVocabulary(args.search_terms, seed=1))
+	run = runScript("shopify_market_scraper.py", shlex.split(args.market_args), workDir, baseUrl)
+	return summarize("market", *run, "terms", "search_terms_total", ("parseSearchPage",))
+
+def benchmarkAutocompleter(args, workDir, baseUrl):
+	run = runScript("shopify_market_autocompleter.py", ["--max-depth", str(args.max_depth)] + shlex.split(args.autocomplete_args), workDir, baseUrl)
+	return summarize("autocomplete", *run, "prefixes", "prefixes_total", ("parseAutocomplete",))
+
+BENCHMARKS = {
+	'app': benchmarkAppScraper,
+	'market': benchmarkMarketScraper,
+	'autocomplete': benchmarkAutocompleter
+}
+
+def formatOptional(value, pattern):
+	return pattern.format(value) if value is not None else "n/a"
+
+def printResults(results):
+	print("\n{:<13} {:>8} {:>14} {:>11} {:>15} {:>13} {:>9} {:>6}".format("benchmark", "wall (s)", "units/s", "reviews/s", "parse ms/page", "peak RSS (MB)", "requests", "429s"))
+	for result in results:
+		if 'unit' not in result:
+			print("{:<13} {:>8.2f}  failed with exit code {}, no metrics written".format(result['benchmark'], result['wallTime'], result['returnCode']))
+			continue
+		print("{:<13} {:>8.2f} {:>14} {:>11.1f} {:>15} {:>13.1f} {:>9} {:>6}".format(
+			result['benchmark'], result['wallTime'], "{:.1f} {}".format(result['unitsPerSecond'], result['unit']),
+			result['reviewsPerSecond'], formatOptional(result['parseMsPerPage'], "{:.2f}"),
+			result['peakRssMb'], result['requests'], result['throttled']
+		))
+		if result['returnCode'] != 0: print("{:<13} exited with code {}".format("", result['returnCode']))
+
+def main():
+	args = parser.parse_args()
+	config = configFromArgs(args)
+	server = startServer(config)
+	baseUrl = "http://127.0.0.1:{}".format(server.server_port)
+	print("Stand-in server on {} ({:.0f} ms latency, {:.0%} 429s, {:.0%} malformed pages)".format(baseUrl, args.latency, args.error_rate, args.malformed_rate))
+
+	results = []
+	try:
+		for name in args.benchmarks:
+			workDir = tempfile.mkdtemp(prefix="shopify_benchmark_{}_".format(name))
+			print("[+] Running the {} benchmark in {}".format(name, workDir))
+			try:
+				results.append(BENCHMARKS[name](args, workDir, baseUrl))
+			finally:
+				if not args.keep: shutil.rmtree(workDir, ignore_errors=True)
+	finally:
+		server.shutdown()
+
+	printResults(results)
+	print("\n{} requests served, {} 429s and {} malformed pages injected".format(config.requests, config.injectedErrors, config.injectedMalformed))
+	if args.output is not None:
+		with open(args.output, 'w') as file:
+			json.dump({'server': vars(args), 'results': results}, file, indent=2)
+
+if __name__ == "__main__":
+	main()
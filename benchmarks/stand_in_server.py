@@ -0,0 +1,198 @@
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs
+from time import sleep
+import threading
+import argparse
+import random
+import gzip
+import zlib
+
+from fixtures import REVIEWS_FRAME_ID, appPage, reviewPage, searchPage, searchVocabulary, autocompleteResponse, loadRecordedFixture
+
+# Local stand-in for apps.shopify.com serving the fixture pages, so scraper throughput can be
+# measured offline. Point the scrapers at it with SHOPIFY_BASE_URL=http://127.0.0.1:<port>.
+
+def getReviewCounts(handle, maxReviews):
+	"""
+    Review count per star rating of `handle`, fixed per handle and skewed towards 5 stars like real apps
+    """
+	rng = random.Random(zlib.crc32(handle.encode('utf8')))
+	total = rng.randint(0, maxReviews)
+	shares = {5: 0.75, 4: 0.1, 3: 0.04, 2: 0.03, 1: 0.08}
+	return {star: int(total * share) for star, share in shares.items()}
+
+def getLastSearchPage(query, maxPage):
+	return 1 + zlib.crc32(query.encode('utf8')) % maxPage
+
+class StandInConfig:
+	"""
+    What the stand-in serves and how badly it behaves
+    @params:
+        latency         - Optional  : mean seconds added to every response, drawn uniformly from 0 to twice this (Float)
+        errorRate       - Optional  : fraction of requests answered with a 429 (Float)
+        retryAfter      - Optional  : Retry-After seconds sent with the 429s (Float)
+        malformedRate   - Optional  : fraction of pages cut off at a random point (Float)
+        maxReviews      - Optional  : largest review count of an app (Int)
+        maxSearchPages  - Optional  : most result pages of a search term (Int)
+        vocabulary      - Optional  : terms the autocomplete endpoint completes from (List)
+        fixturesDir     - Optional  : directory with recorded app_page.html, review_page.html, search_page.html or autocomplete.json served instead of the synthetic pages (Str)
+        seed            - Optional  : seed of the injected latency, errors and malformed pages (Int)
+    """
+	def __init__(self, latency=0.0, errorRate=0.0, retryAfter=0, malformedRate=0.0, maxReviews=200, maxSearchPages=3, vocabulary=None, fixturesDir=None, seed=0):
+		self.latency = latency
+		self.errorRate = errorRate
+		self.retryAfter = retryAfter
+		self.malformedRate = malformedRate
+		self.maxReviews = maxReviews
+		self.maxSearchPages = maxSearchPages
+		self.vocabulary = vocabulary if vocabulary is not None else searchVocabulary()
+		self.recorded = {}
+		if fixturesDir is not None:
+			for name in ("app_page.html", "review_page.html", "search_page.html", "autocomplete.json"):
+				self.recorded[name] = loadRecordedFixture(fixturesDir, name)
+		self.rng = random.Random(seed)
+		self.lock = threading.Lock()
+		self.requests = 0
+		self.injectedErrors = 0
+		self.injectedMalformed = 0
+
+	def draw(self):
+		with self.lock:
+			self.requests += 1
+			return self.rng.random(), self.rng.random(), self.rng.random()
+
+	def getRecorded(self, name):
+		return self.recorded.get(name)
+
+class StandInHandler(BaseHTTPRequestHandler):
+	protocol_version = "HTTP/1.1"
+	# headers and body go out in separate writes, with Nagle on every keep-alive response waits on a delayed ACK
+	disable_nagle_algorithm = True
+	config = None
+
+	def log_message(self, format, *args):
+		pass
+
+	def do_GET(self):
+		config = self.config
+		latencyDraw, errorDraw, malformedDraw = config.draw()
+		if config.latency > 0: sleep(latencyDraw * 2 * config.latency)
+
+		if errorDraw < config.errorRate:
+			with config.lock: config.injectedErrors += 1
+			self.sendBody(429, b"Too Many Requests", "text/plain", {"Retry-After": str(config.retryAfter)})
+			return
+
+		try:
+			body, contentType = self.route()
+		except (KeyError, ValueError):
+			self.sendBody(400, b"Bad Request", "text/plain")
+			return
+		if body is None:
+			self.sendBody(404, b"Not Found", "text/plain")
+			return
+
+		if malformedDraw < config.malformedRate:
+			with config.lock: config.injectedMalformed += 1
+			body = body[:int(len(body) * malformedDraw / config.malformedRate)]
+		self.sendBody(200, body, contentType)
+
+	def route(self):
+		config = self.config
+		url = urlsplit(self.path)
+		query = parse_qs(url.query)
+		parts = [part for part in url.path.split("/") if part]
+
+		if parts == ["search", "autocomplete"]:
+			recorded = config.getRecorded("autocomplete.json")
+			if recorded is not None: return recorded, "application/json"
+			return autocompleteResponse(query["q"][0], vocabulary=config.vocabulary).encode('utf8'), "application/json"
+
+		if parts == ["search"]:
+			recorded = config.getRecorded("search_page.html")
+			if recorded is not None: return recorded, "text/html"
+			searchQuery = query["q"][0]
+			page = int(query.get("page", ["1"])[0])
+			return searchPage(searchQuery, page, lastPage=getLastSearchPage(searchQuery, config.maxSearchPages)).encode('utf8'), "text/html"
+
+		if len(parts) == 2 and parts[1] == "reviews":
+			recorded = config.getRecorded("review_page.html")
+			if recorded is not None: return recorded, "text/html"
+			handle = parts[0]
+			star = int(query["ratings[]"][0])
+			page = int(query.get("page", ["1"])[0])
+			fragment = self.headers.get("Turbo-Frame") == REVIEWS_FRAME_ID
+			return reviewPage(handle, star, page, getReviewCounts(handle, config.maxReviews)[star], fragment).encode('utf8'), "text/html"
+
+		if len(parts) == 1:
+			recorded = config.getRecorded("app_page.html")
+			if recorded is not None: return recorded, "text/html"
+			handle = parts[0]
+			plans = ["Basic", "Pro"] if zlib.crc32(handle.encode('utf8')) % 2 == 0 else None
+			return appPage(handle, getReviewCounts(handle, config.maxReviews), plans).encode('utf8'), "text/html"
+
+		return None, None
+
+	def sendBody(self, status, body, contentType, extraHeaders=None):
+		headers = dict(extraHeaders or {})
+		if "gzip" in self.headers.get("Accept-Encoding", ""):
+			body = gzip.compress(body, compresslevel=5)
+			headers["Content-Encoding"] = "gzip"
+		self.send_response(status)
+		self.send_header("Content-Type", contentType + "; charset=utf-8")
+		self.send_header("Content-Length", str(len(body)))
+		for name, value in headers.items():
+			self.send_header(name, value)
+		self.end_headers()
+		self.wfile.write(body)
+
+def startServer(config, host="127.0.0.1", port=0):
+	"""
+    Serves `config` from a background thread and returns the server, port 0 picks a free port
+    """
+	handler = type("ConfiguredStandInHandler", (StandInHandler,), {'config': config})
+	server = ThreadingHTTPServer((host, port), handler)
+	server.daemon_threads = True
+	threading.Thread(target=server.serve_forever, daemon=True).start()
+	return server
+
+def addServerArguments(parser):
+	parser.add_argument("--latency", type=float, default=0.0, help="Mean milliseconds added to every response")
+	parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests answered with a 429")
+	parser.add_argument("--retry-after", type=float, default=0, help="Retry-After seconds sent with the injected 429s")
+	parser.add_argument("--malformed-rate", type=float, default=0.0, help="Fraction of pages cut off at a random point")
+	parser.add_argument("--max-reviews", type=int, default=200, help="Largest review count of an app")
+	parser.add_argument("--max-search-pages", type=int, default=3, help="Most result pages of a search term")
+	parser.add_argument("--vocabulary-size", type=int, default=500, help="Number of terms the autocomplete endpoint completes from")
+	parser.add_argument("-f", "--fixtures-dir", default=None, help="Directory with recorded app_page.html, review_page.html, search_page.html or autocomplete.json to serve instead of the synthetic pages")
+	parser.add_argument("--seed", type=int, default=0, help="Seed of the injected latency, errors and malformed pages")
+
+def configFromArgs(args):
+	return StandInConfig(
+		latency=args.latency / 1000,
+		errorRate=args.error_rate,
+		retryAfter=args.retry_after,
+		malformedRate=args.malformed_rate,
+		maxReviews=args.max_reviews,
+		maxSearchPages=args.max_search_pages,
+		vocabulary=searchVocabulary(args.vocabulary_size),
+		fixturesDir=args.fixtures_dir,
+		seed=args.seed
+	)
+
+def main():
+	parser = argparse.ArgumentParser(description='Local stand-in for apps.shopify.com serving fixture pages')
+	parser.add_argument("--host", default="127.0.0.1", help="Interface to listen on")
+	parser.add_argument("--port", type=int, default=8765, help="Port to listen on")
+	addServerArguments(parser)
+	args = parser.parse_args()
+
+	server = startServer(configFromArgs(args), args.host, args.port)
+	print("Serving on http://{}:{} (run the scrapers with SHOPIFY_BASE_URL=http://{}:{})".format(args.host, server.server_port, args.host, server.server_port))
+	try:
+		threading.Event().wait()
+	except KeyboardInterrupt:
+		server.shutdown()
+
+if __name__ == "__main__":
+	main()
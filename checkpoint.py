@@ -0,0 +1,114 @@
+from itertools import islice
+from time import time
+import configparser
+import threading
+import sqlite3
+import os
+
+class CheckpointStore:
+	"""
+    Per-item completion state in a small SQLite file. Marks are buffered and
+    committed `batchSize` at a time, and resuming skips exactly the items
+    marked done, in whatever order they finished
+    @params:
+        path        - Required  : checkpoint database file (Str)
+        batchSize   - Optional  : marks buffered before a commit, None only commits on flush() (Int)
+    """
+	def __init__(self, path, batchSize=50):
+		self.path = path
+		self.batchSize = max(1, batchSize) if batchSize is not None else None
+		self.pending = {}
+		self.lock = threading.Lock()
+		self.connection = sqlite3.connect(path, check_same_thread=False)
+		self.connection.execute("PRAGMA journal_mode=WAL")
+		self.connection.execute("""
+			CREATE TABLE IF NOT EXISTS items (
+				key TEXT PRIMARY KEY,
+				state TEXT NOT NULL,
+				updatedAt REAL NOT NULL
+			)
+		""")
+		self.connection.commit()
+
+	def mark(self, key, state="done"):
+		"""
+        Buffers a state change and returns True when this call committed the batch
+        """
+		with self.lock:
+			self.pending[key] = (state, time())
+			if self.batchSize is None or len(self.pending) < self.batchSize: return False
+			self.commitPending()
+			return True
+
+	def markDone(self, key):
+		return self.mark(key, "done")
+
+	def commitPending(self):
+		rows = [(key, state, updatedAt) for key, (state, updatedAt) in self.pending.items()]
+		with self.connection:
+			self.connection.executemany("""
+				INSERT INTO items (key, state, updatedAt) VALUES (?, ?, ?)
+				ON CONFLICT(key) DO UPDATE SET state = excluded.state, updatedAt = excluded.updatedAt
+			""", rows)
+		self.pending = {}
+
+	def flush(self):
+		with self.lock:
+			if len(self.pending) > 0:
+				self.commitPending()
+
+	def keysInState(self, state):
+		with self.lock:
+			keys = {row[0] for row in self.connection.execute("SELECT key FROM items WHERE state = ?", (state,))}
+			keys.update(key for key, (pendingState, _) in self.pending.items() if pendingState == state)
+			keys.difference_update(key for key, (pendingState, _) in self.pending.items() if pendingState != state)
+			return keys
+
+	def states(self):
+		with self.lock:
+			states = dict(self.connection.execute("SELECT key, state FROM items"))
+			states.update((key, state) for key, (state, _) in self.pending.items())
+			return states
+
+	def isDone(self, key):
+		with self.lock:
+			if key in self.pending: return self.pending[key][0] == "done"
+			row = self.connection.execute("SELECT state FROM items WHERE key = ?", (key,)).fetchone()
+			return row is not None and row[0] == "done"
+
+	def remaining(self, keys):
+		"""
+        `keys` without the ones already done, in their original order and without repeats
+        """
+		done = self.keysInState("done")
+		return [key for key in dict.fromkeys(keys) if key not in done]
+
+	def isEmpty(self):
+		with self.lock:
+			return len(self.pending) == 0 and self.connection.execute("SELECT 1 FROM items LIMIT 1").fetchone() is None
+
+	def reset(self):
+		with self.lock:
+			self.pending = {}
+			with self.connection:
+				self.connection.execute("DELETE FROM items")
+
+	def close(self):
+		self.flush()
+		self.connection.close()
+
+def migrateLastIndexFile(configFile, checkpoint, keys):
+	"""
+    Marks the first LastIndex `keys` done from a legacy INI checkpoint, then removes the INI file
+    """
+	if not os.path.isfile(configFile): return 0
+
+	config = configparser.ConfigParser()
+	config.read(configFile)
+	lastIndex = int(config.get("DEFAULT", "lastIndex", fallback="0"))
+	if checkpoint.isEmpty():
+		for key in islice(keys, lastIndex):
+			checkpoint.markDone(key)
+		checkpoint.flush()
+	os.remove(configFile)
+	return lastIndex
@@ -0,0 +1,167 @@
+from storage import OUTPUT_DIR, STORAGE_FILES, addStorageArguments, openStorageFromArgs
+from review_stream import readReviews
+from time import monotonic
+import argparse
+import os
+
+try:
+	import pyarrow
+	import pyarrow.ipc
+	import pyarrow.parquet
+except ImportError:
+	pyarrow = None
+
+EXPORT_DIR = os.path.join(OUTPUT_DIR, "export")
+FILE_EXTENSIONS = {'parquet': ".parquet", 'arrow': ".arrow"}
+# Arrow IPC files only support these two buffer codecs
+IPC_COMPRESSIONS = ["zstd", "lz4"]
+
+def getAppsSchema():
+	return pyarrow.schema([
+		("url", pyarrow.string()),
+		("title", pyarrow.string()),
+		("imageUrl", pyarrow.string()),
+		("rating", pyarrow.float64()),
+		("reviewCount", pyarrow.int64()),
+		("developerName", pyarrow.string()),
+		("developerLink", pyarrow.string()),
+		("dateLaunched", pyarrow.string()),
+		("categories", pyarrow.list_(pyarrow.string())),
+		("pricePlans", pyarrow.list_(pyarrow.string()))
+	])
+
+def getReviewsSchema():
+	return pyarrow.schema([
+		("appUrl", pyarrow.string()),
+		("star", pyarrow.int8()),
+		("position", pyarrow.int32()),
+		("text", pyarrow.string())
+	])
+
+def starFromKey(key):
+	# buckets are keyed "5-star" .. "1-star"
+	return int(key.split("-")[0])
+
+def iterRecordReviews(record):
+	"""
+    Yields (star, position, text) of every review of a stored app, position 0 being the newest of its bucket
+    """
+	reviewsFile = record.get('reviewsFile')
+	if reviewsFile is not None and os.path.isfile(reviewsFile):
+		for review in readReviews(reviewsFile):
+			yield starFromKey(review['star']), review['position'], review['text']
+		return
+
+	for key, bucket in (record.get('reviews') or {}).items():
+		for position, text in enumerate(bucket.get('content') or []):
+			yield starFromKey(key), position, text
+
+class ColumnarTableWriter:
+	"""
+    Streams rows into a Parquet or Arrow IPC file a batch at a time, so only
+    `batchSize` rows are ever held in memory. The file is written under a
+    temporary name and moved into place on close
+    @params:
+        path        - Required  : output file (Str)
+        schema      - Required  : table schema (pyarrow.Schema)
+        fileFormat  - Optional  : "parquet" or "arrow" (Str)
+        compression - Optional  : codec, e.g. zstd, snappy, lz4 (Str)
+        batchSize   - Optional  : rows per row group / record batch (Int)
+    """
+	def __init__(self, path, schema, fileFormat="parquet", compression="zstd", batchSize=50000):
+		self.path = path
+		self.tmpPath = path + ".tmp"
+		self.schema = schema
+		self.batchSize = max(1, batchSize)
+		self.columns = {name: [] for name in schema.names}
+		self.numberOfRows = 0
+		self.numberOfPendingRows = 0
+
+		if fileFormat == "parquet":
+			self.writer = pyarrow.parquet.ParquetWriter(self.tmpPath, schema, compression=compression)
+		else:
+			options = pyarrow.ipc.IpcWriteOptions(compression=compression)
+			self.writer = pyarrow.ipc.new_file(self.tmpPath, schema, options=options)
+
+	def append(self, *values):
+		for column, value in zip(self.columns.values(), values):
+			column.append(value)
+		self.numberOfPendingRows += 1
+		if self.numberOfPendingRows >= self.batchSize: self.writeBatch()
+
+	def writeBatch(self):
+		if self.numberOfPendingRows == 0: return
+		batch = pyarrow.RecordBatch.from_pydict(self.columns, schema=self.schema)
+		self.writer.write_batch(batch)
+		self.numberOfRows += self.numberOfPendingRows
+		self.numberOfPendingRows = 0
+		for column in self.columns.values():
+			column.clear()
+
+	def close(self, commit=True):
+		if commit: self.writeBatch()
+		self.writer.close()
+		if commit:
+			os.replace(self.tmpPath, self.path)
+		else:
+			os.remove(self.tmpPath)
+
+def exportStorage(storage, directory, fileFormat="parquet", compression="zstd", batchSize=50000):
+	"""
+    Writes an apps table and a reviews table (one row per review) from `storage`
+    into `directory` and returns their paths and row counts
+    """
+	if not os.path.exists(directory): os.makedirs(directory)
+	extension = FILE_EXTENSIONS[fileFormat]
+	apps = ColumnarTableWriter(os.path.join(directory, "apps" + extension), getAppsSchema(), fileFormat, compression, batchSize)
+	reviews = ColumnarTableWriter(os.path.join(directory, "reviews" + extension), getReviewsSchema(), fileFormat, compression, batchSize)
+
+	committed = False
+	try:
+		for record in storage.records():
+			apps.append(
+				record['url'], record.get('title'), record.get('imageUrl'), record.get('rating'), record.get('reviewCount'),
+				record.get('developerName'), record.get('developerLink'), record.get('dateLaunched'),
+				list(record.get('categories') or []), list(record.get('pricePlans') or [])
+			)
+			for star, position, text in iterRecordReviews(record):
+				reviews.append(record['url'], star, position, text)
+		committed = True
+	finally:
+		apps.close(commit=committed)
+		reviews.close(commit=committed)
+
+	return {apps.path: apps.numberOfRows, reviews.path: reviews.numberOfRows}
+
+def main():
+	parser = argparse.ArgumentParser(description='Export scraped apps and their reviews as compressed columnar tables')
+	addStorageArguments(parser, writing=False)
+	parser.add_argument("-o", "--output-dir", default=EXPORT_DIR, help="Directory the apps and reviews tables are written to")
+	parser.add_argument("-f", "--format", default="parquet", choices=list(FILE_EXTENSIONS), help="Parquet, or Arrow IPC for memory-mapped reads")
+	parser.add_argument("--compression", default="zstd", help="Compression codec (zstd, snappy, gzip, brotli or lz4 for Parquet; zstd or lz4 for Arrow)")
+	parser.add_argument("-b", "--batch-size", type=int, default=50000, help="Rows buffered per row group / record batch")
+	args = parser.parse_args()
+
+	if pyarrow is None:
+		parser.error("the columnar export needs pyarrow (pip install pyarrow)")
+	if args.format == "arrow" and args.compression not in IPC_COMPRESSIONS:
+		parser.error("Arrow IPC files support {} compression".format(" or ".join(IPC_COMPRESSIONS)))
+
+	storagePath = STORAGE_FILES[args.storage]
+	if not os.path.isfile(storagePath):
+		print("[-] No scraped apps found at " + storagePath)
+		return
+
+	startTime = monotonic()
+	storage = openStorageFromArgs(args, readOnly=True)
+	try:
+		tables = exportStorage(storage, args.output_dir, args.format, args.compression, args.batch_size)
+	finally:
+		storage.close()
+
+	for path, numberOfRows in tables.items():
+		print("[+] {:,} rows written to {} ({:.1f} MB)".format(numberOfRows, path, os.path.getsize(path) / 1e6))
+	print("[+] Exported in {:.1f}s".format(monotonic() - startTime))
+
+if __name__ == "__main__":
+	main()
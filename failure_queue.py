@@ -0,0 +1,173 @@
+from shopify import PAGE_SECTION, DETAILS_SECTION, REVIEWS_SECTION
+from app_record import AppRecord
+from dataclasses import dataclass
+from time import time
+import threading
+import sqlite3
+import random
+import json
+
+# record fields filled from the app page, besides the url
+DETAIL_FIELDS = ["title", "imageUrl", "rating", "reviewCount", "developerName", "developerLink", "dateLaunched", "categories", "pricePlans"]
+
+@dataclass(frozen=True)
+class FailedApp:
+	url: str
+	sections: tuple
+	reviewBuckets: list = None
+	attempts: int = 0
+
+	@property
+	def needsAppPage(self):
+		# reviews alone can be retried from the buckets read off the app page, everything else has to fetch it again
+		return self.sections != (REVIEWS_SECTION,) or self.reviewBuckets is None
+
+	@property
+	def retriedSections(self):
+		return (DETAILS_SECTION, REVIEWS_SECTION) if PAGE_SECTION in self.sections else self.sections
+
+	def getAppOptions(self):
+		"""
+        ShopifyApp keyword arguments that scrape only the failed sections
+        """
+		if not self.needsAppPage:
+			return {'reviewBuckets': self.reviewBuckets}
+		if REVIEWS_SECTION not in self.retriedSections:
+			return {'omitReviews': True}
+		return {}
+
+def getFailedSections(app):
+	"""
+    Sections of `app` that failed, in scrape order. A failed app page makes every other section moot
+    """
+	if PAGE_SECTION in app.failedSections: return (PAGE_SECTION,)
+	return tuple(section for section in (DETAILS_SECTION, REVIEWS_SECTION) if section in app.failedSections)
+
+def mergeSections(record, app, sections):
+	"""
+    Stored record of `app` with the sections it just scraped successfully merged in
+    @params:
+        record      - Required  : stored record, None when the app was never stored (Dict)
+        app         - Required  : retried app (ShopifyApp)
+        sections    - Required  : sections the retry scraped (Tuple)
+    """
+	data = dict(record) if record is not None else AppRecord(app.url).toDict()
+	scraped = app.getData()
+	succeeded = [section for section in sections if section not in app.failedSections and PAGE_SECTION not in app.failedSections]
+
+	if DETAILS_SECTION in succeeded:
+		for field in DETAIL_FIELDS:
+			data[field] = scraped[field]
+	if REVIEWS_SECTION in succeeded:
+		data['reviews'] = scraped['reviews']
+		data.pop('reviewsFile', None)
+		if 'reviewsFile' in scraped: data['reviewsFile'] = scraped['reviewsFile']
+	return data
+
+def getRecordToStore(storage, app):
+	"""
+    Record to write for a finished scrape of `app`: the whole app when nothing
+    failed, otherwise only the sections that succeeded merged into its stored
+    record, so a failed re-scrape never empties an app that was stored before
+    """
+	if len(app.failedSections) == 0: return app.toRecord()
+	return mergeSections(storage.get(app.url), app, (DETAILS_SECTION, REVIEWS_SECTION))
+
+class FailureQueue:
+	"""
+    Apps whose last scrape had errors, with the sections that failed, so a retry
+    re-runs only those: reviews are fetched again from the review buckets read
+    off the app page, without fetching the app page itself. Each failed attempt
+    doubles the app's wait before the next one, with jitter so apps failed by
+    the same rate-limit storm don't all come back at once
+    @params:
+        path        - Required  : failure queue database file (Str)
+        maxAttempts - Optional  : failed attempts after which an app is given up on (Int)
+        baseDelay   - Optional  : seconds before the first retry (Float)
+        maxDelay    - Optional  : longest wait between two retries (Float)
+    """
+	def __init__(self, path, maxAttempts=5, baseDelay=60.0, maxDelay=3600.0):
+		self.path = path
+		self.maxAttempts = maxAttempts
+		self.baseDelay = baseDelay
+		self.maxDelay = maxDelay
+		self.lock = threading.Lock()
+		self.connection = sqlite3.connect(path, timeout=60, check_same_thread=False)
+		self.connection.execute("PRAGMA journal_mode=WAL")
+		self.connection.execute("""
+			CREATE TABLE IF NOT EXISTS failures (
+				url TEXT PRIMARY KEY,
+				sections TEXT NOT NULL,
+				reviewBuckets TEXT,
+				errors TEXT NOT NULL,
+				attempts INTEGER NOT NULL,
+				nextAttemptAt REAL NOT NULL,
+				updatedAt REAL NOT NULL
+			)
+		""")
+		self.connection.commit()
+
+	def getDelay(self, attempts):
+		delay = min(self.baseDelay * (2 ** (attempts - 1)), self.maxDelay)
+		return delay * random.uniform(0.5, 1.0)
+
+	def record(self, app):
+		"""
+        Queues the failed sections of `app`, or drops it from the queue when it
+        has none left. An app already queued counts another failed attempt.
+        Returns the sections still failing
+        """
+		sections = getFailedSections(app)
+		if len(sections) == 0:
+			self.resolve(app.url)
+			return sections
+
+		reviewBuckets = json.dumps(app.reviewBuckets) if app.reviewBuckets is not None else None
+		now = time()
+		with self.lock, self.connection:
+			row = self.connection.execute("SELECT attempts FROM failures WHERE url = ?", (app.url,)).fetchone()
+			attempts = (row[0] if row is not None else 0) + 1
+			self.connection.execute("""
+				INSERT INTO failures (url, sections, reviewBuckets, errors, attempts, nextAttemptAt, updatedAt) VALUES (?, ?, ?, ?, ?, ?, ?)
+				ON CONFLICT(url) DO UPDATE SET
+					sections = excluded.sections, reviewBuckets = COALESCE(excluded.reviewBuckets, reviewBuckets),
+					errors = excluded.errors, attempts = excluded.attempts, nextAttemptAt = excluded.nextAttemptAt, updatedAt = excluded.updatedAt
+			""", (app.url, json.dumps(sections), reviewBuckets, json.dumps(app.errors), attempts, now + self.getDelay(attempts), now))
+		return sections
+
+	def resolve(self, url):
+		# other workers share the queue, so the delete is always issued. A primary key lookup that finds no
+		# row doesn't write anything and returns without a disk sync
+		with self.lock, self.connection:
+			self.connection.execute("DELETE FROM failures WHERE url = ?", (url,))
+
+	def due(self, now=None):
+		"""
+        Apps whose backoff is over and that have attempts left, longest waiting first
+        """
+		with self.lock:
+			rows = self.connection.execute(
+				"SELECT url, sections, reviewBuckets, attempts FROM failures WHERE attempts < ? AND nextAttemptAt <= ? ORDER BY nextAttemptAt",
+				(self.maxAttempts, now or time())
+			).fetchall()
+		return [
+			FailedApp(url, tuple(json.loads(sections)), json.loads(reviewBuckets) if reviewBuckets is not None else None, attempts)
+			for url, sections, reviewBuckets, attempts in rows
+		]
+
+	def nextAttemptAt(self):
+		with self.lock:
+			return self.connection.execute("SELECT MIN(nextAttemptAt) FROM failures WHERE attempts < ?", (self.maxAttempts,)).fetchone()[0]
+
+	def counts(self):
+		"""
+        Number of queued apps still being retried and of apps given up on
+        """
+		with self.lock:
+			pending, givenUp = self.connection.execute(
+				"SELECT COALESCE(SUM(attempts < ?), 0), COALESCE(SUM(attempts >= ?), 0) FROM failures", (self.maxAttempts, self.maxAttempts)
+			).fetchone()
+		return {'pending': pending, 'givenUp': givenUp}
+
+	def close(self):
+		self.connection.close()
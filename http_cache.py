@@ -0,0 +1,171 @@
+from requests.structures import CaseInsensitiveDict
+from time import time
+import threading
+import tempfile
+import requests
+import argparse
+import hashlib
+import struct
+import json
+import zlib
+import os
+
+# request headers that change what the server sends back, anything else (cookies, user agent) is left out of the key
+VARY_HEADERS = ["Turbo-Frame", "Accept"]
+STORED_HEADERS = ["Content-Type"]
+# seconds after which the size is measured on disk again, other processes may share the directory
+SIZE_RESCAN_INTERVAL = 60
+
+class OfflineCacheMiss(requests.ConnectionError):
+	pass
+
+class ResponseCache:
+	"""
+    Content-addressed on-disk cache of successful GET responses. Entries are
+    zlib-compressed and keyed by a hash of the URL, query params and the
+    headers in VARY_HEADERS
+    @params:
+        directory   - Required  : cache directory (Str)
+        ttl         - Optional  : seconds an entry stays fresh, None keeps entries forever (Float)
+        maxBytes    - Optional  : size on disk above which the least recently used entries are evicted (Int)
+        offline     - Optional  : only serve from the cache, ignoring the ttl, and never hit the network (Bool)
+        writeOnly   - Optional  : never serve from the cache, only store fresh responses in it (Bool)
+    """
+	def __init__(self, directory, ttl=None, maxBytes=2 * 1024 ** 3, offline=False, writeOnly=False):
+		self.directory = directory
+		self.ttl = ttl
+		self.maxBytes = maxBytes
+		self.offline = offline
+		self.writeOnly = writeOnly and not offline
+		self.lock = threading.Lock()
+		self.evicting = False
+		if not os.path.exists(directory): os.makedirs(directory)
+		self.size = sum(entry.stat().st_size for entry in self.iterEntries())
+		self.measuredAt = time()
+
+	def iterEntries(self):
+		for shard in os.scandir(self.directory):
+			if not shard.is_dir(): continue
+			for entry in os.scandir(shard.path):
+				if entry.is_file() and not entry.name.endswith(".tmp"):
+					yield entry
+
+	def makeKey(self, url, params=None, headers=None):
+		headers = CaseInsensitiveDict(headers or {})
+		keyData = [
+			url,
+			sorted((str(name), str(value)) for name, value in (params or {}).items()),
+			[headers.get(name) for name in VARY_HEADERS]
+		]
+		return hashlib.sha256(json.dumps(keyData).encode('utf8')).hexdigest()
+
+	def pathFor(self, key):
+		return os.path.join(self.directory, key[:2], key)
+
+	def get(self, key):
+		if self.writeOnly: return None
+		path = self.pathFor(key)
+		try:
+			modifiedAt = os.path.getmtime(path)
+			if not self.offline and self.ttl is not None and time() - modifiedAt > self.ttl:
+				return None
+			with open(path, 'rb') as file:
+				payload = zlib.decompress(file.read())
+		except (OSError, zlib.error):
+			return None
+
+		metaLength = struct.unpack(">I", payload[:4])[0]
+		meta = json.loads(payload[4:4 + metaLength])
+
+		response = requests.Response()
+		response.status_code = meta['status']
+		response.url = meta['url']
+		response.headers = CaseInsensitiveDict(meta['headers'])
+		response._content = payload[4 + metaLength:]
+		response.fromCache = True
+
+		# keep the ttl measured from when the page was fetched, only bump the access time used for eviction
+		try:
+			os.utime(path, (time(), modifiedAt))
+		except OSError:
+			pass
+		return response
+
+	def put(self, key, response):
+		if response.status_code != 200: return
+
+		meta = json.dumps({
+			'status': response.status_code,
+			'url': response.url,
+			'headers': {name: response.headers[name] for name in STORED_HEADERS if name in response.headers}
+		}).encode('utf8')
+		payload = zlib.compress(struct.pack(">I", len(meta)) + meta + response.content, 6)
+
+		path = self.pathFor(key)
+		os.makedirs(os.path.dirname(path), exist_ok=True)
+		# a unique name, queue workers in other processes may be writing the same key into the shared cache
+		fileDescriptor, tmpPath = tempfile.mkstemp(dir=os.path.dirname(path), prefix=key + ".", suffix=".tmp")
+		try:
+			with os.fdopen(fileDescriptor, 'wb') as file:
+				file.write(payload)
+		except BaseException:
+			os.remove(tmpPath)
+			raise
+
+		with self.lock:
+			previousSize = os.path.getsize(path) if os.path.exists(path) else 0
+			os.replace(tmpPath, path)
+			self.size += len(payload) - previousSize
+			mustEvict = not self.evicting and self.maxBytes is not None and (self.size > self.maxBytes or time() - self.measuredAt > SIZE_RESCAN_INTERVAL)
+			if mustEvict: self.evicting = True
+		# the rescan walks the whole directory, other threads keep reading and writing entries meanwhile
+		if mustEvict: self.evict()
+
+	def evict(self):
+		# other processes sharing the directory write and evict too, so the running total is only a hint
+		# and the size is measured again from disk before anything is removed
+		try:
+			with self.lock: sizeAtScan = self.size
+			entries = []
+			for entry in self.iterEntries():
+				try:
+					entries.append((entry.stat().st_atime, entry.stat().st_size, entry.path))
+				except OSError:
+					pass
+			size = sum(entrySize for accessedAt, entrySize, path in entries)
+
+			# drop least recently read entries until the cache is back under 90% of its budget
+			target = self.maxBytes * 0.9
+			if size > self.maxBytes:
+				for accessedAt, entrySize, path in sorted(entries):
+					if size <= target: break
+					try:
+						os.remove(path)
+						size -= entrySize
+					except OSError:
+						pass
+
+			with self.lock:
+				# entries written by other threads during the scan are added on top of what it measured
+				self.size = size + self.size - sizeAtScan
+				self.measuredAt = time()
+		finally:
+			self.evicting = False
+
+def addCacheArguments(parser):
+	# off by default, a cached page would hide changes from refresh checks and incremental runs until its ttl is over
+	parser.add_argument("--cache", default=False, action=argparse.BooleanOptionalAction, help="Cache successful responses on disk and serve them while fresh, e.g. when developing against recorded pages")
+	parser.add_argument("--cache-dir", default="cache", help="HTTP response cache directory")
+	parser.add_argument("--cache-ttl", type=float, default=24, help="Hours a cached response stays fresh")
+	parser.add_argument("--cache-max-size", type=float, default=2048, help="Cache size (in MB) above which old entries are evicted")
+	parser.add_argument("--offline", default=False, action=argparse.BooleanOptionalAction, help="Replay responses from the cache only, never touch the network")
+
+def openCacheFromArgs(args, writeOnly=False):
+	if not args.cache and not args.offline: return None
+	return ResponseCache(
+		args.cache_dir,
+		ttl=args.cache_ttl * 3600 if args.cache_ttl > 0 else None,
+		maxBytes=int(args.cache_max_size * 1024 ** 2),
+		offline=args.offline,
+		writeOnly=writeOnly
+	)
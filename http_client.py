@@ -0,0 +1,187 @@
+from requests.adapters import HTTPAdapter
+from email.utils import parsedate_to_datetime
+from datetime import datetime, timezone
+from time import monotonic, sleep
+from http_cache import OfflineCacheMiss
+from metrics import metrics
+import threading
+import requests
+import os
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+SHOPIFY_URL = "https://apps.shopify.com"
+# requests for the app store go here instead, e.g. to the benchmark stand-in server
+BASE_URL = os.environ.get("SHOPIFY_BASE_URL", SHOPIFY_URL).rstrip("/")
+
+def resolveUrl(url):
+	if BASE_URL != SHOPIFY_URL and url.startswith(SHOPIFY_URL):
+		return BASE_URL + url[len(SHOPIFY_URL):]
+	return url
+
+class RequestStats:
+	def __init__(self):
+		self.lock = threading.Lock()
+		self.requests = 0
+		self.retries = 0
+		self.failures = 0
+		self.cacheHits = 0
+		self.bytes = 0
+		self.wireBytes = 0
+		self.latency = 0.0
+		self.maxLatency = 0.0
+		self.statusCounts = {}
+
+	def record(self, status, numberOfBytes, wireBytes, latency, isRetry):
+		with self.lock:
+			self.requests += 1
+			self.bytes += numberOfBytes
+			self.wireBytes += wireBytes
+			self.latency += latency
+			self.maxLatency = max(self.maxLatency, latency)
+			if isRetry: self.retries += 1
+			if status is None:
+				self.failures += 1
+			else:
+				self.statusCounts[status] = self.statusCounts.get(status, 0) + 1
+
+	def recordCacheHit(self):
+		with self.lock:
+			self.cacheHits += 1
+
+	def summary(self):
+		with self.lock:
+			return {
+				'requests': self.requests,
+				'cacheHits': self.cacheHits,
+				'retries': self.retries,
+				'failures': self.failures,
+				'bytes': self.bytes,
+				'wireBytes': self.wireBytes,
+				'avgLatency': self.latency / self.requests if self.requests > 0 else 0.0,
+				'maxLatency': self.maxLatency,
+				'statusCounts': dict(self.statusCounts)
+			}
+
+def getRetryAfter(response):
+	value = response.headers.get("Retry-After")
+	if value is None: return None
+
+	try:
+		return max(0.0, float(value))
+	except ValueError:
+		pass
+	try:
+		retryAt = parsedate_to_datetime(value)
+		return max(0.0, (retryAt - datetime.now(timezone.utc)).total_seconds())
+	except (TypeError, ValueError):
+		return None
+
+class HttpClient:
+	"""
+    Pooled keep-alive HTTP client shared by the scrapers
+    @params:
+        poolSize        - Optional  : max open connections per host (Int)
+        retries         - Optional  : retries on 429/5xx and connection errors (Int)
+        backoffFactor   - Optional  : base of the exponential backoff in seconds (Float)
+        maxBackoff      - Optional  : upper bound on a single backoff sleep in seconds (Float)
+        timeout         - Optional  : (connect, read) timeout in seconds (Tuple)
+        rateLimiter     - Optional  : limiter acquired before every attempt (RateLimiter)
+        cache           - Optional  : on-disk cache consulted before any GET goes to the network (ResponseCache)
+    """
+	def __init__(self, poolSize=10, retries=3, backoffFactor=2.0, maxBackoff=120.0, timeout=(10, 30), rateLimiter=None, cache=None):
+		self.retries = retries
+		self.backoffFactor = backoffFactor
+		self.maxBackoff = maxBackoff
+		self.timeout = timeout
+		self.rateLimiter = rateLimiter
+		self.cache = cache
+		self.stats = RequestStats()
+		self.session = requests.Session()
+		self.mountAdapters(poolSize)
+
+	def mountAdapters(self, poolSize):
+		adapter = HTTPAdapter(pool_connections=poolSize, pool_maxsize=poolSize, max_retries=0)
+		self.session.mount("https://", adapter)
+		self.session.mount("http://", adapter)
+
+	def configure(self, poolSize=None, retries=None, backoffFactor=None, timeout=None, rateLimiter=None, cache=None):
+		if poolSize is not None: self.mountAdapters(poolSize)
+		if retries is not None: self.retries = retries
+		if backoffFactor is not None: self.backoffFactor = backoffFactor
+		if timeout is not None: self.timeout = timeout
+		if rateLimiter is not None: self.rateLimiter = rateLimiter
+		if cache is not None: self.cache = cache
+
+	def getBackoff(self, attempt, response=None):
+		retryAfter = getRetryAfter(response) if response is not None else None
+		if retryAfter is not None:
+			return min(retryAfter, self.maxBackoff)
+		return min(self.backoffFactor * (2 ** attempt), self.maxBackoff)
+
+	def send(self, method, url, **kwargs):
+		url = resolveUrl(url)
+		cacheKey = None
+		if self.cache is not None and method == "GET":
+			cacheKey = self.cache.makeKey(url, kwargs.get("params"), kwargs.get("headers"))
+			response = self.cache.get(cacheKey)
+			if response is not None:
+				self.stats.recordCacheHit()
+				metrics.inc("http_cache_hits_total")
+				return response
+			if self.cache.offline:
+				raise OfflineCacheMiss("Not in cache: " + url)
+
+		response = self.sendWithRetries(method, url, **kwargs)
+		if cacheKey is not None:
+			self.cache.put(cacheKey, response)
+		return response
+
+	def sendWithRetries(self, method, url, **kwargs):
+		kwargs.setdefault("timeout", self.timeout)
+
+		for attempt in range(self.retries + 1):
+			if self.rateLimiter is not None:
+				self.rateLimiter.acquire()
+
+			startTime = monotonic()
+			try:
+				response = self.session.request(method, url, **kwargs)
+			except (requests.ConnectionError, requests.Timeout):
+				latency = monotonic() - startTime
+				self.stats.record(None, 0, 0, latency, attempt > 0)
+				self.recordMetrics("error", 0, 0, latency, attempt > 0)
+				if self.rateLimiter is not None:
+					self.rateLimiter.recordResponse(None, latency)
+				if attempt >= self.retries: raise
+				sleep(self.getBackoff(attempt))
+				continue
+
+			latency = monotonic() - startTime
+			try:
+				wireBytes = response.raw.tell()
+			except Exception:
+				wireBytes = len(response.content)
+			response.wireBytes = wireBytes
+			self.stats.record(response.status_code, len(response.content), wireBytes, latency, attempt > 0)
+			self.recordMetrics(response.status_code, len(response.content), wireBytes, latency, attempt > 0)
+			if self.rateLimiter is not None:
+				self.rateLimiter.recordResponse(response.status_code, latency, getRetryAfter(response))
+
+			if response.status_code not in RETRY_STATUSES or attempt >= self.retries:
+				return response
+			sleep(self.getBackoff(attempt, response))
+
+	def recordMetrics(self, status, numberOfBytes, wireBytes, latency, isRetry):
+		metrics.inc("http_requests_total", status=status)
+		metrics.observe("http_request_seconds", latency)
+		metrics.inc("http_bytes_total", wireBytes, encoding="wire")
+		metrics.inc("http_bytes_total", numberOfBytes, encoding="decoded")
+		if isRetry: metrics.inc("http_retries_total")
+
+	def get(self, url, **kwargs):
+		return self.send("GET", url, **kwargs)
+
+	def getCurrentRate(self):
+		return self.rateLimiter.currentRate if self.rateLimiter is not None else None
+
+sharedClient = HttpClient()
@@ -0,0 +1,155 @@
+from contextlib import contextmanager
+from functools import wraps
+from time import monotonic, time
+from bisect import bisect_left
+import threading
+import json
+import os
+
+# seconds, spans a cached parse (a few ms) to a slow review page behind retries
+LATENCY_BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0]
+
+def labelKey(labels):
+	return tuple(sorted(labels.items()))
+
+class Histogram:
+	def __init__(self, buckets=LATENCY_BUCKETS):
+		self.buckets = buckets
+		self.counts = [0] * (len(buckets) + 1)
+		self.count = 0
+		self.sum = 0.0
+
+	def observe(self, value):
+		self.counts[bisect_left(self.buckets, value)] += 1
+		self.count += 1
+		self.sum += value
+
+	def summary(self):
+		cumulative = 0
+		buckets = {}
+		for bound, count in zip(self.buckets + [float("inf")], self.counts):
+			cumulative += count
+			buckets["+Inf" if bound == float("inf") else str(bound)] = cumulative
+		return {'count': self.count, 'sum': self.sum, 'buckets': buckets}
+
+class Metrics:
+	"""
+    Thread-safe registry of counters and latency histograms, keyed by metric
+    name and labels, that can be dumped as JSON or in the Prometheus text format
+    """
+	def __init__(self):
+		self.lock = threading.Lock()
+		self.counters = {}
+		self.histograms = {}
+		self.startedAt = time()
+
+	def inc(self, name, value=1, **labels):
+		key = labelKey(labels)
+		with self.lock:
+			series = self.counters.setdefault(name, {})
+			series[key] = series.get(key, 0) + value
+
+	def observe(self, name, value, **labels):
+		key = labelKey(labels)
+		with self.lock:
+			series = self.histograms.setdefault(name, {})
+			if key not in series: series[key] = Histogram()
+			series[key].observe(value)
+
+	@contextmanager
+	def timer(self, stage):
+		startTime = monotonic()
+		try:
+			yield
+		finally:
+			self.observe("stage_seconds", monotonic() - startTime, stage=stage)
+
+	def timed(self, stage):
+		"""
+        Decorator recording every call of the function in the stage_seconds histogram
+        """
+		def decorator(function):
+			@wraps(function)
+			def wrapper(*args, **kwargs):
+				with self.timer(stage):
+					return function(*args, **kwargs)
+			return wrapper
+		return decorator
+
+	def snapshot(self):
+		with self.lock:
+			return {
+				'timestamp': time(),
+				'uptime': time() - self.startedAt,
+				'counters': {
+					name: [{'labels': dict(key), 'value': value} for key, value in series.items()]
+					for name, series in self.counters.items()
+				},
+				'histograms': {
+					name: [dict(histogram.summary(), labels=dict(key)) for key, histogram in series.items()]
+					for name, series in self.histograms.items()
+				}
+			}
+
+	def toPrometheus(self):
+		def formatLabels(labels, extra=None):
+			items = list(labels.items()) + (extra or [])
+			if len(items) == 0: return ""
+			return "{" + ",".join('{}="{}"'.format(name, str(value).replace("\\", "\\\\").replace('"', '\\"')) for name, value in items) + "}"
+
+		snapshot = self.snapshot()
+		lines = []
+		for name, series in sorted(snapshot['counters'].items()):
+			lines.append("# TYPE shopify_{} counter".format(name))
+			for entry in series:
+				lines.append("shopify_{}{} {}".format(name, formatLabels(entry['labels']), entry['value']))
+		for name, series in sorted(snapshot['histograms'].items()):
+			lines.append("# TYPE shopify_{} histogram".format(name))
+			for entry in series:
+				for bound, count in entry['buckets'].items():
+					lines.append("shopify_{}_bucket{} {}".format(name, formatLabels(entry['labels'], [("le", bound)]), count))
+				lines.append("shopify_{}_sum{} {}".format(name, formatLabels(entry['labels']), entry['sum']))
+				lines.append("shopify_{}_count{} {}".format(name, formatLabels(entry['labels']), entry['count']))
+		return "\n".join(lines) + "\n"
+
+	def dump(self, path):
+		content = self.toPrometheus() if path.endswith(".prom") else json.dumps(self.snapshot(), indent=2)
+		tmpPath = path + ".tmp"
+		with open(tmpPath, 'w') as file:
+			file.write(content)
+		os.replace(tmpPath, path)
+
+class MetricsDumper:
+	"""
+    Background thread writing the metrics to `path` every `interval` seconds,
+    in the Prometheus text format for a .prom file and as JSON otherwise
+    """
+	def __init__(self, registry, path, interval=10):
+		self.registry = registry
+		self.path = path
+		self.interval = interval
+		self.stopped = threading.Event()
+		self.thread = threading.Thread(target=self.run, daemon=True)
+
+	def run(self):
+		while not self.stopped.wait(self.interval):
+			self.registry.dump(self.path)
+
+	def start(self):
+		self.thread.start()
+		return self
+
+	def stop(self):
+		self.stopped.set()
+		self.thread.join()
+		self.registry.dump(self.path)
+
+metrics = Metrics()
+
+def addMetricsArguments(parser):
+	parser.add_argument("--metrics-file", default=None, help="Periodically write run metrics to this file (Prometheus text format if it ends in .prom, JSON otherwise)")
+	parser.add_argument("--metrics-interval", type=float, default=10, help="Seconds between metrics file updates")
+
+def startMetricsFromArgs(args):
+	if args.metrics_file is None: return None
+	return MetricsDumper(metrics, args.metrics_file, args.metrics_interval).start()
@@ -0,0 +1,114 @@
+from time import monotonic, sleep
+import threading
+import argparse
+
+class RateLimiter:
+	"""
+    Token bucket shared by every worker thread so the whole run stays within
+    a global requests-per-second budget
+    @params:
+        requestsPerSecond   - Required  : sustained request rate, <= 0 disables limiting (Float)
+        burst               - Optional  : number of requests allowed back to back (Int)
+    """
+	def __init__(self, requestsPerSecond, burst=1):
+		self.rate = requestsPerSecond
+		self.capacity = max(1, burst)
+		self.tokens = float(self.capacity)
+		self.updatedAt = monotonic()
+		self.lock = threading.Lock()
+
+	@property
+	def currentRate(self):
+		with self.lock:
+			return self.rate
+
+	def refill(self):
+		now = monotonic()
+		self.tokens = min(self.capacity, self.tokens + (now - self.updatedAt) * self.rate)
+		self.updatedAt = now
+
+	def acquire(self):
+		if self.rate is None or self.rate <= 0: return
+
+		while True:
+			with self.lock:
+				self.refill()
+				if self.tokens >= 1:
+					self.tokens -= 1
+					return
+				wait = (1 - self.tokens) / self.rate
+			sleep(wait)
+
+	def recordResponse(self, status, latency, retryAfter=None):
+		pass
+
+class AdaptiveRateLimiter(RateLimiter):
+	"""
+    AIMD rate limiter. Healthy responses raise the rate by about `increase`
+    requests/second for every second of traffic; a 429, a 5xx, a connection
+    error or a latency spike multiplies it by `decrease`. A Retry-After header
+    pauses every worker until it has passed
+    @params:
+        initialRate     - Required  : starting requests per second, <= 0 starts at maxRate (Float)
+        minRate         - Optional  : floor for the rate (Float)
+        maxRate         - Optional  : ceiling for the rate (Float)
+        increase        - Optional  : additive increase, in requests/second per second (Float)
+        decrease        - Optional  : multiplicative decrease factor (Float)
+        latencyFactor   - Optional  : latency above this multiple of the running average counts as a spike (Float)
+        burst           - Optional  : number of requests allowed back to back (Int)
+    """
+	def __init__(self, initialRate, minRate=0.05, maxRate=10.0, increase=0.05, decrease=0.5, latencyFactor=4.0, burst=1):
+		# clamping 0 up to minRate would turn "no limit" into one request every 20 seconds
+		initialRate = maxRate if initialRate is None or initialRate <= 0 else initialRate
+		super().__init__(min(max(initialRate, minRate), maxRate), burst)
+		self.minRate = minRate
+		self.maxRate = maxRate
+		self.increase = increase
+		self.decrease = decrease
+		self.latencyFactor = latencyFactor
+		self.averageLatency = None
+		self.lastDecreaseAt = 0.0
+		self.pausedUntil = 0.0
+
+	def acquire(self):
+		while True:
+			with self.lock:
+				pause = self.pausedUntil - monotonic()
+			if pause <= 0: break
+			sleep(pause)
+		super().acquire()
+
+	def isLatencySpike(self, latency):
+		if self.averageLatency is None: return False
+		return latency > self.latencyFactor * max(self.averageLatency, 0.1)
+
+	def recordResponse(self, status, latency, retryAfter=None):
+		now = monotonic()
+		with self.lock:
+			self.refill()
+			isUnhealthy = status is None or status == 429 or status >= 500 or self.isLatencySpike(latency)
+
+			if not isUnhealthy:
+				self.averageLatency = latency if self.averageLatency is None else 0.9 * self.averageLatency + 0.1 * latency
+				self.rate = min(self.maxRate, self.rate + self.increase / self.rate)
+				return
+
+			# requests already in flight report the same overload, only back off once per interval
+			if now - self.lastDecreaseAt >= max(1.0, 1 / self.rate):
+				self.rate = max(self.minRate, self.rate * self.decrease)
+				self.tokens = min(self.tokens, 0.0)
+				self.lastDecreaseAt = now
+			if retryAfter is not None:
+				self.pausedUntil = max(self.pausedUntil, now + retryAfter)
+
+def addRateLimitArguments(parser):
+	parser.add_argument("-rps", "--requests-per-second", type=float, default=None, help="Starting HTTP request rate shared by all workers")
+	parser.add_argument("--max-requests-per-second", type=float, default=10, help="Highest request rate the adaptive limiter may ramp up to")
+	parser.add_argument("--adaptive", default=True, action=argparse.BooleanOptionalAction, help="Adapt the request rate to how the server responds (--no-adaptive keeps it fixed)")
+
+def rateLimiterFromArgs(args, defaultRate):
+	rate = args.requests_per_second if args.requests_per_second is not None else defaultRate
+	# a rate of 0 (e.g. -t 0) disables limiting, adaptive or not
+	if not args.adaptive or rate <= 0:
+		return RateLimiter(rate)
+	return AdaptiveRateLimiter(rate, maxRate=max(rate, args.max_requests_per_second))
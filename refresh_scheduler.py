@@ -0,0 +1,203 @@
+from shopify import REVIEWS_PER_PAGE
+from time import time
+import threading
+import sqlite3
+import json
+import math
+
+DAY = 24 * 60 * 60
+# a fresh app is assumed to change about once a month until its own checks say otherwise
+PRIOR_CHANGES = 1.0
+PRIOR_SECONDS = 30 * DAY
+def getSnapshot(rating, reviewCount, pricePlans, bucketCounts):
+	return {'rating': rating, 'reviewCount': reviewCount, 'pricePlans': list(pricePlans or []), 'buckets': dict(bucketCounts or {})}
+
+def getAppSnapshot(app):
+	"""
+    Fields of a scraped ShopifyApp whose changes the scheduler tracks. The star
+    bucket counts come from the app page, so a metadata-only scrape has them too
+    """
+	bucketCounts = {key: count for key, count, countIsExact, reviewUrl in (app.reviewBuckets or [])}
+	return getSnapshot(app.rating, app.reviewCount, app.pricePlans, bucketCounts)
+
+def getRecordSnapshot(record):
+	bucketCounts = {key: bucket.get('count') for key, bucket in (record.get('reviews') or {}).items()}
+	return getSnapshot(record.get('rating'), record.get('reviewCount'), record.get('pricePlans'), bucketCounts)
+
+def getScrapeCost(bucketCounts, previousCounts=None):
+	"""
+    Requests of a full scrape: the app page, plus every review page of an app
+    without a stored record, or for an incremental rescrape the new pages of each
+    bucket whose count moved and one more reaching into the reviews already stored
+    @params:
+        bucketCounts    - Required  : review count of each star bucket, as read off the app page (Dict)
+        previousCounts  - Optional  : bucket counts of the stored record, None when there is none (Dict)
+    """
+	cost = 1
+	for key, count in bucketCounts.items():
+		count = count or 0
+		if previousCounts is None:
+			cost += math.ceil(count / REVIEWS_PER_PAGE)
+		elif count != previousCounts.get(key):
+			cost += math.ceil(max(count - (previousCounts.get(key) or 0), 0) / REVIEWS_PER_PAGE) + 1
+	return cost
+
+class RefreshPlan:
+	def __init__(self, budget):
+		self.budget = budget
+		self.full = []
+		self.check = []
+		self.skipped = 0
+		self.cost = 0
+
+	@property
+	def remaining(self):
+		return self.budget - self.cost
+
+	def spend(self, cost):
+		if cost > self.remaining: return False
+		self.cost += cost
+		return True
+
+class RefreshScheduler:
+	"""
+    Change history of already scraped apps, used to spend a refresh run's request
+    budget on the apps most likely to be out of date. Each app's changes are
+    treated as a Poisson process; its rate is estimated from how often checks
+    found the tracked fields (rating, review count, pricing, star bucket counts)
+    changed, and 1 - exp(-rate * age) is the chance the stored copy is stale
+    @params:
+        path            - Required  : scheduler database file (Str)
+        fullThreshold   - Optional  : staleness from which an app is fully rescraped straight away (Float)
+        checkThreshold  - Optional  : staleness from which an app gets a metadata-only check, below it the app is left alone (Float)
+    """
+	def __init__(self, path, fullThreshold=0.5, checkThreshold=0.05):
+		self.path = path
+		self.fullThreshold = fullThreshold
+		self.checkThreshold = checkThreshold
+		self.lock = threading.Lock()
+		self.connection = sqlite3.connect(path, timeout=60, check_same_thread=False)
+		self.connection.execute("PRAGMA journal_mode=WAL")
+		self.connection.execute("""
+			CREATE TABLE IF NOT EXISTS apps (
+				url TEXT PRIMARY KEY,
+				snapshot TEXT NOT NULL,
+				lastCheckedAt REAL NOT NULL,
+				lastChangedAt REAL,
+				observedSeconds REAL NOT NULL DEFAULT 0,
+				checks INTEGER NOT NULL DEFAULT 0,
+				changes INTEGER NOT NULL DEFAULT 0,
+				needsFullScrape INTEGER NOT NULL DEFAULT 0
+			)
+		""")
+		self.connection.commit()
+
+	def getRow(self, url):
+		with self.lock:
+			return self.connection.execute(
+				"SELECT snapshot, lastCheckedAt, observedSeconds, changes, needsFullScrape FROM apps WHERE url = ?", (url,)
+			).fetchone()
+
+	def getChangeRate(self, observedSeconds, changes):
+		"""
+        Changes per second, the posterior mean of a gamma prior worth one change in PRIOR_SECONDS
+        """
+		return (PRIOR_CHANGES + changes) / (PRIOR_SECONDS + observedSeconds)
+
+	def getStaleness(self, url, now=None):
+		"""
+        Probability the app changed since it was last looked at, None for an app without history
+        """
+		row = self.getRow(url)
+		if row is None: return None
+		snapshot, lastCheckedAt, observedSeconds, changes, needsFullScrape = row
+		if needsFullScrape: return 1.0
+		age = max(0.0, (now or time()) - lastCheckedAt)
+		return 1 - math.exp(-self.getChangeRate(observedSeconds, changes) * age)
+
+	def getLastCounts(self, url):
+		"""
+        Bucket counts the app was last seen with, None for an app without history
+        """
+		row = self.getRow(url)
+		return json.loads(row[0])['buckets'] if row is not None else None
+
+	def getFullScrapeCost(self, url):
+		"""
+        Estimated requests of an incremental rescrape planned without a check, so
+        without the current bucket counts: every bucket that had reviews is taken
+        to have moved by less than a page. None for an app without history
+        """
+		lastCounts = self.getLastCounts(url)
+		if lastCounts is None: return None
+		return getScrapeCost({key: (count or 0) + 1 for key, count in lastCounts.items() if count}, lastCounts)
+
+	def plan(self, urls, budget, isStored):
+		"""
+        Splits `urls` into apps to rescrape in full and apps to check, most stale
+        first, until the estimated requests reach `budget`. Apps that were never
+        scraped come first and, like stored apps without history, are checked:
+        their full scrape is only costed once the check read their bucket counts
+        @params:
+            urls        - Required  : app URLs of the run (List)
+            budget      - Required  : requests the run may spend (Int)
+            isStored    - Required  : tells whether storage holds a record of a URL (Function)
+        """
+		now = time()
+		candidates = []
+		for url in dict.fromkeys(urls):
+			staleness = self.getStaleness(url, now)
+			if staleness is None:
+				staleness = 2.0 if not isStored(url) else 1.0
+			candidates.append((staleness, url))
+		candidates.sort(key=lambda candidate: -candidate[0])
+
+		refreshPlan = RefreshPlan(budget)
+		for staleness, url in candidates:
+			if staleness < self.checkThreshold:
+				refreshPlan.skipped += 1
+				continue
+			fullCost = self.getFullScrapeCost(url) if staleness >= self.fullThreshold else None
+			if fullCost is not None and refreshPlan.spend(fullCost):
+				refreshPlan.full.append(url)
+			elif refreshPlan.spend(1):
+				refreshPlan.check.append(url)
+			else:
+				refreshPlan.skipped += 1
+		return refreshPlan
+
+	def observe(self, url, snapshot, fullScrape, previousSnapshot=None):
+		"""
+        Records a look at `url` and returns whether its tracked fields changed.
+        An app seen for the first time is compared to `previousSnapshot` (e.g.
+        from its stored record) when given. After a metadata-only check that
+        found a change the app is flagged for a full rescrape
+        """
+		now = time()
+		row = self.getRow(url)
+		if row is None and previousSnapshot is not None:
+			row = (json.dumps(previousSnapshot), now, 0.0, 0, 0)
+
+		with self.lock, self.connection:
+			if row is None:
+				self.connection.execute(
+					"INSERT INTO apps (url, snapshot, lastCheckedAt, checks, needsFullScrape) VALUES (?, ?, ?, 1, ?)",
+					(url, json.dumps(snapshot), now, 0 if fullScrape else 1)
+				)
+				return False
+
+			storedSnapshot, lastCheckedAt, observedSeconds, changes, needsFullScrape = row
+			changed = json.loads(storedSnapshot) != snapshot
+			needsFullScrape = 0 if fullScrape else int(needsFullScrape or changed)
+			self.connection.execute("""
+				INSERT INTO apps (url, snapshot, lastCheckedAt, lastChangedAt, observedSeconds, checks, changes, needsFullScrape)
+				VALUES (?, ?, ?, ?, ?, 1, ?, ?)
+				ON CONFLICT(url) DO UPDATE SET
+					snapshot = excluded.snapshot, lastCheckedAt = excluded.lastCheckedAt,
+					lastChangedAt = COALESCE(excluded.lastChangedAt, lastChangedAt), observedSeconds = excluded.observedSeconds,
+					checks = checks + 1, changes = excluded.changes, needsFullScrape = excluded.needsFullScrape
+			""", (url, json.dumps(snapshot), now, now if changed else None, observedSeconds + max(0.0, now - lastCheckedAt), changes + int(changed), needsFullScrape))
+			return changed
+
+	def close(self):
+		self.connection.close()
@@ -0,0 +1,60 @@
+from urllib.parse import urlparse
+import json
+import os
+import re
+
+def getAppSlug(appUrl):
+	path = urlparse(appUrl).path.strip("/")
+	return re.sub(r'[^A-Za-z0-9._-]+', '_', path) or "app"
+
+class AppReviewStream:
+	"""
+    Reviews are written to a temporary file that only replaces the app's file
+    on a committed close, so an incremental re-scrape can still read the
+    previous file while writing the new one
+    """
+	def __init__(self, appUrl, path):
+		self.appUrl = appUrl
+		self.path = path
+		self.tmpPath = path + ".tmp"
+		self.positions = {}
+		self.file = open(self.tmpPath, 'w', encoding='utf8')
+
+	def writePage(self, key, reviews):
+		position = self.positions.get(key, 0)
+		for text in reviews:
+			record = {'url': self.appUrl, 'star': key, 'position': position, 'text': text}
+			self.file.write(json.dumps(record, ensure_ascii=False) + "\n")
+			position += 1
+		self.positions[key] = position
+		self.file.flush()
+
+	def close(self, commit=True):
+		self.file.close()
+		if commit:
+			os.replace(self.tmpPath, self.path)
+		else:
+			os.remove(self.tmpPath)
+
+class ReviewStreamWriter:
+	"""
+    Writes reviews page by page to one JSONL file per app instead of keeping
+    them in the app record
+    @params:
+        directory   - Required  : directory holding the per-app <slug>.jsonl files (Str)
+    """
+	def __init__(self, directory):
+		self.directory = directory
+		if not os.path.exists(directory): os.makedirs(directory)
+
+	def pathFor(self, appUrl):
+		return os.path.join(self.directory, getAppSlug(appUrl) + ".jsonl")
+
+	def open(self, appUrl):
+		return AppReviewStream(appUrl, self.pathFor(appUrl))
+
+def readReviews(path):
+	with open(path, 'r', encoding='utf8') as file:
+		for line in file:
+			if line.strip():
+				yield json.loads(line)
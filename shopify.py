@@ -1,10 +1,48 @@
 from bs4 import BeautifulSoup
-from time import sleep
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice, chain
+from contextlib import closing
+from collections import deque
+from functools import partial
+from time import sleep, monotonic
 from sys import stdout
-import requests
+from http_client import sharedClient, RETRY_STATUSES
+from metrics import metrics
+from review_stream import readReviews
+from app_record import AppRecord
+import threading
+import hashlib
 import json
+import math
+import os
 import re
 
+try:
+	import lxml.html
+except ImportError:
+	lxml = None
+
+# the app page selectors walk the tree by position, and were written against html.parser's tree.
+# lxml repairs markup differently, so it's opt-in
+DEFAULT_PARSER = "html.parser"
+PARSERS = ["html.parser", "lxml"] if lxml is not None else ["html.parser"]
+REVIEW_TEXT_XPATH = '//p[contains(concat(" ", normalize-space(@class), " "), " tw-break-words ")]'
+
+REVIEWS_PER_PAGE = 10
+MAX_REVIEW_PAGES = 999
+# number of newest reviews per star bucket remembered to detect where a re-scrape can stop
+REVIEW_FINGERPRINTS = 10
+# seconds between progress bar redraws
+PROGRESS_RENDER_INTERVAL = 0.1
+progressRenderedAt = 0.0
+# parts of an app scrape that can fail and be retried on their own. The page section is the app page
+# itself, without it nothing else could be scraped
+PAGE_SECTION = "page"
+DETAILS_SECTION = "details"
+REVIEWS_SECTION = "reviews"
+TURBO_FRAME_PATTERN = re.compile(rb'<turbo-frame\b[^>]*\bid="([^"]+)"')
+REVIEW_TEXT_MARKER = b'tw-break-words'
+
 def printProgressBar(iteration, total, prefix='Progress:', suffix='Complete', decimals=1, length=50, fill='█', printEnd="\r"):
 	"""
     Call in a loop to create terminal progress bar
@@ -18,13 +56,18 @@ def printProgressBar(iteration, total, prefix='Progress:', suffix='Complete', de
         fill        - Optional  : bar fill character (Str)
         printEnd    - Optional  : end character (e.g. "\r", "\r\n") (Str)
     """
+	global progressRenderedAt
+	# redraws are only for the eye, drop the ones that come too fast instead of slowing the caller down
+	now = monotonic()
+	if iteration < total and now - progressRenderedAt < PROGRESS_RENDER_INTERVAL: return
+	progressRenderedAt = now
+
 	percent = ("{0:." + str(decimals) + "f}").format(100 * (iteration / float(total)))
 	filledLength = int(length * iteration // total)
 	bar = fill * filledLength + '-' * (length - filledLength)
 	
 	stdout.write(f'\r{prefix} |{bar}| {percent}% {suffix}')
 	stdout.flush()
-	sleep(0.05)
 
 def flushProgressBar():
 	print("\r" + " " * 100 + "\r", end='')
@@ -46,19 +89,173 @@ def valueToInt(x):
 		return 1000000.0
 	return int(float(x))
 
+def parseReviewPageLxml(html):
+	# same extraction as the BeautifulSoup version below, but only the review paragraphs are ever
+	# turned into Python objects, the rest of the tree stays inside libxml2
+	if len(html.strip()) == 0: return []
+	tree = lxml.html.document_fromstring(html, parser=lxml.html.HTMLParser(encoding="utf-8"))
+
+	reviews = []
+	lastBlock = None
+	for reviewTextBlock in tree.xpath(REVIEW_TEXT_XPATH):
+		reviewBlock = reviewTextBlock.getparent().getparent().getparent()
+		if reviewBlock is lastBlock: continue
+		lastBlock = reviewBlock
+
+		paragraphBlocks = reviewTextBlock.getparent().iter("p")
+		reviews.append("".join(block.text_content().strip() + "\n" for block in paragraphBlocks))
+
+	return reviews
+
+def parseReviewPage(html, parser=None):
+	parser = parser or DEFAULT_PARSER
+	if parser == "lxml" and lxml is not None:
+		return parseReviewPageLxml(html)
+
+	soup = BeautifulSoup(html, parser)
+	reviewTextBlocks = soup.find_all("p", {"class": "tw-break-words"})
+
+	reviews = []
+	lastBlock = None
+	for reviewTextBlock in reviewTextBlocks:
+		reviewBlock = reviewTextBlock.parent.parent.parent
+		if reviewBlock is lastBlock: continue
+		lastBlock = reviewBlock
+
+		paragraphBlocks = reviewTextBlock.parent.find_all("p")
+		reviews.append("".join(block.text.strip() + "\n" for block in paragraphBlocks))
+
+	# only plain strings leave this function, so the page tree can be released right away
+	soup.decompose()
+	return reviews
+
+def reviewFingerprint(text):
+	return hashlib.sha1(" ".join(text.split()).encode('utf8')).hexdigest()[:16]
+
+def batched(iterable, size):
+	iterator = iter(iterable)
+	while True:
+		batch = list(islice(iterator, size))
+		if len(batch) == 0: return
+		yield batch
+
+def findReviewFrameId(html):
+	"""
+    Id of the innermost turbo-frame opened before the first review on a full
+    review page, None when the reviews aren't rendered inside a frame
+    """
+	markerAt = html.find(REVIEW_TEXT_MARKER)
+	if markerAt < 0: return None
+	frameIds = [match.group(1) for match in TURBO_FRAME_PATTERN.finditer(html, 0, markerAt)]
+	return frameIds[-1].decode('utf8') if len(frameIds) > 0 else None
+
+class ReviewFrame:
+	"""
+    Turbo-Frame the review list can be requested as instead of the full page,
+    shared by every app of a run. The frame id is learned from the first full
+    review page, and fragments are given up on for the rest of the run as soon
+    as one comes back without reviews its full page has
+    @params:
+        enabled     - Optional  : request review pages as fragments when the site supports it (Bool)
+    """
+	def __init__(self, enabled=True):
+		self.enabled = enabled
+		self.frameId = None
+		self.lock = threading.Lock()
+
+	def getHeaders(self):
+		with self.lock:
+			if not self.enabled or self.frameId is None: return None
+			return {"Turbo-Frame": self.frameId}
+
+	def learn(self, html, numberOfReviews):
+		with self.lock:
+			if not self.enabled or self.frameId is not None or numberOfReviews == 0: return
+			self.frameId = findReviewFrameId(html)
+			# a page with reviews but no frame around them means the site doesn't serve fragments
+			if self.frameId is None: self.enabled = False
+
+	def reject(self):
+		with self.lock:
+			self.enabled = False
+
+class ReviewPageStats:
+	def __init__(self):
+		self.lock = threading.Lock()
+		self.pages = 0
+		self.fragments = 0
+		self.wireBytes = 0
+		self.parsedBytes = 0
+
+	def record(self, wireBytes, parsedBytes, isFragment):
+		with self.lock:
+			self.pages += 1
+			self.wireBytes += wireBytes
+			self.parsedBytes += parsedBytes
+			if isFragment: self.fragments += 1
+
+	def summary(self):
+		with self.lock:
+			return {
+				'pages': self.pages,
+				'fragments': self.fragments,
+				'wireBytesPerPage': self.wireBytes / self.pages if self.pages > 0 else 0.0,
+				'parsedBytesPerPage': self.parsedBytes / self.pages if self.pages > 0 else 0.0
+			}
+
+reviewPageStats = ReviewPageStats()
+
+def fetchAppHtml(client, url, verbose=False):
+	errorMessage = "Failed to fetch HTML"
+	try:
+		with metrics.timer("fetchAppPage"):
+			response = client.get(url)
+		if response.status_code == 200:
+			return response.content, None
+		return None, errorMessage + " ({})".format(response.status_code)
+	except Exception as e:
+		if verbose: print(errorMessage, "\n", e)
+		return None, errorMessage
+
+def countAppErrors(messages):
+	for message in messages:
+		# "Failed to fetch HTML (404)" and "Failed to fetch HTML" are the same kind of error
+		metrics.inc("app_errors_total", type=message.split(" (")[0])
+
+def parseAppPage(url, html, fetchError=None, omitReviews=False, verbose=False, parser=None):
+	"""
+    Builds a ShopifyApp from an already fetched app page without touching the
+    network, for use in a worker process. Reviews are left for the caller to
+    fetch with scrapeReviewBuckets once the app is back in the main process.
+    Metrics a worker process records never reach the main one, so the caller
+    counts the errors the app comes back with
+    """
+	return ShopifyApp(url, omitReviews=omitReviews, verbose=verbose, parser=parser, html=html, fetchError=fetchError, deferReviews=True)
+
 class Options:
-	def __init__(self, throttle, testModeOn, omitReviews, verbose):
+	def __init__(self, throttle=3, testModeOn=False, omitReviews=False, verbose=False, client=None, showProgress=True, reviewPageWorkers=4, reviewWriter=None, reviewPageParser=None, parser=None, reviewFrame=None):
 		self.testModeOn = testModeOn
 		self.throttleTime = throttle
 		self.omitReviews = omitReviews
 		self.verbose = verbose
+		self.client = client if client is not None else sharedClient
+		self.showProgress = showProgress
+		self.reviewPageWorkers = reviewPageWorkers
+		self.reviewWriter = reviewWriter
+		self.parser = parser or DEFAULT_PARSER
+		self.reviewPageParser = reviewPageParser if reviewPageParser is not None else partial(parseReviewPage, parser=self.parser)
+		self.reviewFrame = reviewFrame if reviewFrame is not None else ReviewFrame(enabled=False)
 
 class ShopifyApp:
-	def __init__(self, url, throttle=3, testModeOn=False, omitReviews=False, verbose=False):
-		self.options = Options(throttle, testModeOn, omitReviews, verbose)
+	def __init__(self, url, throttle=3, testModeOn=False, omitReviews=False, verbose=False, client=None, showProgress=True, reviewPageWorkers=4, reviewWriter=None, reviewPageParser=None,
+			parser=None, reviewFrame=None, previous=None, html=None, fetchError=None, deferReviews=False, reviewBuckets=None):
+		self.options = Options(throttle, testModeOn, omitReviews, verbose, client, showProgress, reviewPageWorkers, reviewWriter, reviewPageParser, parser, reviewFrame)
+		self.previous = previous
 
 		self.soup = None
+		self.heading = None
 		self.errors = []
+		self.failedSections = set()
 
 		self.url = url
 		self.title = ""
@@ -71,40 +268,85 @@ class ShopifyApp:
 		self.categories = []
 		self.pricePlans = []
 		self.reviews = {}
+		self.reviewsFile = None
+		self.reviewBuckets = None
 		self.numberOfReviewsScraped = 0
 
-		self.scrape()
+		self.scrape(html, fetchError, deferReviews, reviewBuckets)
+
+	def __getstate__(self):
+		# options hold the HTTP client and its locks, the receiving process attaches its own with setOptions
+		state = self.__dict__.copy()
+		state['soup'] = None
+		state['heading'] = None
+		state['options'] = None
+		state['previous'] = None
+		return state
+
+	def __setstate__(self, state):
+		self.__dict__.update(state)
+		self.options = Options()
+
+	def setOptions(self, **options):
+		self.options = Options(**options)
 
-	def logError(self, message):
+	def logError(self, message, section=DETAILS_SECTION):
 		self.errors.append(message)
+		self.failedSections.add(section)
+		countAppErrors([message])
+
+	def scrape(self, html=None, fetchError=None, deferReviews=False, reviewBuckets=None):
+		if reviewBuckets is not None:
+			# a retry of the reviews alone, the buckets were read from the app page by an earlier attempt
+			self.reviewBuckets = [tuple(bucket) for bucket in reviewBuckets]
+			# only drives the progress bar, the stored review count is kept
+			self.reviewCount = sum(reviewCount for key, reviewCount, countIsExact, reviewUrl in self.reviewBuckets)
+		else:
+			if fetchError is not None:
+				self.logError(fetchError, PAGE_SECTION)
+			elif html is not None:
+				self.loadSoup(html)
+			else:
+				self.fetchHtmlAndLoadSoup()
+
+			if self.soup is None: return
 
-	def scrape(self):
-		self.fetchHtmlAndLoadSoup()
-		
-		if self.soup is None: return
+			self.scrapeTitle()
+			self.scrapeImgUrl()
+			self.scrapeAppOverviewSection()
+			self.scrapeAboutSection()
+			self.scrapePricing()
+			self.readReviewMetrics()
+			# everything the review pages need is in reviewBuckets, the app page isn't kept while they are fetched
+			self.releaseSoup()
 
-		self.scrapeTitle()
-		self.scrapeImgUrl()
-		self.scrapeAppOverviewSection()
-		self.scrapeAboutSection()
-		self.scrapePricing()
-		self.scrapeReviews()
+		if not deferReviews:
+			self.scrapeReviewBuckets()
+
+	def releaseSoup(self):
+		# tags point at their parents and siblings, decompose breaks the cycles so the tree is freed now rather than by the GC
+		if self.soup is not None: self.soup.decompose()
+		self.soup = None
+		self.heading = None
+
+	def toRecord(self):
+		return AppRecord(
+			url=self.url,
+			title=self.title,
+			imageUrl=self.imageUrl,
+			rating=self.rating,
+			reviewCount=self.reviewCount,
+			developerName=self.developerName,
+			developerLink=self.developerLink,
+			dateLaunched=self.dateLaunched,
+			categories=tuple(self.categories),
+			pricePlans=tuple(self.pricePlans),
+			reviews=self.reviews,
+			reviewsFile=self.reviewsFile
+		)
 
 	def getData(self):
-		data = {
-			'url': self.url,
-			'title': self.title,
-			'imageUrl': self.imageUrl,
-			'rating': self.rating,
-			'reviewCount': self.reviewCount,
-			'developerName': self.developerName,
-			'developerLink': self.developerLink,
-			'dateLaunched': self.dateLaunched,
-			'categories': self.categories,
-			'pricePlans': self.pricePlans,
-			'reviews': self.reviews
-		}
-		return data		
+		return self.toRecord().toDict()
 
 	def getDataReadable(self):
 		data = self.getData()
@@ -116,41 +358,44 @@ class ShopifyApp:
 		jsonStr = json.dumps(data, indent=4, ensure_ascii=False)
 		return jsonStr
 
-	def fetchHtmlAndLoadSoup(self):
-		fetchError = False
-		errorMessage = "Failed to fetch HTML"
+	def loadSoup(self, html):
+		if isinstance(html, bytes): html = html.decode()
+		with metrics.timer("parseAppPage"):
+			self.soup = BeautifulSoup(html, self.options.parser)
+		self.heading = None
 
-		try:
-			response = requests.get(self.url)
-			if response.status_code == 200:
-				html = response.content.decode()
-				self.soup = BeautifulSoup(html, "html.parser")
-			else:
-				fetchError = True
-				errorMessage += " ({})".format(response.status_code)
-		except Exception as e:
-			if self.options.verbose: print(errorMessage, "\n", e)
-			fetchError = True
-		finally:
-			if fetchError:
-				self.logError(errorMessage)
+	def getHeading(self):
+		# the title, image, overview and pricing sections all hang off the page's only h1, look it up once
+		if self.heading is None:
+			self.heading = self.soup.find("h1")
+		return self.heading
 
+	def fetchHtmlAndLoadSoup(self):
+		html, errorMessage = fetchAppHtml(self.options.client, self.url, self.options.verbose)
+		if errorMessage is not None:
+			self.logError(errorMessage, PAGE_SECTION)
+		else:
+			self.loadSoup(html)
+
+	@metrics.timed("scrapeTitle")
 	def scrapeTitle(self):
 		try:
-			self.title = self.soup.find("h1").text.strip()
+			self.title = self.getHeading().text.strip()
 		except Exception as e:
 			errorMessage = "Failed to scrape title"
 			if self.options.verbose: print(errorMessage, "\n", e)
 			self.logError(errorMessage)
 
+	@metrics.timed("scrapeImgUrl")
 	def scrapeImgUrl(self):
 		try:
-			self.imageUrl = self.soup.find("h1").parent.parent.parent.contents[1].find("div").find("img")['src']
+			self.imageUrl = self.getHeading().parent.parent.parent.contents[1].find("div").find("img")['src']
 		except Exception as e:
 			errorMessage = "Failed to scrape image URL"
 			if self.options.verbose: print(errorMessage, "\n", e)
 			self.logError(errorMessage)
 
+	@metrics.timed("scrapeRating")
 	def scrapeRating(self, section):
 		try:
 			rating = section.find("span").text.split("(")[1].split(")")[0]
@@ -160,6 +405,7 @@ class ShopifyApp:
 			if self.options.verbose: print(errorMessage, "\n", e)
 			self.logError(errorMessage)
 
+	@metrics.timed("scrapeReviewCount")
 	def scrapeReviewCount(self, section):
 		try:
 			reviewCountText = section.text.strip().replace(",", "")
@@ -170,6 +416,7 @@ class ShopifyApp:
 			if self.options.verbose: print(errorMessage, "\n", e)
 			self.logError(errorMessage)
 
+	@metrics.timed("scrapeDeveloperName")
 	def scrapeDeveloperName(self, section):
 		try:
 			self.developerName = section.find("a").text.strip()
@@ -178,6 +425,7 @@ class ShopifyApp:
 			if self.options.verbose: print(errorMessage, "\n", e)
 			self.logError(errorMessage)
 
+	@metrics.timed("scrapeDeveloperLink")
 	def scrapeDeveloperLink(self, section):
 		try:
 			self.developerLink = "https://apps.shopify.com" + section.find("a", href=True)['href']
@@ -186,9 +434,10 @@ class ShopifyApp:
 			if self.options.verbose: print(errorMessage, "\n", e)
 			self.logError(errorMessage)
 
+	@metrics.timed("scrapeAppOverviewSection")
 	def scrapeAppOverviewSection(self):
 		try:
-			appOverviewSection = self.soup.find("h1").parent.parent.parent.contents[3].contents[3]
+			appOverviewSection = self.getHeading().parent.parent.parent.contents[3].contents[3]
 			appOverviewSectionChildren = [i for i in appOverviewSection.contents if i != "\n"] 
 
 			self.scrapeRating(appOverviewSectionChildren[0])
@@ -200,6 +449,7 @@ class ShopifyApp:
 			if self.options.verbose: print(errorMessage, "\n", e)
 			self.logError(errorMessage)
 
+	@metrics.timed("scrapeDateLaunched")
 	def scrapeDateLaunched(self, section):
 		try:
 			self.dateLaunched = section.find_all("p")[1].text.strip()
@@ -208,6 +458,7 @@ class ShopifyApp:
 			if self.options.verbose: print(errorMessage, "\n", e)
 			self.logError(errorMessage)
 
+	@metrics.timed("scrapeCategories")
 	def scrapeCategories(self, section):
 		try:
 			categories = list(map(lambda link: link.text.strip(), section.find_all("a", href=True)))
@@ -217,6 +468,7 @@ class ShopifyApp:
 			if self.options.verbose: print(errorMessage, "\n", e)
 			self.logError(errorMessage)
 
+	@metrics.timed("scrapeAboutSection")
 	def scrapeAboutSection(self):
 		try:
 			h2_tags = self.soup.find_all("h2")
@@ -237,9 +489,10 @@ class ShopifyApp:
 			if self.options.verbose: print(errorMessage, "\n", e)
 			self.logError(errorMessage)
 
+	@metrics.timed("scrapePricing")
 	def scrapePricing(self):
 		try:
-			priceOverview = self.soup.find("h1").parent.parent.parent.contents[3].find("div")
+			priceOverview = self.getHeading().parent.parent.parent.contents[3].find("div")
 			isFree = "Price: Free" in str(priceOverview)
 
 			if isFree:
@@ -259,74 +512,237 @@ class ShopifyApp:
 			if self.options.verbose: print(errorMessage, "\n", e)
 			self.logError(errorMessage)
 
-	def getReviewBlocks(self, reviewUrl):
-		reviewBlocks = []
-		for page in range(1,1000):
-			url = "https://apps.shopify.com{}&page={}".format(reviewUrl, page)
-			response = requests.get(url)
-			html = response.content.decode()
-			self.soup = BeautifulSoup(html, "html.parser")
-			reviewTextBlocks = self.soup.find_all("p", {"class": "tw-break-words"})
-
-			if (len(reviewTextBlocks) == 0): break
-
-			lastBlock = None
-			for idx, reviewTextBlock in enumerate(reviewTextBlocks):
-				reviewBlock = reviewTextBlock.parent.parent.parent
-				if reviewBlock != lastBlock:
-					reviewBlocks.append(reviewBlock)
-					lastBlock = reviewBlock
-
-					self.numberOfReviewsScraped += 1
-					printProgressBar(
-						self.numberOfReviewsScraped,
-						self.reviewCount,
-						prefix="{}/{} reviews".format(self.numberOfReviewsScraped, self.reviewCount)
-					)
-
-			if (self.options.testModeOn and page > 2): break
-
+	def fetchAndParseReviewPage(self, url, headers=None):
+		with metrics.timer("fetchReviewPage"):
+			response = self.options.client.get(url, headers=headers)
+		# a throttled or failed page would otherwise parse as an empty one and end the bucket early
+		if response.status_code in RETRY_STATUSES:
+			raise Exception("Failed to fetch review page ({})".format(response.status_code))
+		with metrics.timer("parseReviewPage"):
+			reviews = self.options.reviewPageParser(response.content)
+		return response, reviews
+
+	def fetchReviewPage(self, reviewUrl, page):
+		url = "https://apps.shopify.com{}&sort_by=newest&page={}".format(reviewUrl, page)
+		frameHeaders = self.options.reviewFrame.getHeaders()
+		response, reviews = self.fetchAndParseReviewPage(url, frameHeaders)
+
+		if frameHeaders is None:
+			self.options.reviewFrame.learn(response.content, len(reviews))
+		elif len(reviews) == 0:
+			# an empty fragment is either past the last review or not the review list, the full page tells which
+			response, reviews = self.fetchAndParseReviewPage(url)
+			if len(reviews) > 0: self.options.reviewFrame.reject()
+			frameHeaders = None
+
+		wireBytes = getattr(response, "wireBytes", 0)
+		reviewPageStats.record(wireBytes, len(response.content), frameHeaders is not None)
+		metrics.inc("review_pages_total", fragment="true" if frameHeaders is not None else "false")
+		metrics.inc("review_page_bytes_total", wireBytes, encoding="wire")
+		metrics.inc("review_page_bytes_total", len(response.content), encoding="decoded")
+
+		# the rate limiter already paces requests, only sleep when running without one
+		if self.options.client.rateLimiter is None:
 			sleep(self.options.throttleTime)
 
-		return reviewBlocks
+		return reviews
+
+	def fetchReviewPagesInOrder(self, reviewUrl, pages, window=None):
+		# without a rate limiter the throttle sleep is the only pacing, so fetch one page at a time
+		workers = self.options.reviewPageWorkers if self.options.client.rateLimiter is not None else 1
+		if window is not None: workers = min(workers, window)
+		workers = max(1, workers)
+		pages = iter(pages)
+
+		with ThreadPoolExecutor(max_workers=workers) as executor:
+			pending = deque(executor.submit(self.fetchReviewPage, reviewUrl, page) for page in islice(pages, workers))
+			try:
+				while pending:
+					reviews = pending.popleft().result()
+					nextPage = next(pages, None)
+					if nextPage is not None:
+						pending.append(executor.submit(self.fetchReviewPage, reviewUrl, nextPage))
+					yield reviews
+			finally:
+				for future in pending: future.cancel()
+
+	def iterReviewPages(self, reviewUrl, reviewCount, countIsExact=True):
+		pageCount = min(math.ceil(reviewCount / REVIEWS_PER_PAGE), MAX_REVIEW_PAGES)
+		if self.options.testModeOn: pageCount = min(pageCount, 3)
+
+		lastPageSize = 0
+		for reviews in self.fetchReviewPagesInOrder(reviewUrl, range(1, pageCount + 1)):
+			self.updateReviewProgress(len(reviews))
+			lastPageSize = len(reviews)
+			yield reviews
+
+		# abbreviated counts ("1.2k") are rounded, so keep paging while pages come back full
+		page = pageCount
+		while not countIsExact and not self.options.testModeOn and lastPageSize >= REVIEWS_PER_PAGE and page < MAX_REVIEW_PAGES:
+			page += 1
+			reviews = self.fetchReviewPage(reviewUrl, page)
+			self.updateReviewProgress(len(reviews))
+			lastPageSize = len(reviews)
+			yield reviews
+
+	def fetchNewReviews(self, reviewUrl, knownFingerprints, expectedNewReviews):
+		"""
+        Pages through a bucket newest first until it reaches a review that was
+        already scraped. Returns the reviews before it and whether it was reached
+        """
+		maxPages = 3 if self.options.testModeOn else MAX_REVIEW_PAGES
+		window = math.ceil(expectedNewReviews / REVIEWS_PER_PAGE) + 1
+
+		newReviews = []
+		with closing(self.fetchReviewPagesInOrder(reviewUrl, range(1, maxPages + 1), window)) as reviewPages:
+			for reviews in reviewPages:
+				knownIndex = next((index for index, text in enumerate(reviews) if reviewFingerprint(text) in knownFingerprints), None)
+				pageNewReviews = reviews if knownIndex is None else reviews[:knownIndex]
+				newReviews.extend(pageNewReviews)
+				self.updateReviewProgress(len(pageNewReviews))
+
+				if knownIndex is not None: return newReviews, True
+				if len(reviews) < REVIEWS_PER_PAGE: break
+
+		return newReviews, False
+
+	def iterPreviousReviews(self, key, previousBucket):
+		if len(previousBucket.get('content', [])) > 0:
+			content = previousBucket['content']
+			for start in range(0, len(content), REVIEWS_PER_PAGE):
+				yield content[start:start + REVIEWS_PER_PAGE]
+		elif self.previous.get('reviewsFile') is not None and os.path.isfile(self.previous['reviewsFile']):
+			for records in batched(readReviews(self.previous['reviewsFile']), REVIEWS_PER_PAGE):
+				yield [record['text'] for record in records if record['star'] == key]
+
+	def updateReviewProgress(self, numberOfReviews):
+		self.numberOfReviewsScraped += numberOfReviews
+		metrics.inc("reviews_total", numberOfReviews)
+		if self.options.showProgress and numberOfReviews > 0:
+			printProgressBar(
+				self.numberOfReviewsScraped,
+				self.reviewCount,
+				prefix="{}/{} reviews".format(self.numberOfReviewsScraped, self.reviewCount)
+			)
+
+	def collectReviews(self, stream, key, reviewPages):
+		content = []
+		fingerprints = []
+		numberOfReviews = 0
+		for pageReviews in reviewPages:
+			if len(pageReviews) == 0: continue
+			if stream is not None:
+				stream.writePage(key, pageReviews)
+			else:
+				content.extend(pageReviews)
+			numberOfReviews += len(pageReviews)
+
+			for text in pageReviews[:REVIEW_FINGERPRINTS - len(fingerprints)]:
+				fingerprints.append(reviewFingerprint(text))
+
+		bucket = {'content': content, 'fingerprints': fingerprints}
+		if stream is not None: bucket['streamed'] = numberOfReviews
+		return bucket
+
+	def refreshReviewBucket(self, stream, key, reviewUrl, reviewCount, countIsExact, previousBucket):
+		previousContent = previousBucket.get('content', [])
+		previousNumberOfReviews = previousBucket.get('streamed', len(previousContent))
+		fingerprints = previousBucket.get('fingerprints') or [reviewFingerprint(text) for text in previousContent[:REVIEW_FINGERPRINTS]]
+		if len(fingerprints) == 0: return None
+
+		if reviewCount == previousBucket.get('count'):
+			newReviews, reachedKnown = [], True
+		else:
+			expectedNewReviews = max(reviewCount - previousBucket.get('count', 0), 0)
+			newReviews, reachedKnown = self.fetchNewReviews(reviewUrl, set(fingerprints), expectedNewReviews)
 
-	def getReviewContent(self, reviewUrl):
-		reviewBlocks = self.getReviewBlocks(reviewUrl)
+		if not reachedKnown:
+			# none of the known reviews are listed anymore, so the pages just fetched are the whole bucket
+			return self.collectReviews(stream, key, [newReviews])
 
+		# the stored copy is missing reviews (e.g. it came from a test mode or failed run), rescrape in full
+		if countIsExact and not self.options.testModeOn and len(newReviews) + previousNumberOfReviews < reviewCount:
+			return None
+
+		return self.collectReviews(stream, key, chain([newReviews], self.iterPreviousReviews(key, previousBucket)))
+
+	def scrapeReviewBucket(self, stream, key, reviewUrl, reviewCount, countIsExact):
+		previousBucket = None
+		if self.previous is not None:
+			previousBucket = self.previous.get('reviews', {}).get(key)
+
+		bucket = None
+		if previousBucket is not None:
+			bucket = self.refreshReviewBucket(stream, key, reviewUrl, reviewCount, countIsExact, previousBucket)
+		if bucket is None:
+			bucket = self.collectReviews(stream, key, self.iterReviewPages(reviewUrl, reviewCount, countIsExact))
+
+		bucket['count'] = reviewCount
+		return bucket
+
+	def getReviewContent(self, reviewUrl, reviewCount, countIsExact=True):
 		reviews = []
-		for reviewBlock in reviewBlocks:
-			reviewTextParent = reviewBlock.find("p", {"class": "tw-break-words"}).parent
-			paragraphBlocks = reviewTextParent.find_all("p")
-			
-			paragraphs = []
-			for block in paragraphBlocks:
-				paragraphs.append(block.text.strip() + "\n")
-
-			reviews.append("".join(paragraphs))
-		
+		for pageReviews in self.iterReviewPages(reviewUrl, reviewCount, countIsExact):
+			reviews.extend(pageReviews)
 		return reviews
 
-	def scrapeReviews(self):
+	@metrics.timed("readReviewMetrics")
+	def readReviewMetrics(self):
 		if self.options.omitReviews: return
 
 		try:
 			appReviewMetricsSection = self.soup.find("div", {"class": "app-reviews-metrics"})
 			ratingBlocks = appReviewMetricsSection.find_all("li")
 
-			reviewData = {}
+			reviewBuckets = []
 			for index, ratingBlock in enumerate(ratingBlocks):
 				ratingBlockChildren = [i for i in ratingBlock.contents if i != "\n"]
-				reviewCount = valueToInt(ratingBlockChildren[-1].find("span").text.strip())
+				reviewCountText = ratingBlockChildren[-1].find("span").text.strip()
+				reviewCount = valueToInt(reviewCountText)
+				countIsExact = not any(suffix in reviewCountText.lower() for suffix in ('k', 'm'))
 				linkBlock = ratingBlockChildren[-1].find("a", href=True)
 
 				key = "{}-star".format(5 - index)
-				reviewData[key] = {}
-				reviewData[key]['count'] = reviewCount
-				reviewData[key]['content'] = self.getReviewContent(linkBlock['href']) if linkBlock is not None else []
+				reviewUrl = linkBlock['href'] if linkBlock is not None else None
+				reviewBuckets.append((key, reviewCount, countIsExact, reviewUrl))
+
+			self.reviewBuckets = reviewBuckets
+		except Exception as e:
+			errorMessage = "Failed to scrape reviews"
+			if self.options.verbose: print(errorMessage, "\n", e)
+			self.logError(errorMessage, REVIEWS_SECTION)
+
+	@metrics.timed("scrapeReviewBuckets")
+	def scrapeReviewBuckets(self):
+		if self.options.omitReviews or self.reviewBuckets is None: return
+
+		stream = None
+		committed = False
+		try:
+			if self.options.reviewWriter is not None:
+				stream = self.options.reviewWriter.open(self.url)
+
+			reviewData = {}
+			for key, reviewCount, countIsExact, reviewUrl in self.reviewBuckets:
+				if reviewUrl is None:
+					reviewData[key] = {'count': reviewCount, 'content': [], 'fingerprints': []}
+					if stream is not None: reviewData[key]['streamed'] = 0
+					continue
+
+				reviewData[key] = self.scrapeReviewBucket(stream, key, reviewUrl, reviewCount, countIsExact)
 
 			self.reviews = reviewData
-			flushProgressBar()
+			# only point at the new file once it replaces the previous one
+			if stream is not None: self.reviewsFile = stream.path
+			committed = True
+			if self.options.showProgress: flushProgressBar()
 		except Exception as e:
 			errorMessage = "Failed to scrape reviews"
 			if self.options.verbose: print(errorMessage, "\n", e)
-			self.logError(errorMessage)
\ No newline at end of file
+			self.logError(errorMessage, REVIEWS_SECTION)
+		finally:
+			if stream is not None: stream.close(commit=committed)
+
+	def scrapeReviews(self):
+		self.readReviewMetrics()
+		self.scrapeReviewBuckets()
\ No newline at end of file
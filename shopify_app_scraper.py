@@ -1,19 +1,43 @@
-from shopify import ShopifyApp
-from tinydb import TinyDB, Query
-from time import sleep
-import configparser
+from shopify_engine import ScrapeEngine, AppAcknowledger, addScrapeArguments, appOptionsFromArgs, logAppErrors
+from shopify import reviewPageStats
+from rate_limiter import addRateLimitArguments, rateLimiterFromArgs
+from http_client import sharedClient
+from http_cache import addCacheArguments, openCacheFromArgs
+from storage import OUTPUT_DIR, STORAGE_FILES, REVIEWS_DIR, addStorageArguments, openStorageFromArgs, migrateTinyDb
+from checkpoint import CheckpointStore, migrateLastIndexFile
+from work_queue import addQueueArguments, openQueueFromArgs
+from metrics import metrics, addMetricsArguments, startMetricsFromArgs
+from refresh_scheduler import RefreshScheduler, getAppSnapshot, getRecordSnapshot, getScrapeCost
+from failure_queue import FailureQueue, mergeSections, getRecordToStore
+from time import sleep, time
 import argparse
+import shutil
 import os
 
 parser = argparse.ArgumentParser(description='Shopify app marketplace scraper')
 parser.add_argument("-t", "--throttle", type=int, default=2, help="Throttle time (in seconds) bettween HTTP requests")
-parser.add_argument("-v", "--verbose", default=False, action=argparse.BooleanOptionalAction, help="Verbose error output")
-parser.add_argument("-tm", "--test-mode-on", default=False, action=argparse.BooleanOptionalAction, help="Only scrape maximum 2 pages per star review")
-parser.add_argument("-or", "--omit-reviews", default=False, action=argparse.BooleanOptionalAction, help="Don't scrape app reviews")
+parser.add_argument("-pw", "--parse-workers", type=int, default=0, help="Processes parsing HTML while threads fetch (0 parses in the fetching threads)")
+parser.add_argument("-i", "--incremental", default=False, action=argparse.BooleanOptionalAction, help="Only fetch reviews newer than the ones already stored for each app")
+parser.add_argument("-m", "--migrate-tinydb", default=False, action=argparse.BooleanOptionalAction, help="Copy the legacy TinyDB file into the selected storage backend and exit")
+parser.add_argument("-rb", "--refresh-budget", type=int, default=None, help="Refresh already scraped apps, spending at most this many requests on the ones most likely to have changed")
+parser.add_argument("--full-threshold", type=float, default=0.5, help="Chance an app changed from which a refresh rescrapes it without checking first")
+parser.add_argument("--check-threshold", type=float, default=0.05, help="Chance an app changed below which a refresh leaves it alone")
+parser.add_argument("-rt", "--retry-failed", default=False, action=argparse.BooleanOptionalAction, help="Retry only the failed sections of apps whose earlier scrapes had errors, and merge them into the stored apps")
+parser.add_argument("--retry-delay", type=float, default=60, help="Seconds before a failed app is first retried, doubling with each failed attempt")
+parser.add_argument("--retry-attempts", type=int, default=5, help="Failed attempts, the first scrape included, after which an app is given up on")
+parser.add_argument("--retry-wait", default=True, action=argparse.BooleanOptionalAction, help="Wait for apps still backing off instead of only retrying the ones due now")
 parser.add_argument("-r", "--reset", default=False, action=argparse.BooleanOptionalAction, help="Reset scraper...delete log, config, and db files")
+addScrapeArguments(parser)
+addStorageArguments(parser)
+addRateLimitArguments(parser)
+addCacheArguments(parser)
+addQueueArguments(parser)
+addMetricsArguments(parser)
 args = parser.parse_args()
 
-OUTPUT_DIR = "output"
+if args.queue is not None and args.storage != "sqlite":
+	parser.error("--queue needs --storage sqlite, the only backend several processes can write to")
+
 LOG_DIR = "log"
 CONFIG_DIR = "config"
 
@@ -24,50 +48,19 @@ if not os.path.exists(CONFIG_DIR): os.makedirs(CONFIG_DIR)
 APP_URLS_FILE = os.path.join(OUTPUT_DIR, "shopify_app_links.txt")
 LOG_FILE = os.path.join(LOG_DIR, "shopify_app_scraper.log")
 CONFIG_FILE = os.path.join(CONFIG_DIR, "shopify_app_scraper.ini")
+CHECKPOINT_FILE = os.path.join(CONFIG_DIR, "shopify_app_scraper.checkpoint.sqlite")
+REFRESH_FILE = os.path.join(CONFIG_DIR, "shopify_app_scraper.refresh.sqlite")
+FAILURES_FILE = os.path.join(CONFIG_DIR, "shopify_app_scraper.failures.sqlite")
 DB_FILE = os.path.join(OUTPUT_DIR, "shopify_apps.json")
 appUrls = []
 
-config = configparser.ConfigParser()
-db = TinyDB(DB_FILE)
-
-def initializePropertyFile():
-	config['DEFAULT'] = {'LastIndex': '0'}
-	with open(CONFIG_FILE, 'w') as configfile:
-		config.write(configfile)
-
-def getLastIndexProperty():
-	if not os.path.isfile(CONFIG_FILE):
-		initializePropertyFile()
-	config.read(CONFIG_FILE)
-	return int(config.get("DEFAULT", "lastIndex"))
-
-def setLastIndexProperty(index):
-	if not os.path.isfile(CONFIG_FILE):
-		initializePropertyFile()
-	config.read(CONFIG_FILE)
-	config.sections()
-	config.set("DEFAULT", "lastIndex", str(index))
-	with open(CONFIG_FILE, 'w') as configfile:
-	  	config.write(configfile)
-
 def loadAppUrls():
 	global appUrls
 	with open(APP_URLS_FILE, 'r') as file:
 		 appUrls = file.read().splitlines()
 
-def log(appUrl, errors):
-	with open(LOG_FILE, 'a') as logFile:
-		logFile.write("Failed to scrape " + appUrl + "\n")
-		for err in errors:
-			logFile.write("\t" + err + "\n")
-
-def throttle(index):
-	if (index+1) % 500 == 0:
-		sleep(args.throttle * 60 * 5)
-	elif (index+1) % 100 == 0:
-		sleep(args.throttle * 30)
-	else:
-		sleep(args.throttle)
+def getDefaultRequestsPerSecond():
+	return 1 / args.throttle if args.throttle > 0 else 0
 
 def printReport(totalAppUrls, numberOfAppsWithErrors, numberOfTotalErrors):
 	print("\n\n[+] Scraper Reports:")
@@ -79,6 +72,14 @@ def printReport(totalAppUrls, numberOfAppsWithErrors, numberOfTotalErrors):
 		print("[-] {} apps with errors".format(numberOfAppsWithErrors))
 		print("[-] {} total errors".format(numberOfTotalErrors))
 
+	stats = sharedClient.stats.summary()
+	print("[+] {} HTTP requests ({} retries, {} failed), {} served from cache".format(stats['requests'], stats['retries'], stats['failures'], stats['cacheHits']))
+	print("[+] {:.1f} MB received, {:.2f}s average latency".format(stats['wireBytes'] / 1e6, stats['avgLatency']))
+	reviewStats = reviewPageStats.summary()
+	if reviewStats['pages'] > 0:
+		print("[+] {} review pages ({} as fragments), {:.1f} KB transferred and {:.1f} KB parsed per page".format(
+			reviewStats['pages'], reviewStats['fragments'], reviewStats['wireBytesPerPage'] / 1e3, reviewStats['parsedBytesPerPage'] / 1e3))
+
 	print("\n[+] Done!\n")
 
 def reInitialize():
@@ -88,45 +89,259 @@ def reInitialize():
 	if os.path.exists(CONFIG_FILE):
 		os.remove(CONFIG_FILE)
 		print("deleted " + CONFIG_FILE)
-	if os.path.exists(DB_FILE):
-		db.close()
-		os.remove(DB_FILE)
-		print("deleted " + DB_FILE)
+	for dbFile in [CHECKPOINT_FILE, REFRESH_FILE, FAILURES_FILE, DB_FILE] + list(STORAGE_FILES.values()):
+		for path in [dbFile, dbFile + "-wal", dbFile + "-shm"]:
+			if os.path.exists(path):
+				os.remove(path)
+				print("deleted " + path)
+	if os.path.exists(REVIEWS_DIR):
+		shutil.rmtree(REVIEWS_DIR)
+		print("deleted " + REVIEWS_DIR)
+	if args.queue is not None:
+		for path in [args.queue, args.queue + "-wal", args.queue + "-shm"]:
+			if os.path.exists(path):
+				os.remove(path)
+				print("deleted " + path)
+
+def openAppStorage():
+	return openStorageFromArgs(args)
+
+def migrate():
+	if not os.path.isfile(DB_FILE):
+		print("[-] No TinyDB file found at " + DB_FILE)
+		return
+
+	storage = openAppStorage()
+	numberOfRecords = migrateTinyDb(DB_FILE, storage)
+	print("[+] Migrated {} records ({} unique apps) from {} to {}".format(numberOfRecords, len(storage), DB_FILE, storage.path))
+	storage.close()
+
+def configureClient(cacheReads=True):
+	sharedClient.configure(
+		poolSize=args.concurrency * args.review_page_workers,
+		retries=args.retries,
+		timeout=(10, args.timeout),
+		rateLimiter=rateLimiterFromArgs(args, getDefaultRequestsPerSecond()),
+		cache=openCacheFromArgs(args, writeOnly=not cacheReads)
+	)
+
+def getAppOptions():
+	return appOptionsFromArgs(args, throttle=args.throttle, showProgress=args.concurrency == 1)
+
+def refresh():
+	"""
+    Spends at most `refresh_budget` requests on the stored apps most likely to
+    have changed: the stalest are rescraped incrementally, the rest of the
+    budget goes to metadata-only checks, and apps a check finds changed or new
+    are rescraped with what is left over. The plan's costs are estimates, apps
+    stop being started once the requests actually sent reach the budget
+    """
+	storage = openAppStorage()
+	scheduler = RefreshScheduler(REFRESH_FILE, fullThreshold=args.full_threshold, checkThreshold=args.check_threshold)
+	loadAppUrls()
+	# a membership test on storage loads the whole record, reviews included, so look the URLs up once
+	storedUrls = set(storage.urls())
+	refreshPlan = scheduler.plan(appUrls, args.refresh_budget, storedUrls.__contains__)
+	print("[+] Refresh plan: {} full scrapes, {} checks, {} apps left alone ({} of {} requests)".format(
+		len(refreshPlan.full), len(refreshPlan.check), refreshPlan.skipped, refreshPlan.cost, refreshPlan.budget))
+
+	configureClient()
+	appOptions = getAppOptions()
+	numberOfAppsWithErrors = 0
+	numberOfTotalErrors = 0
+	numberOfChangedApps = 0
+	numberOfDeferredApps = 0
+	changedApps = []
+	lookedAt = set()
+	requestsAtStart = sharedClient.stats.requests
+
+	def withinBudget(urls):
+		nonlocal numberOfDeferredApps
+		for index, url in enumerate(urls):
+			if sharedClient.stats.requests - requestsAtStart >= refreshPlan.budget:
+				numberOfDeferredApps += len(urls) - index
+				return
+			yield url
+
+	def onChecked(app):
+		nonlocal numberOfAppsWithErrors, numberOfTotalErrors, numberOfChangedApps
+		lookedAt.add(app.url)
+		if len(app.errors) > 0:
+			logAppErrors(LOG_FILE, app.url, app.errors)
+			numberOfAppsWithErrors += 1
+			numberOfTotalErrors += len(app.errors)
+			return
+
+		isStored = app.url in storedUrls
+		# the stored record is only compared against for an app the scheduler has no history of yet
+		previous = storage.get(app.url) if isStored and scheduler.getRow(app.url) is None else None
+		previousSnapshot = getRecordSnapshot(previous) if previous is not None else None
+		snapshot = getAppSnapshot(app)
+		previousCounts = (previousSnapshot['buckets'] if previousSnapshot is not None else scheduler.getLastCounts(app.url)) if isStored else None
+		scrapeCost = getScrapeCost(snapshot['buckets'], previousCounts)
+
+		changed = scheduler.observe(app.url, snapshot, False, previousSnapshot)
+		metrics.inc("refresh_checks_total", changed="true" if changed else "false")
+		print("[check] {} {}".format(app.url, "changed" if changed else "unchanged" if isStored else "new"))
+		if changed: numberOfChangedApps += 1
+		# a new app is only checked to cost its full scrape from the bucket counts on its page
+		if (changed or not isStored) and refreshPlan.spend(scrapeCost):
+			changedApps.append(app.url)
+
+	def onScraped(app):
+		nonlocal numberOfAppsWithErrors, numberOfTotalErrors
+		lookedAt.add(app.url)
+		if len(app.errors) > 0:
+			logAppErrors(LOG_FILE, app.url, app.errors)
+			numberOfAppsWithErrors += 1
+			numberOfTotalErrors += len(app.errors)
+			return
+
+		storage.upsert(app.toRecord())
+		changed = scheduler.observe(app.url, getAppSnapshot(app), True)
+		metrics.inc("refresh_scrapes_total", changed="true" if changed else "false")
+		print("[full] {} {}".format(app.url, "changed" if changed else "unchanged"))
+
+	metricsDumper = startMetricsFromArgs(args)
+	try:
+		# checks only read the app page, review buckets are left for the full scrape
+		ScrapeEngine(args.concurrency, appOptions=dict(appOptions, deferReviews=True)).run(withinBudget(refreshPlan.check), onChecked)
+		ScrapeEngine(args.concurrency, appOptions=appOptions, getPrevious=storage.get, parseWorkers=args.parse_workers).run(
+			withinBudget(refreshPlan.full + changedApps), onScraped)
+	finally:
+		storage.close()
+		scheduler.close()
+		if metricsDumper is not None: metricsDumper.stop()
+
+	print("\n[+] {} checked apps had changed, {} changed or new apps rescraped within the budget".format(numberOfChangedApps, len(changedApps)))
+	if numberOfDeferredApps > 0:
+		print("[+] {} requests sent, {} planned apps left for the next refresh".format(sharedClient.stats.requests - requestsAtStart, numberOfDeferredApps))
+	printReport(len(lookedAt), numberOfAppsWithErrors, numberOfTotalErrors)
+
+def openFailureQueue():
+	return FailureQueue(FAILURES_FILE, maxAttempts=args.retry_attempts, baseDelay=args.retry_delay)
+
+def retryFailed():
+	"""
+    Retries the apps of the failure queue once their backoff is over. Only the
+    sections that failed are scraped again, and merged into the stored record
+    """
+	storage = openAppStorage()
+	failures = openFailureQueue()
+	# a page that failed to parse would come back from the cache unchanged, so retries always fetch it again
+	configureClient(cacheReads=False)
+	retrying = {}
+	numberOfRecoveredApps = 0
+	numberOfAttempts = 0
+	numberOfTotalErrors = 0
+
+	def onResult(app):
+		nonlocal numberOfRecoveredApps, numberOfAttempts, numberOfTotalErrors
+		failedApp = retrying.pop(app.url)
+		storage.upsert(mergeSections(storage.get(app.url), app, failedApp.retriedSections))
+		sections = failures.record(app)
+		numberOfAttempts += 1
+		metrics.inc("app_retries_total", status="error" if len(sections) > 0 else "ok")
+		if len(sections) > 0:
+			logAppErrors(LOG_FILE, app.url, app.errors)
+			numberOfTotalErrors += len(app.errors)
+		else:
+			numberOfRecoveredApps += 1
+		print("[retry] {} {} (retried {}, {:.2f} req/s)".format(
+			app.url, "failed again: " + ", ".join(sections) if len(sections) > 0 else "recovered", ", ".join(failedApp.retriedSections), sharedClient.getCurrentRate()))
+
+	engine = ScrapeEngine(args.concurrency, appOptions=getAppOptions(), getPrevious=storage.get, getAppOptions=lambda url: retrying[url].getAppOptions())
+	metricsDumper = startMetricsFromArgs(args)
+	try:
+		while True:
+			dueApps = failures.due()
+			if len(dueApps) == 0:
+				nextAttemptAt = failures.nextAttemptAt()
+				if nextAttemptAt is None or not args.retry_wait: break
+				sleep(max(0.0, nextAttemptAt - time()))
+				continue
+
+			retrying.update((failedApp.url, failedApp) for failedApp in dueApps)
+			engine.run([failedApp.url for failedApp in dueApps], onResult)
+	finally:
+		storage.close()
+		if metricsDumper is not None: metricsDumper.stop()
+
+	counts = failures.counts()
+	failures.close()
+	print("\n[+] {} retries, {} apps recovered, {} still failing, {} given up on (see {})".format(
+		numberOfAttempts, numberOfRecoveredApps, counts['pending'], counts['givenUp'], LOG_FILE))
+	printReport(numberOfAttempts, numberOfAttempts - numberOfRecoveredApps, numberOfTotalErrors)
 
 def main():
+	storage = openAppStorage()
+	queue = openQueueFromArgs(args)
+	failures = openFailureQueue()
+	checkpoint = None
 	loadAppUrls()
-	totalAppUrlCount = len(appUrls)
-	lastSearchedIdx = getLastIndexProperty()
-	remainingAppUrls = appUrls[lastSearchedIdx:]
+	totalAppUrlCount = len(set(appUrls))
+
+	if queue is not None:
+		queue.enqueue(appUrls)
+		numberOfAppsScraped = queue.progress()[0]
+		appUrlsToScrape = queue.iterLeased(args.worker_id)
+	else:
+		checkpoint = CheckpointStore(CHECKPOINT_FILE, batchSize=None)
+		migrateLastIndexFile(CONFIG_FILE, checkpoint, appUrls)
+		appUrlsToScrape = checkpoint.remaining(appUrls)
+		numberOfAppsScraped = totalAppUrlCount - len(appUrlsToScrape)
 
 	numberOfAppsWithErrors = 0
 	numberOfTotalErrors = 0
+	finishedApps = AppAcknowledger(checkpoint, queue, args.worker_id)
+
+	def onResult(app):
+		nonlocal numberOfAppsWithErrors, numberOfTotalErrors, numberOfAppsScraped
+
+		flushed = storage.upsert(getRecordToStore(storage, app))
+		failures.record(app)
+		finishedApps.add(app)
+		metrics.inc("apps_total", status="error" if len(app.errors) > 0 else "ok")
+		# other queue workers wait on the apps this one holds, so they are written and released right away
+		if queue is not None and not flushed:
+			storage.flush()
+			flushed = True
+		if flushed: finishedApps.acknowledge()
+		numberOfAppsScraped += 1
+		print("[{}/{}] Scraped {} ({:.2f} req/s)".format(numberOfAppsScraped, totalAppUrlCount, app.url, sharedClient.getCurrentRate()))
 
-	for index, appUrl in enumerate(remainingAppUrls):
-		app = ShopifyApp(appUrl,
-			throttle=args.throttle,
-			verbose=args.verbose,
-			testModeOn=args.test_mode_on,
-			omitReviews=args.omit_reviews
-		)
-		db.insert(app.getData())
-		print("[{}/{}] Scraped {}"
-			.format(index + (totalAppUrlCount - len(remainingAppUrls)) + 1, totalAppUrlCount, appUrl))
-		
 		if len(app.errors) > 0:
-			log(appUrl, app.errors)
+			logAppErrors(LOG_FILE, app.url, app.errors)
 			numberOfAppsWithErrors += 1
 			numberOfTotalErrors += len(app.errors)
 
-		lastSearchedIdx += 1
-		setLastIndexProperty(lastSearchedIdx)
-		throttle(index)
+	configureClient()
+	engine = ScrapeEngine(args.concurrency, appOptions=getAppOptions(), getPrevious=storage.get if args.incremental else None, parseWorkers=args.parse_workers)
+	metricsDumper = startMetricsFromArgs(args)
+	try:
+		engine.run(appUrlsToScrape, onResult)
+	finally:
+		storage.close()
+		finishedApps.acknowledge()
+		failures.close()
+		if metricsDumper is not None: metricsDumper.stop()
 
-	initializePropertyFile()
+	if queue is not None:
+		queue.close()
+	else:
+		# a finished run starts over from the first app next time
+		checkpoint.reset()
+		checkpoint.close()
 	printReport(totalAppUrlCount, numberOfAppsWithErrors, numberOfTotalErrors)
 
 if __name__ == "__main__":
 	if args.reset:
 		reInitialize()
+	elif args.migrate_tinydb:
+		migrate()
+	elif args.retry_failed:
+		retryFailed()
+	elif args.refresh_budget is not None:
+		refresh()
 	else:
 		main()
\ No newline at end of file
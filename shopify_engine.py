@@ -0,0 +1,187 @@
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from shopify import PARSERS, DEFAULT_PARSER, ShopifyApp, ReviewFrame, fetchAppHtml, parseAppPage, parseReviewPage, countAppErrors
+from http_client import sharedClient
+from review_stream import ReviewStreamWriter
+from storage import REVIEWS_DIR
+from metrics import metrics
+from contextlib import nullcontext
+import argparse
+import asyncio
+
+class PooledReviewPageParser:
+	"""
+    Review page parser that hands the HTML to a process pool and blocks the
+    calling fetch thread until the parsed reviews come back
+    """
+	def __init__(self, parsePool, parser=None):
+		self.parsePool = parsePool
+		self.parser = parser
+
+	def __call__(self, html):
+		return self.parsePool.submit(parseReviewPage, html, self.parser).result()
+
+class ScrapeEngine:
+	"""
+    Keeps up to `concurrency` ShopifyApp scrapes in flight at once. Each scrape
+    runs in a worker thread; results are handed back to `onResult` on the event
+    loop thread one at a time, so callers can write to the DB without locking
+    @params:
+        concurrency - Required  : number of apps scraped at the same time (Int)
+        appOptions  - Optional  : keyword arguments passed to ShopifyApp (Dict)
+        getPrevious - Optional  : returns the stored record of an app URL, enables incremental re-scrapes (Function)
+        parseWorkers- Optional  : processes parsing HTML while the threads only fetch, 0 parses in the fetching thread (Int)
+        getAppOptions-Optional  : returns ShopifyApp keyword arguments of one app URL on top of appOptions, not supported with parseWorkers (Function)
+    """
+	def __init__(self, concurrency, appOptions=None, getPrevious=None, parseWorkers=0, getAppOptions=None):
+		self.concurrency = max(1, concurrency)
+		self.appOptions = appOptions or {}
+		self.getPrevious = getPrevious
+		self.parseWorkers = parseWorkers if getAppOptions is None else 0
+		self.getAppOptions = getAppOptions
+
+	def getPreviousRecord(self, appUrl):
+		return self.getPrevious(appUrl) if self.getPrevious is not None else None
+
+	def scrapeApp(self, appUrl):
+		appOptions = self.appOptions if self.getAppOptions is None else dict(self.appOptions, **self.getAppOptions(appUrl))
+		return ShopifyApp(appUrl, previous=self.getPreviousRecord(appUrl), **appOptions)
+
+	def scrapeAppReviews(self, app, parsePool):
+		app.setOptions(reviewPageParser=PooledReviewPageParser(parsePool, self.appOptions.get('parser')), **self.appOptions)
+		app.previous = self.getPreviousRecord(app.url)
+		app.scrapeReviewBuckets()
+		return app
+
+	async def scrapeAppWithParsePool(self, loop, executor, parsePool, appUrl):
+		# fetch on an I/O thread, parse the app page in a worker process, then fetch reviews on the
+		# I/O thread again while their pages are parsed in the pool
+		client = self.appOptions.get('client') or sharedClient
+		verbose = self.appOptions.get('verbose', False)
+		html, fetchError = await loop.run_in_executor(executor, fetchAppHtml, client, appUrl, verbose)
+		app = await loop.run_in_executor(parsePool, parseAppPage, appUrl, html, fetchError, self.appOptions.get('omitReviews', False), verbose, self.appOptions.get('parser'))
+		# errors of the parse happened in the worker process, whose metrics are its own
+		countAppErrors(app.errors)
+		return await loop.run_in_executor(executor, self.scrapeAppReviews, app, parsePool)
+
+	async def worker(self, loop, executor, parsePool, queue, idleWorkers, onResult):
+		while True:
+			appUrl = await queue.get()
+			try:
+				if appUrl is None: return
+				with metrics.timer("scrapeApp"):
+					if parsePool is not None:
+						app = await self.scrapeAppWithParsePool(loop, executor, parsePool, appUrl)
+					else:
+						app = await loop.run_in_executor(executor, self.scrapeApp, appUrl)
+				onResult(app)
+			finally:
+				queue.task_done()
+				if appUrl is not None: idleWorkers.release()
+
+	async def produce(self, loop, appUrls, queue, idleWorkers, numberOfWorkers):
+		# appUrls may be a lazy source such as a work queue, so pull from it off the loop thread, and only
+		# once a worker is free to start on the URL: a leased queue item mustn't sit in a buffer meanwhile
+		appUrlIterator = iter(appUrls)
+		while True:
+			await idleWorkers.acquire()
+			appUrl = await loop.run_in_executor(None, next, appUrlIterator, None)
+			if appUrl is None: break
+			await queue.put(appUrl)
+		for _ in range(numberOfWorkers):
+			await queue.put(None)
+
+	async def runAsync(self, appUrls, onResult):
+		loop = asyncio.get_running_loop()
+		# never holds more than one URL per worker plus the end markers, idleWorkers bounds it
+		queue = asyncio.Queue()
+		idleWorkers = asyncio.Semaphore(self.concurrency)
+
+		parsePoolContext = ProcessPoolExecutor(max_workers=self.parseWorkers) if self.parseWorkers > 0 else nullcontext()
+		with ThreadPoolExecutor(max_workers=self.concurrency) as executor, parsePoolContext as parsePool:
+			workers = [
+				asyncio.create_task(self.worker(loop, executor, parsePool, queue, idleWorkers, onResult))
+				for _ in range(self.concurrency)
+			]
+			producer = asyncio.create_task(self.produce(loop, appUrls, queue, idleWorkers, len(workers)))
+
+			try:
+				await asyncio.gather(producer, *workers)
+			except BaseException:
+				# a dead worker never takes from the queue again, so the producer would block on it forever
+				for task in [producer] + workers: task.cancel()
+				raise
+
+	def run(self, appUrls, onResult):
+		"""
+        Scrapes `appUrls` (any iterable) and calls onResult(app) as each app finishes, in completion order
+        """
+		asyncio.run(self.runAsync(appUrls, onResult))
+
+class AppAcknowledger:
+	"""
+    Finished apps waiting for the storage batch holding them to be on disk
+    before they are marked in the checkpoint, or completed in the work queue,
+    so a crash never skips an app whose record wasn't written yet
+    @params:
+        checkpoint  - Optional  : finished apps of a single-process run (CheckpointStore)
+        queue       - Optional  : work queue shared with other workers, used instead of the checkpoint (WorkQueue)
+        workerId    - Optional  : id the queue items are leased under (Str)
+    """
+	def __init__(self, checkpoint=None, queue=None, workerId=None):
+		self.checkpoint = checkpoint
+		self.queue = queue
+		self.workerId = workerId
+		self.unacknowledgedApps = []
+
+	def add(self, app):
+		self.unacknowledgedApps.append((app.url, list(app.errors)))
+
+	def acknowledge(self):
+		"""
+        Acknowledges every app added so far, callers flush storage first
+        """
+		if self.queue is not None:
+			self.queue.complete(self.workerId, [url for url, errors in self.unacknowledgedApps if len(errors) == 0])
+			for url, errors in self.unacknowledgedApps:
+				if len(errors) > 0: self.queue.fail(self.workerId, url, errors[0])
+		else:
+			for url, errors in self.unacknowledgedApps:
+				# apps with errors stay pending and are retried when a stopped run is resumed
+				self.checkpoint.mark(url, "done" if len(errors) == 0 else "failed")
+			self.checkpoint.flush()
+		self.unacknowledgedApps.clear()
+
+def logAppErrors(logFile, appUrl, errors):
+	with open(logFile, 'a') as file:
+		file.write("Failed to scrape " + appUrl + "\n")
+		for err in errors:
+			file.write("\t" + err + "\n")
+
+def addScrapeArguments(parser):
+	parser.add_argument("-c", "--concurrency", type=int, default=4, help="Number of apps scraped at the same time")
+	parser.add_argument("-p", "--parser", default=DEFAULT_PARSER, choices=PARSERS, help="HTML parser backend, lxml parses review pages many times faster but is opt-in (pip install lxml)")
+	parser.add_argument("-rw", "--review-page-workers", type=int, default=4, help="Number of review pages fetched at the same time per app")
+	parser.add_argument("-rf", "--review-frames", default=True, action=argparse.BooleanOptionalAction, help="Request review pages as Turbo-Frame fragments when the site serves them")
+	parser.add_argument("--retries", type=int, default=3, help="Retries on 429/5xx responses and connection errors")
+	parser.add_argument("--timeout", type=float, default=30, help="HTTP read timeout (in seconds)")
+	parser.add_argument("-v", "--verbose", default=False, action=argparse.BooleanOptionalAction, help="Verbose error output")
+	parser.add_argument("-tm", "--test-mode-on", default=False, action=argparse.BooleanOptionalAction, help="Only scrape maximum 2 pages per star review")
+	parser.add_argument("-or", "--omit-reviews", default=False, action=argparse.BooleanOptionalAction, help="Don't scrape app reviews")
+	parser.add_argument("-sr", "--stream-reviews", default=False, action=argparse.BooleanOptionalAction, help="Write reviews page by page to per-app JSONL files instead of the DB")
+
+def appOptionsFromArgs(args, throttle=0, showProgress=False):
+	"""
+    ShopifyApp keyword arguments of the options added by addScrapeArguments
+    """
+	return {
+		'throttle': throttle,
+		'verbose': args.verbose,
+		'testModeOn': args.test_mode_on,
+		'omitReviews': args.omit_reviews,
+		'client': sharedClient,
+		'showProgress': showProgress,
+		'reviewPageWorkers': args.review_page_workers,
+		'parser': args.parser,
+		'reviewFrame': ReviewFrame(enabled=args.review_frames),
+		'reviewWriter': ReviewStreamWriter(REVIEWS_DIR) if args.stream_reviews else None
+	}
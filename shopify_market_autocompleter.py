@@ -1,10 +1,27 @@
-import requests
+from http_client import sharedClient
+from http_cache import addCacheArguments, openCacheFromArgs
+from rate_limiter import addRateLimitArguments, rateLimiterFromArgs
+from checkpoint import CheckpointStore, migrateLastIndexFile
+from work_queue import addQueueArguments, openQueueFromArgs
+from metrics import metrics, addMetricsArguments, startMetricsFromArgs
+from term_store import TermStore
+from collections import deque
 import itertools
 import json
-import configparser
-from time import sleep
+import argparse
+import requests
 import os
 
+parser = argparse.ArgumentParser(description='Shopify app marketplace search term autocompleter')
+addRateLimitArguments(parser)
+addCacheArguments(parser)
+addQueueArguments(parser)
+addMetricsArguments(parser)
+parser.add_argument("--min-depth", type=int, default=1, help="Length of the prefixes the crawl starts from")
+parser.add_argument("--max-depth", type=int, default=5, help="Longest prefix the crawl expands to")
+parser.add_argument("--saturation", type=int, default=None, help="Result count at which a prefix is expanded (defaults to the largest result list seen so far)")
+parser.add_argument("--alphabet", default="abcdefghijklmnopqrstuvwxyz", help="Characters appended to a saturated prefix")
+
 OUTPUT_DIR = "output"
 LOG_DIR = "log"
 CONFIG_DIR = "config"
@@ -15,7 +32,9 @@ if not os.path.exists(CONFIG_DIR): os.makedirs(CONFIG_DIR)
 
 API_ENDPOINT = "https://apps.shopify.com/search/autocomplete"
 OUTPUT_FILE = os.path.join(OUTPUT_DIR, "shopify_search_terms.txt")
+TERMS_DB_FILE = os.path.join(OUTPUT_DIR, "shopify_search_terms.sqlite")
 CONFIG_FILE = os.path.join(CONFIG_DIR, "shopify_market_autocompleter.ini")
+CHECKPOINT_FILE = os.path.join(CONFIG_DIR, "shopify_market_autocompleter.checkpoint.sqlite")
 LOG_FILE = os.path.join(LOG_DIR, "shopify_market_autocompleter.log")
 
 params = {
@@ -23,77 +42,155 @@ params = {
 	"q": "",
 	"st_source": "autocomplete"
 }
-
-config = configparser.ConfigParser()
-
-def initializePropertyFile():
-	config['DEFAULT'] = {'LastIndex': '0'}
-	with open(CONFIG_FILE, 'w') as configfile:
-		config.write(configfile)
-
-def getLastIndexProperty():
-	config.read(CONFIG_FILE)
-	return int(config.get("DEFAULT", "lastIndex"))
-
-def setLastIndexProperty(index):
-	config.read(CONFIG_FILE)
-	config.sections()
-	config.set("DEFAULT", "lastIndex", str(index))
-	with open(CONFIG_FILE, 'w') as configfile:
-		config.write(configfile)
+termStore = None
+
+class SaturationDetector:
+	"""
+    Decides whether an autocomplete response was cut off at the endpoint's
+    result limit, in which case the prefix hides more terms behind longer prefixes
+    @params:
+        size    - Optional  : result count of a full response, None learns it from the largest response seen (Int)
+    """
+	def __init__(self, size=None):
+		self.size = size
+		self.largest = 0
+
+	def isSaturated(self, numberOfTerms):
+		if self.size is not None:
+			return numberOfTerms >= self.size
+		self.largest = max(self.largest, numberOfTerms)
+		return numberOfTerms > 0 and numberOfTerms >= self.largest
 
 def generateThreeLetterKeywords():
 	alphabets = ['a', 'b', 'c', 'd', 'e', 'f', 'g', 'h', 'i', 'j', 'k', 'l', 'm', 'n', 'o', 'p', 'q', 'r', 's', 't', 'u', 'v', 'w', 'x', 'y', 'z']
-	keywords = itertools.product(alphabets, repeat = 3)
 	return [''.join(i) for i in itertools.product(alphabets, repeat = 3)]
 
-def getSearchTermsFromAutoComplete(keyword):
-	params["q"] = keyword
-	response = requests.get(API_ENDPOINT, params=params)
+def generatePrefixes(depth, alphabet):
+	return [''.join(i) for i in itertools.product(alphabet, repeat = depth)]
 
+def childPrefixes(prefix, alphabet):
+	return [prefix + letter for letter in alphabet]
+
+def getSearchTermsFromAutoComplete(keyword):
+	"""
+    Returns the autocomplete suggestions for `keyword`, or None when the request failed
+    """
 	searchTerms = []
-	if response.status_code == 200:
-		try:
+
+	try:
+		with metrics.timer("fetchAutocomplete"):
+			# a copy per request, the pipeline queries several prefixes at once
+			response = sharedClient.get(API_ENDPOINT, params=dict(params, q=keyword))
+	except requests.RequestException:
+		response = None
+	if response is None or response.status_code != 200:
+		with open(LOG_FILE, 'a') as logFile:
+			logFile.write("HTTP Error for keyword '" + keyword + "'\n")
+		return None
+
+	try:
+		with metrics.timer("parseAutocomplete"):
 			body = response.content.decode('utf8').replace("'", '"')
 			jsonObj = json.loads(body)
-			
-			if 'searches' in jsonObj:
-				searches = jsonObj['searches']
-				for searchObj in searches:
-					searchTerms.append(searchObj['name'])
-		except:
-			with open(LOG_FILE, 'a') as logFile:
-	  			logFile.write("Failed to get search terms for keyword '" + keyword + "'\n")
+		
+		if 'searches' in jsonObj:
+			searches = jsonObj['searches']
+			for searchObj in searches:
+				searchTerms.append(searchObj['name'])
+	except:
+		with open(LOG_FILE, 'a') as logFile:
+			logFile.write("Failed to get search terms for keyword '" + keyword + "'\n")
 
 	return searchTerms
 
 def saveTerms(terms):
+	# the text file mirrors the term store, so only terms never seen before are appended
+	newTerms = termStore.add(terms)
 	with open(OUTPUT_FILE, 'a') as outputFile:
-		for term in terms:
+		for term in newTerms:
 			outputFile.write(term + "\n")
-
-def throttle(index):
-	if (index+1) % 500 == 0:
-		sleep(60 * 5)
-	elif (index+1) % 100 == 0:
-		sleep(60)
-	else:
-		sleep(3)
+	return newTerms
+
+def scrapePrefix(prefix, saturation, progress):
+	"""
+    Queries `prefix` and saves its terms. Returns "expanded" when the response was
+    saturated and the prefix's children need crawling, "done", or "failed"
+    """
+	searchTerms = getSearchTermsFromAutoComplete(prefix)
+	if searchTerms is None:
+		print("{} Failed to get terms from.....{}".format(progress, prefix))
+		return "failed"
+
+	newTerms = saveTerms(searchTerms)
+	expand = saturation.isSaturated(len(searchTerms)) and len(prefix) < args.max_depth
+	metrics.inc("prefixes_total", expanded="true" if expand else "false")
+	metrics.inc("search_terms_saved_total", len(newTerms))
+	print("{} Got {} terms ({} new) from.....{}{} ({:.2f} req/s)".format(progress, len(searchTerms), len(newTerms), prefix, " (expanding)" if expand else "", sharedClient.getCurrentRate()))
+	return "expanded" if expand else "done"
+
+def runQueueWorker(queue, saturation):
+	queue.enqueue(generatePrefixes(args.min_depth, args.alphabet))
+	try:
+		for prefix in queue.iterLeased(args.worker_id):
+			finished, total = queue.progress()
+			state = scrapePrefix(prefix, saturation, "[{}/{}]".format(finished + 1, total))
+			if state == "failed":
+				queue.fail(args.worker_id, prefix, "HTTP error")
+				continue
+			# queue the children before releasing the prefix so idle workers see them
+			if state == "expanded": queue.enqueue(childPrefixes(prefix, args.alphabet))
+			queue.complete(args.worker_id, [prefix])
+	finally:
+		queue.close()
+
+def crawlPrefixes(checkpoint, saturation):
+	"""
+    Breadth-first walk of the prefix trie. The checkpoint holds the state of every
+    prefix queried so far, so the frontier of a stopped crawl is rebuilt by
+    replaying it without any requests
+    """
+	states = checkpoint.states()
+	frontier = deque(generatePrefixes(args.min_depth, args.alphabet))
+	numberOfQueries = 0
+
+	while len(frontier) > 0:
+		prefix = frontier.popleft()
+		state = states.get(prefix)
+		if state is None or state == "failed":
+			numberOfQueries += 1
+			state = scrapePrefix(prefix, saturation, "[{} queried, {} queued]".format(numberOfQueries, len(frontier)))
+			checkpoint.mark(prefix, state)
+		if state == "expanded":
+			frontier.extend(childPrefixes(prefix, args.alphabet))
+
+def openTermStore():
+	global termStore
+	termStore = TermStore(TERMS_DB_FILE)
+	# terms collected before the store existed, duplicates and all
+	if len(termStore) == 0 and os.path.isfile(OUTPUT_FILE):
+		termStore.importTextFile(OUTPUT_FILE)
 
 def main():
-	lastSearchedIdx = getLastIndexProperty()
-	keywords = generateThreeLetterKeywords()
-	keywords = keywords[lastSearchedIdx:]
-
-	for index, word in enumerate(keywords):
-		searchTerms = getSearchTermsFromAutoComplete(word)
-		print("[{}/{}] Got {} terms from.....{}".format(index + 1, len(keywords), len(searchTerms), word))
-		saveTerms(searchTerms)
-		
-		lastSearchedIdx += 1
-		setLastIndexProperty(lastSearchedIdx)
-		throttle(index)
+	saturation = SaturationDetector(args.saturation)
+	openTermStore()
+	queue = openQueueFromArgs(args)
+	if queue is not None:
+		runQueueWorker(queue, saturation)
+		return
+
+	checkpoint = CheckpointStore(CHECKPOINT_FILE)
+	migrateLastIndexFile(CONFIG_FILE, checkpoint, generateThreeLetterKeywords())
+
+	try:
+		crawlPrefixes(checkpoint, saturation)
+	finally:
+		checkpoint.close()
 
 if __name__ == "__main__":
-	# initializePropertyFile()
-    main()
\ No newline at end of file
+	args = parser.parse_args()
+	sharedClient.configure(rateLimiter=rateLimiterFromArgs(args, 1 / 3), cache=openCacheFromArgs(args))
+	metricsDumper = startMetricsFromArgs(args)
+	try:
+		main()
+	finally:
+		if metricsDumper is not None: metricsDumper.stop()
\ No newline at end of file
@@ -1,14 +1,31 @@
-import requests
+from http_client import sharedClient
+from http_cache import addCacheArguments, openCacheFromArgs
+from rate_limiter import addRateLimitArguments, rateLimiterFromArgs
+from checkpoint import CheckpointStore, migrateLastIndexFile
+from work_queue import addQueueArguments, openQueueFromArgs
+from metrics import metrics, addMetricsArguments, startMetricsFromArgs
+from term_store import TermStore, readTextTerms
+from term_scheduler import TermScheduler
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 from bs4 import BeautifulSoup
 from urllib.parse import quote, urlencode
-import configparser
-from time import sleep
+import argparse
 import os
 
+parser = argparse.ArgumentParser(description='Shopify app marketplace search scraper')
+addRateLimitArguments(parser)
+addCacheArguments(parser)
+addQueueArguments(parser)
+addMetricsArguments(parser)
+parser.add_argument("-mp", "--max-pages", type=int, default=5, help="Number of search result pages followed per term")
+parser.add_argument("-pw", "--page-workers", type=int, default=3, help="Number of result pages of a term fetched at the same time")
+parser.add_argument("--schedule", default=True, action=argparse.BooleanOptionalAction, help="Search the terms expected to find the most new apps first (--no-schedule keeps the stored order)")
+parser.add_argument("--min-discovery-rate", type=float, default=0.05, help="Stop once recent searches average fewer new app links than this (0 never stops)")
+parser.add_argument("--discovery-window", type=int, default=200, help="Number of recent searches the discovery rate is measured over")
+parser.add_argument("--skip-yield", type=float, default=0.02, help="Skip terms whose word and prefix families are expected to find fewer new links per search than this")
+
 ENDPOINT = "https://apps.shopify.com/search"
-params = {
-	"q": ""
-}
 headers = {
 	"Turbo-Frame": "search_page",
 	"User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/119.0.0.0 Safari/537.36",
@@ -27,39 +44,23 @@ if not os.path.exists(CONFIG_DIR): os.makedirs(CONFIG_DIR)
 
 OUTPUT_FILE = os.path.join(OUTPUT_DIR, "shopify_app_links.txt")
 SEARCH_TERMS_FILE = os.path.join(OUTPUT_DIR, "shopify_search_terms.txt")
+SEARCH_TERMS_DB_FILE = os.path.join(OUTPUT_DIR, "shopify_search_terms.sqlite")
 LOG_FILE = os.path.join(LOG_DIR, "shopify_market_scraper.log")
 CONFIG_FILE = os.path.join(CONFIG_DIR, "shopify_market_scraper.ini")
+CHECKPOINT_FILE = os.path.join(CONFIG_DIR, "shopify_market_scraper.checkpoint.sqlite")
 
-config = configparser.ConfigParser()
-searchTerms = []
+termStore = None
 linksTable = set()
-currentUrl = ""
-
-def initializePropertyFile():
-	config['DEFAULT'] = {'LastIndex': '0'}
-	with open(CONFIG_FILE, 'w') as configfile:
-		config.write(configfile)
-
-def getLastIndexProperty():
-	if not os.path.isfile(CONFIG_FILE):
-		initializePropertyFile()
-	config.read(CONFIG_FILE)
-	return int(config.get("DEFAULT", "lastIndex"))
-
-def setLastIndexProperty(index):
-	if not os.path.isfile(CONFIG_FILE):
-		initializePropertyFile()
-	config.read(CONFIG_FILE)
-	config.sections()
-	config.set("DEFAULT", "lastIndex", str(index))
-	with open(CONFIG_FILE, 'w') as configfile:
-	  	config.write(configfile)
+pageExecutor = None
+# app links on a full results page, learned from the largest page seen
+resultsPerPage = 0
 
 def loadSearchTerms():
-	global searchTerms
-	termsFile = open(SEARCH_TERMS_FILE, 'r')
-	searchTerms = termsFile.read().splitlines()
-	termsFile.close()
+	global termStore
+	termStore = TermStore(SEARCH_TERMS_DB_FILE)
+	# a terms file from before the store existed, duplicates and all
+	if len(termStore) == 0 and os.path.isfile(SEARCH_TERMS_FILE):
+		termStore.importTextFile(SEARCH_TERMS_FILE)
 
 def buildLinksTable():
 	global linksTable
@@ -73,7 +74,7 @@ def log(errorMessage):
 	with open(LOG_FILE, 'a') as logFile:
 	  	logFile.write(errorMessage + "\n")
 
-def extractLinksFromSoup(soup):
+def extractLinksFromSoup(soup, searchUrl):
 	links = []
 	try:
 		for linkBlock in soup.find_all("a"):
@@ -81,28 +82,60 @@ def extractLinksFromSoup(soup):
 			if "search_id" in link and link.count("/") == 3:
 				links.append(link)
 	except:
-	  	log("Scraper Error - " + currentUrl)
+	  	log("Scraper Error - " + searchUrl)
 	finally:
 		return links
 
-def getHtml(searchQuery):
-	global currentUrl
+def getSearchParams(searchQuery, page=1):
+	# page 1 keeps the original request so it shares cache entries with earlier runs
+	params = {"q": quote(searchQuery)}
+	if page > 1: params["page"] = page
+	return params
+
+def getSearchUrl(searchQuery, page=1):
+	return ENDPOINT + "?" + "&".join("{}={}".format(name, value) for name, value in getSearchParams(searchQuery, page).items())
+
+def getHtml(searchQuery, page=1):
 	html = ""
 	try:
-		params["q"] = quote(searchQuery)
-		currentUrl = ENDPOINT + "?q=" + params["q"]
-		response = requests.get(ENDPOINT, params=params, headers=headers)
+		response = sharedClient.get(ENDPOINT, params=getSearchParams(searchQuery, page), headers=headers)
 		if response.status_code == 200:
 			html = response.content.decode()
 	except:
-		log("HTTP Error - " + currentUrl)
+		log("HTTP Error - " + getSearchUrl(searchQuery, page))
 	finally:
 		return html
 
-def getAppLinksFromPage(searchQuery):
-	html = getHtml(searchQuery)
-	soup = BeautifulSoup(html, "html.parser")
-	return extractLinksFromSoup(soup)
+def getAppLinksFromPage(searchQuery, page=1):
+	with metrics.timer("fetchSearchPage"):
+		html = getHtml(searchQuery, page)
+	with metrics.timer("parseSearchPage"):
+		soup = BeautifulSoup(html, "html.parser")
+		return extractLinksFromSoup(soup, getSearchUrl(searchQuery, page))
+
+def isFullPage(links):
+	global resultsPerPage
+	resultsPerPage = max(resultsPerPage, len(links))
+	return len(links) > 0 and len(links) >= resultsPerPage
+
+def iterResultPages(searchQuery, maxPages, pageWorkers=1, executor=None):
+	"""
+    Yields the app links of each results page of `searchQuery` in page order.
+    Pages after the first are fetched `pageWorkers` at a time on `executor`
+    (one by one without it) and the walk stops at the first page that isn't full
+    """
+	links = getAppLinksFromPage(searchQuery)
+	yield links
+
+	if executor is None: pageWorkers = 1
+	nextPage = 2
+	while isFullPage(links) and nextPage <= maxPages:
+		pages = range(nextPage, min(nextPage + pageWorkers, maxPages + 1))
+		fetchPage = partial(getAppLinksFromPage, searchQuery)
+		for links in (executor.map(fetchPage, pages) if executor is not None else map(fetchPage, pages)):
+			yield links
+			if not isFullPage(links): return
+		nextPage = pages[-1] + 1
 
 def saveLinks(links):
 	global linksTable
@@ -117,30 +150,79 @@ def saveLinks(links):
 				linksTable.add(link)
 	return savedLinks
 
-def throttle(index):
-	if (index+1) % 500 == 0:
-		sleep(60 * 5)
-	elif (index+1) % 100 == 0:
-		sleep(60)
-	else:
-		sleep(3)
+def scrapeSearchTerm(term, position, total):
+	linksSaved = []
+	numberOfPages = 0
+	for links in iterResultPages(term, args.max_pages, args.page_workers, pageExecutor):
+		linksSaved += saveLinks(links)
+		numberOfPages += 1
+	metrics.inc("search_terms_total")
+	metrics.inc("search_pages_total", numberOfPages)
+	metrics.inc("app_links_saved_total", len(linksSaved))
+	print("[{}/{}] Scraped {} app links from {} ({} pages) ({:.2f} req/s)".format(position, total, len(linksSaved), getSearchUrl(term), numberOfPages, sharedClient.getCurrentRate()))
+	return linksSaved
+
+def runQueueWorker(queue):
+	queue.enqueue(termStore.iterTerms())
+	try:
+		for term in queue.iterLeased(args.worker_id):
+			finished, total = queue.progress()
+			scrapeSearchTerm(term, finished + 1, total)
+			queue.complete(args.worker_id, [term])
+	finally:
+		queue.close()
+
+def runScheduledSearch(checkpoint, doneTerms):
+	scheduler = TermScheduler(minDiscoveryRate=args.min_discovery_rate, window=args.discovery_window, skipBelow=args.skip_yield)
+	for term in termStore.iterTerms():
+		if term not in doneTerms: scheduler.add(term)
+
+	numberOfTerms = len(scheduler)
+	for index, term in enumerate(scheduler):
+		linksSaved = scrapeSearchTerm(term, index + 1, numberOfTerms)
+		scheduler.record(term, len(linksSaved))
+		checkpoint.markDone(term)
+
+	# skipped terms stay pending, a later run gets to them if their families start yielding again
+	for term in scheduler.skipped:
+		checkpoint.mark(term, "skipped")
+	print("\n[+] Skipped {} terms predicted to find no new apps".format(len(scheduler.skipped)))
+	if scheduler.stopReason is not None:
+		print("[+] Stopped with {} terms left, {}".format(len(scheduler), scheduler.stopReason))
 
 def main():
-	global searchTerms
+	global pageExecutor
 	loadSearchTerms()
 	buildLinksTable()
+	pageExecutor = ThreadPoolExecutor(max_workers=max(1, args.page_workers))
 
-	lastSearchedIdx = getLastIndexProperty()
-	searchTerms = searchTerms[lastSearchedIdx:]
+	queue = openQueueFromArgs(args)
+	if queue is not None:
+		runQueueWorker(queue)
+		return
 
-	for index, term in enumerate(searchTerms):
-		links = getAppLinksFromPage(term)
-		linksSaved = saveLinks(links)
-		print("[{}/{}] Scraped {} app links from {}".format(index + 1, len(searchTerms), len(linksSaved), currentUrl))
+	checkpoint = CheckpointStore(CHECKPOINT_FILE)
+	migrateLastIndexFile(CONFIG_FILE, checkpoint, readTextTerms(SEARCH_TERMS_FILE))
+	doneTerms = checkpoint.keysInState("done")
 
-		lastSearchedIdx += 1
-		setLastIndexProperty(lastSearchedIdx)
-		throttle(index)
+	try:
+		if args.schedule:
+			runScheduledSearch(checkpoint, doneTerms)
+			return
+
+		numberOfTerms = len(termStore)
+		for index, term in enumerate(termStore.iterTerms()):
+			if term in doneTerms: continue
+			scrapeSearchTerm(term, index + 1, numberOfTerms)
+			checkpoint.markDone(term)
+	finally:
+		checkpoint.close()
 
 if __name__ == "__main__":
-	main()
\ No newline at end of file
+	args = parser.parse_args()
+	sharedClient.configure(poolSize=max(10, args.page_workers), rateLimiter=rateLimiterFromArgs(args, 1 / 3), cache=openCacheFromArgs(args))
+	metricsDumper = startMetricsFromArgs(args)
+	try:
+		main()
+	finally:
+		if metricsDumper is not None: metricsDumper.stop()
\ No newline at end of file
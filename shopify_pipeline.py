@@ -0,0 +1,276 @@
+from shopify_engine import ScrapeEngine, AppAcknowledger, addScrapeArguments, appOptionsFromArgs, logAppErrors
+from rate_limiter import addRateLimitArguments, rateLimiterFromArgs
+from http_client import sharedClient
+from http_cache import addCacheArguments, openCacheFromArgs
+from storage import OUTPUT_DIR, addStorageArguments, openStorageFromArgs
+from checkpoint import CheckpointStore
+from failure_queue import FailureQueue, getRecordToStore
+from metrics import metrics, addMetricsArguments, startMetricsFromArgs
+from queue import Queue
+import shopify_market_autocompleter as autocompleter
+import shopify_market_scraper as marketScraper
+import threading
+import argparse
+import os
+
+parser = argparse.ArgumentParser(description='Shopify autocomplete, search and app scraping run as one streaming pipeline')
+addRateLimitArguments(parser)
+addCacheArguments(parser)
+addMetricsArguments(parser)
+parser.add_argument("--min-depth", type=int, default=1, help="Length of the prefixes the autocomplete crawl starts from")
+parser.add_argument("--max-depth", type=int, default=5, help="Longest prefix the autocomplete crawl expands to")
+parser.add_argument("--saturation", type=int, default=None, help="Autocomplete result count at which a prefix is expanded (defaults to the largest result list seen so far)")
+parser.add_argument("--alphabet", default="abcdefghijklmnopqrstuvwxyz", help="Characters appended to a saturated prefix")
+parser.add_argument("-mp", "--max-pages", type=int, default=5, help="Number of search result pages followed per term")
+parser.add_argument("-aw", "--autocomplete-workers", type=int, default=2, help="Number of prefixes queried at the same time")
+parser.add_argument("-sw", "--search-workers", type=int, default=2, help="Number of search terms searched at the same time")
+parser.add_argument("--term-queue-size", type=int, default=100, help="Discovered terms waiting to be searched before autocomplete pauses")
+parser.add_argument("--url-queue-size", type=int, default=200, help="Discovered app URLs waiting to be scraped before searching pauses")
+addScrapeArguments(parser)
+addStorageArguments(parser)
+
+LOG_DIR = "log"
+CONFIG_DIR = "config"
+
+if not os.path.exists(OUTPUT_DIR): os.makedirs(OUTPUT_DIR)
+if not os.path.exists(LOG_DIR): os.makedirs(LOG_DIR)
+if not os.path.exists(CONFIG_DIR): os.makedirs(CONFIG_DIR)
+
+# the same files as shopify_app_scraper, so either one can pick up where the other stopped
+APP_CHECKPOINT_FILE = os.path.join(CONFIG_DIR, "shopify_app_scraper.checkpoint.sqlite")
+# failed apps are retried with shopify_app_scraper.py --retry-failed
+APP_FAILURES_FILE = os.path.join(CONFIG_DIR, "shopify_app_scraper.failures.sqlite")
+LOG_FILE = os.path.join(LOG_DIR, "shopify_pipeline.log")
+
+def readLines(path):
+	if not os.path.isfile(path): return
+	with open(path, 'r') as file:
+		for line in file:
+			line = line.strip()
+			if line: yield line
+
+class Pipeline:
+	"""
+    Runs the autocomplete crawl, the market search and the app scraper at the
+    same time. Terms are searched as soon as autocomplete turns them up and app
+    URLs scraped as soon as a search finds them; the bounded queues between the
+    stages pause a stage whose consumer falls behind. Terms and app URLs that an
+    earlier run saved but never finished are fed in first
+    @params:
+        args            - Required  : parsed command line arguments (Namespace)
+        prefixes        - Required  : state of every autocomplete prefix queried (CheckpointStore)
+        searchedTerms   - Required  : terms already searched (CheckpointStore)
+        scrapedApps     - Required  : apps already scraped (CheckpointStore)
+        storage         - Required  : where scraped apps are written (Storage)
+        failures        - Required  : failed sections of the apps with errors (FailureQueue)
+    """
+	def __init__(self, args, prefixes, searchedTerms, scrapedApps, storage, failures):
+		self.args = args
+		self.prefixes = prefixes
+		self.searchedTerms = searchedTerms
+		self.scrapedApps = scrapedApps
+		self.storage = storage
+		self.failures = failures
+		self.saturation = autocompleter.SaturationDetector(args.saturation)
+		self.prefixQueue = Queue()
+		self.termQueue = Queue(maxsize=max(1, args.term_queue_size))
+		self.urlQueue = Queue(maxsize=max(1, args.url_queue_size))
+		# the term and link files are appended to from several threads
+		self.saveLock = threading.Lock()
+		self.counts = {'prefixes': 0, 'terms': 0, 'apps': 0, 'appsWithErrors': 0}
+		self.countsLock = threading.Lock()
+		self.finishedApps = AppAcknowledger(scrapedApps)
+
+	def count(self, name):
+		with self.countsLock:
+			self.counts[name] += 1
+			return self.counts[name]
+
+	def getQueueSizes(self):
+		return "{} prefixes, {} terms, {} apps queued".format(self.prefixQueue.qsize(), self.termQueue.qsize(), self.urlQueue.qsize())
+
+	def startThreads(self, target, numberOfThreads, name):
+		threads = [threading.Thread(target=target, name="{}-{}".format(name, index), daemon=True) for index in range(max(1, numberOfThreads))]
+		for thread in threads:
+			thread.start()
+		return threads
+
+	def queryPrefix(self, prefix, states):
+		"""
+        Queries `prefix` unless an earlier run already did, passes its new terms
+        on to the search stage and returns its state
+        """
+		state = states.get(prefix)
+		if state is not None and state != "failed": return state
+
+		searchTerms = autocompleter.getSearchTermsFromAutoComplete(prefix)
+		if searchTerms is None:
+			state = "failed"
+			newTerms = []
+		else:
+			with self.saveLock:
+				newTerms = autocompleter.saveTerms(searchTerms)
+			expand = self.saturation.isSaturated(len(searchTerms)) and len(prefix) < self.args.max_depth
+			state = "expanded" if expand else "done"
+			metrics.inc("prefixes_total", expanded="true" if expand else "false")
+			metrics.inc("search_terms_saved_total", len(newTerms))
+
+		self.prefixes.mark(prefix, state)
+		print("[prefix {}] {} new terms from {}, {} ({})".format(self.count('prefixes'), len(newTerms), prefix, state, self.getQueueSizes()))
+		for term in newTerms:
+			self.termQueue.put(term)
+		return state
+
+	def runAutocompleteWorker(self, states):
+		while True:
+			prefix = self.prefixQueue.get()
+			try:
+				if prefix is None: return
+				if self.queryPrefix(prefix, states) == "expanded":
+					# children are queued before this prefix is marked finished, so the crawl can't look drained early
+					for child in autocompleter.childPrefixes(prefix, self.args.alphabet):
+						self.prefixQueue.put(child)
+			except Exception as e:
+				print("[-] Failed to query prefix {}: {}".format(prefix, e))
+			finally:
+				self.prefixQueue.task_done()
+
+	def runTermSources(self):
+		"""
+        Feeds the search stage: unsearched terms from earlier runs, then the
+        autocomplete crawl. Tells the search workers to stop once both are done
+        """
+		# listed before autocomplete starts adding to the store, so no term is queued twice
+		unsearchedTerms = self.searchedTerms.remaining(autocompleter.termStore.iterTerms())
+
+		def replayTerms():
+			for term in unsearchedTerms:
+				self.termQueue.put(term)
+
+		replay = threading.Thread(target=replayTerms, name="term-replay", daemon=True)
+		replay.start()
+
+		states = self.prefixes.states()
+		for prefix in autocompleter.generatePrefixes(self.args.min_depth, self.args.alphabet):
+			self.prefixQueue.put(prefix)
+		workers = self.startThreads(lambda: self.runAutocompleteWorker(states), self.args.autocomplete_workers, "autocomplete")
+		self.prefixQueue.join()
+		for _ in workers:
+			self.prefixQueue.put(None)
+		for thread in workers + [replay]:
+			thread.join()
+
+		for _ in range(max(1, self.args.search_workers)):
+			self.termQueue.put(None)
+
+	def searchTerm(self, term):
+		linksSaved = []
+		numberOfPages = 0
+		for links in marketScraper.iterResultPages(term, self.args.max_pages):
+			with self.saveLock:
+				newLinks = marketScraper.saveLinks(links)
+			for link in newLinks:
+				self.urlQueue.put(link)
+			linksSaved += newLinks
+			numberOfPages += 1
+
+		self.searchedTerms.markDone(term)
+		metrics.inc("search_terms_total")
+		metrics.inc("search_pages_total", numberOfPages)
+		metrics.inc("app_links_saved_total", len(linksSaved))
+		print("[term {}] {} new app links from {} ({} pages) ({})".format(self.count('terms'), len(linksSaved), term, numberOfPages, self.getQueueSizes()))
+
+	def runSearchWorker(self):
+		while True:
+			term = self.termQueue.get()
+			if term is None: return
+			try:
+				self.searchTerm(term)
+			except Exception as e:
+				print("[-] Failed to search {}: {}".format(term, e))
+
+	def runUrlSources(self):
+		"""
+        Feeds the app stage: unscraped app links from earlier runs, then the
+        links the search workers find. Ends the stream once both are done
+        """
+		# listed before the search workers start appending to the links file, so no URL is queued twice
+		unscrapedUrls = self.scrapedApps.remaining(readLines(marketScraper.OUTPUT_FILE))
+
+		def replayUrls():
+			for url in unscrapedUrls:
+				self.urlQueue.put(url)
+
+		replay = threading.Thread(target=replayUrls, name="url-replay", daemon=True)
+		replay.start()
+
+		workers = self.startThreads(self.runSearchWorker, self.args.search_workers, "search")
+		termSources = threading.Thread(target=self.runTermSources, name="term-sources", daemon=True)
+		termSources.start()
+		for thread in [termSources] + workers + [replay]:
+			thread.join()
+		self.urlQueue.put(None)
+
+	def onResult(self, app):
+		flushed = self.storage.upsert(getRecordToStore(self.storage, app))
+		self.failures.record(app)
+		self.finishedApps.add(app)
+		metrics.inc("apps_total", status="error" if len(app.errors) > 0 else "ok")
+		if flushed: self.finishedApps.acknowledge()
+		print("[app {}] Scraped {} ({}, {:.2f} req/s)".format(self.count('apps'), app.url, self.getQueueSizes(), sharedClient.getCurrentRate()))
+
+		if len(app.errors) > 0:
+			logAppErrors(LOG_FILE, app.url, app.errors)
+			self.count('appsWithErrors')
+
+	def run(self):
+		engine = ScrapeEngine(self.args.concurrency, appOptions=appOptionsFromArgs(self.args))
+
+		urlSources = threading.Thread(target=self.runUrlSources, name="url-sources", daemon=True)
+		urlSources.start()
+		try:
+			engine.run(iter(self.urlQueue.get, None), self.onResult)
+		finally:
+			self.storage.flush()
+			self.finishedApps.acknowledge()
+		urlSources.join()
+
+def main():
+	autocompleter.openTermStore()
+	marketScraper.buildLinksTable()
+	prefixes = CheckpointStore(autocompleter.CHECKPOINT_FILE)
+	searchedTerms = CheckpointStore(marketScraper.CHECKPOINT_FILE)
+	scrapedApps = CheckpointStore(APP_CHECKPOINT_FILE, batchSize=None)
+	storage = openStorageFromArgs(args)
+	failures = FailureQueue(APP_FAILURES_FILE)
+
+	sharedClient.configure(
+		poolSize=max(10, args.concurrency * args.review_page_workers + args.autocomplete_workers + args.search_workers),
+		retries=args.retries,
+		timeout=(10, args.timeout),
+		rateLimiter=rateLimiterFromArgs(args, 1 / 2),
+		cache=openCacheFromArgs(args)
+	)
+	pipeline = Pipeline(args, prefixes, searchedTerms, scrapedApps, storage, failures)
+	metricsDumper = startMetricsFromArgs(args)
+	try:
+		pipeline.run()
+	finally:
+		storage.close()
+		failures.close()
+		for checkpoint in [prefixes, searchedTerms]:
+			checkpoint.close()
+		if metricsDumper is not None: metricsDumper.stop()
+
+	# like shopify_app_scraper, a finished run refreshes every app next time
+	scrapedApps.reset()
+	scrapedApps.close()
+
+	counts = pipeline.counts
+	print("\n[+] Pipeline finished: {} prefixes queried, {} terms searched, {} apps scraped ({} with errors, see {})".format(
+		counts['prefixes'], counts['terms'], counts['apps'], counts['appsWithErrors'], LOG_FILE
+	))
+
+if __name__ == "__main__":
+	args = parser.parse_args()
+	main()
@@ -0,0 +1,349 @@
+from app_record import toRecordDict, getRecordUrl
+from urllib.request import pathname2url
+from time import time
+import threading
+import sqlite3
+import json
+import os
+
+OUTPUT_DIR = "output"
+# every script reads and writes the scraped apps here, so they can pick up each other's work
+STORAGE_FILES = {
+	'sqlite': os.path.join(OUTPUT_DIR, "shopify_apps.sqlite"),
+	'jsonl': os.path.join(OUTPUT_DIR, "shopify_apps.jsonl")
+}
+REVIEWS_DIR = os.path.join(OUTPUT_DIR, "reviews")
+
+class Storage:
+	"""
+    Base class for app record stores. Records (AppRecords or dicts) are keyed by
+    their url and buffered in memory until `batchSize` records are pending, then
+    written in one transaction
+    """
+	def __init__(self, path, batchSize=20):
+		self.path = path
+		self.batchSize = max(1, batchSize)
+		self.pending = []
+		self.lock = threading.Lock()
+
+	def upsert(self, record):
+		"""
+        Queues a record and returns True when this call flushed the batch, i.e.
+        every record upserted so far is on disk
+        """
+		with self.lock:
+			self.pending.append(record)
+			if len(self.pending) < self.batchSize: return False
+			self.writeBatch(self.pending)
+			self.pending = []
+			return True
+
+	def flush(self):
+		with self.lock:
+			if len(self.pending) > 0:
+				self.writeBatch(self.pending)
+				self.pending = []
+
+	def close(self):
+		self.flush()
+
+	def getPending(self, url):
+		# callers hold the lock
+		pendingRecord = next((record for record in reversed(self.pending) if getRecordUrl(record) == url), None)
+		return toRecordDict(pendingRecord) if pendingRecord is not None else None
+
+	def getPendingUrls(self):
+		return [getRecordUrl(record) for record in self.pending]
+
+	def writeBatch(self, records):
+		raise NotImplementedError
+
+	def get(self, url):
+		raise NotImplementedError
+
+	def urls(self):
+		raise NotImplementedError
+
+	def records(self):
+		for url in self.urls():
+			yield self.get(url)
+
+	def metadataRecords(self):
+		"""
+        Every record without its review content
+        """
+		for record in self.records():
+			record.pop('reviews', None)
+			yield record
+
+	def __contains__(self, url):
+		return self.get(url) is not None
+
+	def __len__(self):
+		return len(self.urls())
+
+# json.dumps never writes a quote unescaped inside a string, so these only match top-level keys
+URL_KEY = b'{"url": "'
+REVIEWS_KEY = b', "reviews": '
+
+def toLineRecord(record):
+	# the url goes first and the reviews last, so both can be found on a line without parsing it
+	data = {'url': record['url']}
+	data.update((key, value) for key, value in record.items() if key not in ('url', 'reviews'))
+	if 'reviews' in record: data['reviews'] = record['reviews']
+	return data
+
+def isEscaped(line, index):
+	backslashes = 0
+	while line[index - backslashes - 1] == ord("\\"): backslashes += 1
+	return backslashes % 2 == 1
+
+def parseLineUrl(line):
+	# reads the url off the start of a line instead of parsing the whole line with its reviews
+	if not line.startswith(URL_KEY): return json.loads(line).get('url')
+	urlEnd = line.find(b'"', len(URL_KEY))
+	while urlEnd > 0 and isEscaped(line, urlEnd):
+		urlEnd = line.find(b'"', urlEnd + 1)
+	if urlEnd < 0: return json.loads(line).get('url')
+	return json.loads(line[len(URL_KEY) - 1:urlEnd + 1])
+
+def parseMetadataLine(line):
+	# lines end with their reviews, cutting them off leaves the metadata as a JSON object of its own
+	reviewsAt = line.find(REVIEWS_KEY)
+	if reviewsAt < 0:
+		record = json.loads(line)
+		record.pop('reviews', None)
+		return record
+	return json.loads(line[:reviewsAt] + b"}")
+
+class JsonlStorage(Storage):
+	"""
+    Append-only JSON lines file. An upsert appends a new line and the latest line
+    for a URL wins; an in-memory index of byte offsets makes lookups a single seek.
+    Reviews are written last on each line so metadata reads can skip parsing them.
+    A read-only store never opens the file for writing, so it can be read while
+    a scraper is still appending to it
+    """
+	def __init__(self, path, batchSize=20, readOnly=False):
+		super().__init__(path, batchSize)
+		self.readOnly = readOnly
+		self.offsets = {}
+		self.file = None
+		self.buildIndex()
+		if not readOnly: self.file = open(path, 'ab')
+
+	def buildIndex(self):
+		if not os.path.isfile(self.path): return
+
+		with open(self.path, 'rb') as file:
+			offset = file.tell()
+			line = file.readline()
+			while line:
+				if line.endswith(b"\n"):
+					url = parseLineUrl(line)
+					if url is not None: self.offsets[url] = offset
+				elif not self.readOnly:
+					# a torn last line from a crash mid-write, drop it so the next append starts clean
+					file.close()
+					with open(self.path, 'r+b') as truncated: truncated.truncate(offset)
+					return
+				offset = file.tell()
+				line = file.readline()
+
+	def writeBatch(self, records):
+		if self.readOnly: raise ValueError("{} was opened read-only".format(self.path))
+		offset = self.file.tell()
+		lines = []
+		for record in map(toRecordDict, records):
+			line = (json.dumps(toLineRecord(record), ensure_ascii=False) + "\n").encode('utf8')
+			self.offsets[record['url']] = offset
+			offset += len(line)
+			lines.append(line)
+
+		self.file.write(b"".join(lines))
+		self.file.flush()
+		os.fsync(self.file.fileno())
+
+	def get(self, url):
+		with self.lock:
+			pendingRecord = self.getPending(url)
+			if pendingRecord is not None: return pendingRecord
+
+			offset = self.offsets.get(url)
+			if offset is None: return None
+			with open(self.path, 'rb') as file:
+				file.seek(offset)
+				return json.loads(file.readline())
+
+	def urls(self):
+		with self.lock:
+			return list(dict.fromkeys(list(self.offsets) + self.getPendingUrls()))
+
+	def records(self):
+		self.flush()
+		with self.lock:
+			offsets = list(self.offsets.values())
+		with open(self.path, 'rb') as file:
+			for offset in offsets:
+				file.seek(offset)
+				yield json.loads(file.readline())
+
+	def metadataRecords(self):
+		self.flush()
+		with self.lock:
+			offsets = list(self.offsets.values())
+		with open(self.path, 'rb') as file:
+			for offset in offsets:
+				file.seek(offset)
+				yield parseMetadataLine(file.readline())
+
+	def compact(self):
+		"""
+        Rewrites the file keeping only the latest line of every app
+        """
+		self.flush()
+		tmpPath = self.path + ".tmp"
+		with self.lock:
+			self.file.close()
+			offsets = {}
+			with open(self.path, 'rb') as source, open(tmpPath, 'wb') as target:
+				for url, offset in self.offsets.items():
+					source.seek(offset)
+					offsets[url] = target.tell()
+					target.write(source.readline())
+			os.replace(tmpPath, self.path)
+			self.offsets = offsets
+			self.file = open(self.path, 'ab')
+
+	def close(self):
+		super().close()
+		if self.file is not None: self.file.close()
+
+class SqliteStorage(Storage):
+	"""
+    SQLite table keyed by app URL. Review content is kept in its own column so
+    reading app metadata never has to load it
+    """
+	def __init__(self, path, batchSize=20, readOnly=False):
+		super().__init__(path, batchSize)
+		if readOnly:
+			self.connection = sqlite3.connect("file:{}?mode=ro".format(pathname2url(os.path.abspath(path))), uri=True, timeout=60, check_same_thread=False)
+			return
+		self.connection = sqlite3.connect(path, timeout=60, check_same_thread=False)
+		self.connection.execute("PRAGMA journal_mode=WAL")
+		self.connection.execute("PRAGMA synchronous=NORMAL")
+		self.connection.execute("""
+			CREATE TABLE IF NOT EXISTS apps (
+				url TEXT PRIMARY KEY,
+				data TEXT NOT NULL,
+				reviews TEXT,
+				updatedAt REAL NOT NULL
+			)
+		""")
+		self.connection.commit()
+
+	def writeBatch(self, records):
+		rows = []
+		for record in records:
+			data = dict(toRecordDict(record))
+			reviews = data.pop('reviews', None)
+			rows.append((data['url'], json.dumps(data, ensure_ascii=False), json.dumps(reviews, ensure_ascii=False), time()))
+
+		with self.connection:
+			self.connection.executemany("""
+				INSERT INTO apps (url, data, reviews, updatedAt) VALUES (?, ?, ?, ?)
+				ON CONFLICT(url) DO UPDATE SET data = excluded.data, reviews = excluded.reviews, updatedAt = excluded.updatedAt
+			""", rows)
+
+	def get(self, url):
+		with self.lock:
+			pendingRecord = self.getPending(url)
+			if pendingRecord is not None: return pendingRecord
+
+			row = self.connection.execute("SELECT data, reviews FROM apps WHERE url = ?", (url,)).fetchone()
+		if row is None: return None
+
+		record = json.loads(row[0])
+		record['reviews'] = json.loads(row[1]) if row[1] is not None else {}
+		return record
+
+	def urls(self):
+		with self.lock:
+			storedUrls = [row[0] for row in self.connection.execute("SELECT url FROM apps ORDER BY rowid")]
+			return list(dict.fromkeys(storedUrls + self.getPendingUrls()))
+
+	def records(self, batchSize=100):
+		# a page of rows at a time, review content of the whole table never has to fit in memory
+		self.flush()
+		lastRowId = 0
+		while True:
+			with self.lock:
+				rows = self.connection.execute(
+					"SELECT rowid, data, reviews FROM apps WHERE rowid > ? ORDER BY rowid LIMIT ?", (lastRowId, batchSize)
+				).fetchall()
+			if len(rows) == 0: return
+			for rowId, data, reviews in rows:
+				record = json.loads(data)
+				record['reviews'] = json.loads(reviews) if reviews is not None else {}
+				yield record
+			lastRowId = rows[-1][0]
+
+	def metadataRecords(self):
+		# the reviews column is never read, so this stays fast however many reviews are stored
+		self.flush()
+		with self.lock:
+			rows = self.connection.execute("SELECT data FROM apps ORDER BY rowid").fetchall()
+		for data, in rows:
+			yield json.loads(data)
+
+	def close(self):
+		super().close()
+		self.connection.close()
+
+BACKENDS = {
+	'jsonl': JsonlStorage,
+	'sqlite': SqliteStorage
+}
+
+def openStorage(backend, path, batchSize=20, readOnly=False):
+	"""
+    Opens the `backend` store at `path`. A read-only store leaves the file as it
+    is: a torn last JSONL line is skipped rather than truncated
+    """
+	if backend not in BACKENDS:
+		raise ValueError("Unknown storage backend '{}', expected one of {}".format(backend, ", ".join(BACKENDS)))
+	return BACKENDS[backend](path, batchSize, readOnly)
+
+def addStorageArguments(parser, writing=True):
+	if writing:
+		parser.add_argument("-s", "--storage", default="sqlite", choices=list(BACKENDS), help="Storage backend for scraped apps")
+		parser.add_argument("-b", "--batch-size", type=int, default=20, help="Number of apps written to storage per transaction")
+	else:
+		parser.add_argument("-s", "--storage", default="sqlite", choices=list(BACKENDS), help="Storage backend the apps were scraped into")
+
+def openStorageFromArgs(args, readOnly=False):
+	if readOnly: return openStorage(args.storage, STORAGE_FILES[args.storage], readOnly=True)
+	return openStorage(args.storage, STORAGE_FILES[args.storage], args.batch_size)
+
+def readTinyDbRecords(tinyDbFile):
+	with open(tinyDbFile, 'r', encoding='utf8') as file:
+		content = file.read()
+	if not content.strip(): return
+
+	tables = json.loads(content)
+	for table in tables.values():
+		for docId in sorted(table, key=int):
+			yield table[docId]
+
+def migrateTinyDb(tinyDbFile, storage):
+	"""
+    Copies every record of a TinyDB JSON file into `storage`. Re-scraped apps
+    appear more than once in the TinyDB file; the last copy wins
+    """
+	numberOfRecords = 0
+	for record in readTinyDbRecords(tinyDbFile):
+		if 'url' not in record: continue
+		storage.upsert(record)
+		numberOfRecords += 1
+	storage.flush()
+	return numberOfRecords
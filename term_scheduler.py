@@ -0,0 +1,113 @@
+from term_store import normalizeTerm
+from collections import deque
+import heapq
+
+PREFIX_LENGTH = 3
+STALE_TOLERANCE = 0.1
+
+def getTermFamilies(term):
+	"""
+    Families a term shares yield with: each of its words and its first letters
+    """
+	normalized = normalizeTerm(term)
+	return ["token:" + token for token in normalized.split()] + ["prefix:" + normalized[:PREFIX_LENGTH]]
+
+class YieldStats:
+	def __init__(self):
+		self.searches = 0
+		self.novelLinks = 0
+
+	def record(self, numberOfNovelLinks):
+		self.searches += 1
+		self.novelLinks += numberOfNovelLinks
+
+class TermScheduler:
+	"""
+    Orders search terms by how many new app links they are expected to turn up.
+    Every search updates the novel-link yield of the term's families (words and
+    prefix); terms whose families have dried up sink in the queue or are
+    skipped, and iteration stops once the recent discovery rate is too low
+    @params:
+        minDiscoveryRate    - Optional  : new links per search over the last `window` searches below which the crawl stops, 0 never stops (Float)
+        window              - Optional  : number of recent searches the discovery rate is measured over (Int)
+        skipBelow           - Optional  : predicted new links per search below which a term is skipped (Float)
+        minEvidence         - Optional  : searches in a term's families before it may be skipped (Int)
+        priorStrength       - Optional  : how many searches' worth of weight the overall yield has in a family's estimate (Float)
+    """
+	def __init__(self, minDiscoveryRate=0.05, window=200, skipBelow=0.02, minEvidence=5, priorStrength=2.0):
+		self.minDiscoveryRate = minDiscoveryRate
+		self.window = window
+		self.skipBelow = skipBelow
+		self.minEvidence = minEvidence
+		self.priorStrength = priorStrength
+		self.overall = YieldStats()
+		self.families = {}
+		self.recentNovelLinks = deque(maxlen=window)
+		self.heap = []
+		self.numberOfTermsAdded = 0
+		self.skipped = []
+		self.stopReason = None
+
+	def add(self, term):
+		# new terms start at the overall yield and keep the order they were added in among equals
+		heapq.heappush(self.heap, (-self.getOverallYield(), self.numberOfTermsAdded, term))
+		self.numberOfTermsAdded += 1
+
+	def getOverallYield(self):
+		return (self.overall.novelLinks + 1) / (self.overall.searches + 1)
+
+	def predictYield(self, term):
+		"""
+        Returns the expected new links of searching `term` and how many searches that estimate rests on
+        """
+		overallYield = self.getOverallYield()
+		estimates = []
+		evidence = 0
+		# families nobody has searched yet say nothing about the term, only the others are averaged
+		for family in getTermFamilies(term):
+			stats = self.families.get(family)
+			if stats is None: continue
+			estimates.append((stats.novelLinks + self.priorStrength * overallYield) / (stats.searches + self.priorStrength))
+			evidence += stats.searches
+		if len(estimates) == 0: return overallYield, 0
+		return sum(estimates) / len(estimates), evidence
+
+	def record(self, term, numberOfNovelLinks):
+		self.overall.record(numberOfNovelLinks)
+		for family in getTermFamilies(term):
+			self.families.setdefault(family, YieldStats()).record(numberOfNovelLinks)
+		self.recentNovelLinks.append(numberOfNovelLinks)
+
+	def getDiscoveryRate(self):
+		if len(self.recentNovelLinks) == 0: return None
+		return sum(self.recentNovelLinks) / len(self.recentNovelLinks)
+
+	def isExhausted(self):
+		if self.minDiscoveryRate <= 0 or len(self.recentNovelLinks) < self.window: return False
+		return self.getDiscoveryRate() < self.minDiscoveryRate
+
+	def __len__(self):
+		return len(self.heap)
+
+	def __iter__(self):
+		return self
+
+	def __next__(self):
+		while len(self.heap) > 0:
+			if self.isExhausted():
+				self.stopReason = "discovery rate fell to {:.3f} new links per search".format(self.getDiscoveryRate())
+				raise StopIteration
+
+			_, order, term = heapq.heappop(self.heap)
+			predictedYield, evidence = self.predictYield(term)
+			if predictedYield < self.skipBelow and evidence >= self.minEvidence:
+				self.skipped.append(term)
+				continue
+
+			# stored priorities go stale as yields are recorded, re-queue the term when another one
+			# clearly looks better. The tolerance keeps the overall yield's slow drift from re-sorting everything
+			if len(self.heap) > 0 and predictedYield < -self.heap[0][0] * (1 - STALE_TOLERANCE):
+				heapq.heappush(self.heap, (-predictedYield, order, term))
+				continue
+			return term
+		raise StopIteration
@@ -0,0 +1,96 @@
+from itertools import islice
+from time import time
+import unicodedata
+import threading
+import sqlite3
+
+def normalizeTerm(term):
+	"""
+    Folds case, unicode compatibility forms and whitespace, so "Email  Marketing"
+    and "email marketing" are the same search
+    """
+	return " ".join(unicodedata.normalize("NFKC", term).casefold().split())
+
+def readTextTerms(path):
+	with open(path, 'r', encoding='utf8') as file:
+		for line in file:
+			line = line.rstrip("\n")
+			if line.strip(): yield line
+
+class TermStore:
+	"""
+    Deduplicated search terms in a SQLite file, keyed by their normalized form
+    and kept in the order they were first seen. Inserts and reads stream, so
+    neither side needs the whole term list in memory
+    @params:
+        path        - Required  : term database file (Str)
+    """
+	def __init__(self, path):
+		self.path = path
+		self.lock = threading.Lock()
+		self.connection = sqlite3.connect(path, timeout=60, check_same_thread=False)
+		self.connection.execute("PRAGMA journal_mode=WAL")
+		self.connection.execute("PRAGMA synchronous=NORMAL")
+		self.connection.execute("""
+			CREATE TABLE IF NOT EXISTS terms (
+				id INTEGER PRIMARY KEY AUTOINCREMENT,
+				normalized TEXT NOT NULL UNIQUE,
+				term TEXT NOT NULL,
+				addedAt REAL NOT NULL
+			)
+		""")
+		self.connection.commit()
+
+	def add(self, terms):
+		"""
+        Inserts the terms not stored yet and returns them, in their original spelling
+        """
+		newTerms = []
+		with self.lock, self.connection:
+			for term in terms:
+				normalized = normalizeTerm(term)
+				if not normalized: continue
+				cursor = self.connection.execute(
+					"INSERT OR IGNORE INTO terms (normalized, term, addedAt) VALUES (?, ?, ?)",
+					(normalized, term.strip(), time())
+				)
+				if cursor.rowcount > 0: newTerms.append(term.strip())
+		return newTerms
+
+	def importTerms(self, terms, batchSize=1000):
+		numberOfNewTerms = 0
+		terms = iter(terms)
+		while True:
+			batch = list(islice(terms, batchSize))
+			if len(batch) == 0: return numberOfNewTerms
+			numberOfNewTerms += len(self.add(batch))
+
+	def importTextFile(self, path):
+		return self.importTerms(readTextTerms(path))
+
+	def iterTerms(self, batchSize=1000):
+		"""
+        Yields the stored terms in the order they were first added, a batch at a time
+        """
+		lastId = 0
+		while True:
+			with self.lock:
+				rows = self.connection.execute(
+					"SELECT id, term FROM terms WHERE id > ? ORDER BY id LIMIT ?", (lastId, batchSize)
+				).fetchall()
+			if len(rows) == 0: return
+			for termId, term in rows:
+				yield term
+			lastId = rows[-1][0]
+
+	def __contains__(self, term):
+		with self.lock:
+			row = self.connection.execute("SELECT 1 FROM terms WHERE normalized = ?", (normalizeTerm(term),)).fetchone()
+		return row is not None
+
+	def __len__(self):
+		with self.lock:
+			return self.connection.execute("SELECT COUNT(*) FROM terms").fetchone()[0]
+
+	def close(self):
+		self.connection.close()
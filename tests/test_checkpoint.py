@@ -0,0 +1,56 @@
+from checkpoint import CheckpointStore
+from shopify_engine import AppAcknowledger
+from storage import SqliteStorage
+from types import SimpleNamespace
+
+APP_URLS = ["https://apps.shopify.com/app-{}".format(index) for index in range(5)]
+
+def scrapedApp(url, errors=None):
+	return SimpleNamespace(url=url, errors=errors or [])
+
+def scrape(storage, finishedApps, apps):
+	# the same write-then-acknowledge order as shopify_app_scraper's onResult
+	for app in apps:
+		flushed = storage.upsert({'url': app.url, 'reviews': {}})
+		finishedApps.add(app)
+		if flushed: finishedApps.acknowledge()
+
+def test_resume_after_an_interrupted_batch_rescrapes_only_unwritten_apps(tmp_path):
+	checkpointPath = str(tmp_path / "checkpoint.sqlite")
+	storagePath = str(tmp_path / "apps.sqlite")
+
+	checkpoint = CheckpointStore(checkpointPath, batchSize=None)
+	storage = SqliteStorage(storagePath, batchSize=2)
+	scrape(storage, AppAcknowledger(checkpoint), [scrapedApp(url) for url in APP_URLS[:3]])
+	# the run dies here: the third app is still in the storage batch and was never acknowledged
+	storage.connection.close()
+	checkpoint.connection.close()
+
+	checkpoint = CheckpointStore(checkpointPath, batchSize=None)
+	storage = SqliteStorage(storagePath)
+	assert storage.urls() == APP_URLS[:2]
+	assert checkpoint.remaining(APP_URLS) == APP_URLS[2:]
+	storage.close()
+	checkpoint.close()
+
+def test_apps_with_errors_stay_pending(tmp_path):
+	checkpoint = CheckpointStore(str(tmp_path / "checkpoint.sqlite"), batchSize=None)
+	storage = SqliteStorage(str(tmp_path / "apps.sqlite"), batchSize=1)
+	apps = [scrapedApp(APP_URLS[0]), scrapedApp(APP_URLS[1], ["Failed to scrape reviews"])]
+	scrape(storage, AppAcknowledger(checkpoint), apps)
+
+	assert checkpoint.remaining(APP_URLS[:2]) == [APP_URLS[1]]
+	assert checkpoint.keysInState("failed") == {APP_URLS[1]}
+	storage.close()
+	checkpoint.close()
+
+def test_unflushed_marks_are_lost_and_flushed_ones_kept(tmp_path):
+	path = str(tmp_path / "checkpoint.sqlite")
+	checkpoint = CheckpointStore(path, batchSize=2)
+	for url in APP_URLS[:3]:
+		checkpoint.markDone(url)
+	checkpoint.connection.close()
+
+	checkpoint = CheckpointStore(path)
+	assert checkpoint.remaining(APP_URLS) == APP_URLS[2:]
+	checkpoint.close()
@@ -0,0 +1,70 @@
+from storage import JsonlStorage, SqliteStorage, openStorage
+import json
+import os
+import pytest
+
+def makeRecord(url, title="", reviews=None):
+	return {'url': url, 'title': title, 'reviews': reviews or {'5-star': {'count': 1, 'content': ["great"]}}}
+
+def writeApps(path, records):
+	storage = JsonlStorage(path, batchSize=1)
+	for record in records:
+		storage.upsert(record)
+	storage.close()
+
+def tearLastLine(path):
+	with open(path, 'ab') as file:
+		file.write(b'{"url": "https://apps.shopify.com/torn", "title": "cut off mid-wr')
+
+def test_jsonl_recovers_from_a_torn_last_line(tmp_path):
+	path = str(tmp_path / "apps.jsonl")
+	writeApps(path, [makeRecord("https://apps.shopify.com/a"), makeRecord("https://apps.shopify.com/b")])
+	intactSize = os.path.getsize(path)
+	tearLastLine(path)
+
+	storage = JsonlStorage(path)
+	assert storage.urls() == ["https://apps.shopify.com/a", "https://apps.shopify.com/b"]
+	assert os.path.getsize(path) == intactSize
+
+	storage.upsert(makeRecord("https://apps.shopify.com/c"))
+	storage.close()
+	with open(path, 'rb') as file:
+		lines = [json.loads(line) for line in file]
+	assert [line['url'] for line in lines] == ["https://apps.shopify.com/a", "https://apps.shopify.com/b", "https://apps.shopify.com/c"]
+
+def test_read_only_jsonl_skips_a_torn_line_without_truncating(tmp_path):
+	path = str(tmp_path / "apps.jsonl")
+	writeApps(path, [makeRecord("https://apps.shopify.com/a")])
+	tearLastLine(path)
+	tornSize = os.path.getsize(path)
+
+	storage = openStorage("jsonl", path, readOnly=True)
+	assert storage.urls() == ["https://apps.shopify.com/a"]
+	assert [record['url'] for record in storage.records()] == ["https://apps.shopify.com/a"]
+	storage.close()
+	assert os.path.getsize(path) == tornSize
+
+def test_jsonl_index_reads_urls_with_escaped_characters(tmp_path):
+	path = str(tmp_path / "apps.jsonl")
+	url = 'https://apps.shopify.com/quote"and\\backslash'
+	writeApps(path, [{'reviews': {}, 'title': "reviews first", 'url': url}])
+
+	storage = JsonlStorage(path)
+	assert storage.urls() == [url]
+	assert storage.get(url)['title'] == "reviews first"
+	storage.close()
+
+@pytest.mark.parametrize("backend", ["jsonl", "sqlite"])
+def test_latest_upsert_wins_and_metadata_skips_reviews(tmp_path, backend):
+	path = str(tmp_path / ("apps." + backend))
+	storage = openStorage(backend, path, batchSize=2)
+	storage.upsert(makeRecord("https://apps.shopify.com/a", "old"))
+	storage.upsert(makeRecord("https://apps.shopify.com/b"))
+	storage.upsert(makeRecord("https://apps.shopify.com/a", "new"))
+	storage.close()
+
+	storage = openStorage(backend, path)
+	assert storage.get("https://apps.shopify.com/a")['title'] == "new"
+	assert len(storage) == 2
+	assert all('reviews' not in record for record in storage.metadataRecords())
+	storage.close()
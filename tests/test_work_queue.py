@@ -0,0 +1,70 @@
+from work_queue import WorkQueue
+from time import sleep
+import pytest
+
+@pytest.fixture
+def queuePath(tmp_path):
+	return str(tmp_path / "queue.sqlite")
+
+def getItem(queue, key):
+	return queue.connection.execute("SELECT state, workerId, attempts FROM items WHERE key = ?", (key,)).fetchone()
+
+def test_expired_lease_is_reclaimed_by_another_worker(queuePath):
+	queue = WorkQueue(queuePath, leaseTimeout=0.05)
+	queue.enqueue(["a", "b"])
+	assert queue.lease("worker-1", 2) == ["a", "b"]
+	# nothing is pending while worker-1's leases are live
+	assert queue.lease("worker-2", 2) == []
+
+	sleep(0.1)
+	assert queue.lease("worker-2", 2) == ["a", "b"]
+	assert getItem(queue, "a") == ("leased", "worker-2", 0)
+	queue.close()
+
+def test_renewed_lease_is_not_reclaimed(queuePath):
+	queue = WorkQueue(queuePath, leaseTimeout=0.2)
+	queue.enqueue(["a"])
+	queue.lease("worker-1")
+	for _ in range(3):
+		sleep(0.1)
+		assert queue.renew("worker-1") == 1
+	assert queue.lease("worker-2") == []
+	queue.close()
+
+def test_complete_from_a_worker_that_lost_its_lease_is_ignored(queuePath):
+	queue = WorkQueue(queuePath, leaseTimeout=0.05)
+	queue.enqueue(["a"])
+	queue.lease("worker-1")
+	sleep(0.1)
+	queue.lease("worker-2")
+
+	queue.complete("worker-1", ["a"])
+	assert getItem(queue, "a") == ("leased", "worker-2", 0)
+
+	queue.complete("worker-2", ["a"])
+	assert getItem(queue, "a")[0] == "done"
+	queue.close()
+
+def test_fail_from_a_worker_that_lost_its_lease_is_ignored(queuePath):
+	queue = WorkQueue(queuePath, leaseTimeout=0.05)
+	queue.enqueue(["a"])
+	queue.lease("worker-1")
+	sleep(0.1)
+	queue.lease("worker-2")
+
+	queue.fail("worker-1", "a", "timed out")
+	assert getItem(queue, "a") == ("leased", "worker-2", 0)
+	queue.close()
+
+def test_failed_item_is_retried_until_max_attempts(queuePath):
+	queue = WorkQueue(queuePath, maxAttempts=2)
+	queue.enqueue(["a"])
+	queue.lease("worker-1")
+	queue.fail("worker-1", "a", "error")
+	assert getItem(queue, "a") == ("pending", None, 1)
+
+	queue.lease("worker-1")
+	queue.fail("worker-1", "a", "error")
+	assert getItem(queue, "a") == ("failed", None, 2)
+	assert queue.progress() == (1, 1)
+	queue.close()
@@ -0,0 +1,198 @@
+from time import time, sleep
+import threading
+import sqlite3
+import socket
+import os
+
+class WorkQueue:
+	"""
+    Work list shared by several scraper processes through one SQLite file.
+    Workers lease pending items for `leaseTimeout` seconds, renew the leases
+    while they work and report them complete or failed; leases of workers
+    that died stop being renewed and are reclaimed once they expire, so every
+    item is scraped by exactly one live worker
+    @params:
+        path            - Required  : queue database file (Str)
+        leaseTimeout    - Optional  : seconds a worker may hold an item before it is handed to someone else (Float)
+        maxAttempts     - Optional  : failures after which an item is given up on (Int)
+    """
+	def __init__(self, path, leaseTimeout=1800, maxAttempts=3):
+		self.path = path
+		self.leaseTimeout = leaseTimeout
+		self.maxAttempts = maxAttempts
+		self.lock = threading.Lock()
+		# autocommit mode, every write below runs in its own BEGIN IMMEDIATE transaction
+		self.connection = sqlite3.connect(path, timeout=60, isolation_level=None, check_same_thread=False)
+		self.connection.execute("PRAGMA journal_mode=WAL")
+		self.connection.execute("""
+			CREATE TABLE IF NOT EXISTS items (
+				key TEXT PRIMARY KEY,
+				position INTEGER NOT NULL,
+				state TEXT NOT NULL DEFAULT 'pending',
+				workerId TEXT,
+				leaseExpiresAt REAL,
+				attempts INTEGER NOT NULL DEFAULT 0,
+				error TEXT,
+				updatedAt REAL NOT NULL
+			)
+		""")
+		self.connection.execute("CREATE INDEX IF NOT EXISTS itemsByState ON items (state, position)")
+
+	def transaction(self, statements):
+		with self.lock:
+			self.connection.execute("BEGIN IMMEDIATE")
+			try:
+				result = statements(self.connection)
+				self.connection.execute("COMMIT")
+				return result
+			except BaseException:
+				self.connection.execute("ROLLBACK")
+				raise
+
+	def enqueue(self, keys):
+		"""
+        Adds `keys` in order, skipping the ones already queued so every worker can enqueue the same list
+        """
+		def insert(connection):
+			offset = connection.execute("SELECT COALESCE(MAX(position), -1) + 1 FROM items").fetchone()[0]
+			changesBefore = connection.total_changes
+			now = time()
+			connection.executemany(
+				"INSERT OR IGNORE INTO items (key, position, updatedAt) VALUES (?, ?, ?)",
+				((key, offset + index, now) for index, key in enumerate(keys))
+			)
+			return connection.total_changes - changesBefore
+		return self.transaction(insert)
+
+	def reclaimExpired(self, connection=None):
+		def reclaim(connection):
+			connection.execute(
+				"UPDATE items SET state = 'pending', workerId = NULL, leaseExpiresAt = NULL WHERE state = 'leased' AND leaseExpiresAt < ?",
+				(time(),)
+			)
+			return connection.execute("SELECT changes()").fetchone()[0]
+		return reclaim(connection) if connection is not None else self.transaction(reclaim)
+
+	def lease(self, workerId, count=1):
+		"""
+        Leases up to `count` pending items to `workerId` and returns their keys
+        """
+		def take(connection):
+			self.reclaimExpired(connection)
+			keys = [row[0] for row in connection.execute(
+				"SELECT key FROM items WHERE state = 'pending' ORDER BY position LIMIT ?", (count,)
+			)]
+			now = time()
+			connection.executemany(
+				"UPDATE items SET state = 'leased', workerId = ?, leaseExpiresAt = ?, updatedAt = ? WHERE key = ?",
+				((workerId, now + self.leaseTimeout, now, key) for key in keys)
+			)
+			return keys
+		return self.transaction(take)
+
+	def renew(self, workerId):
+		"""
+        Extends every lease `workerId` holds by another `leaseTimeout` seconds
+        """
+		now = time()
+		return self.transaction(lambda connection: connection.execute(
+			"UPDATE items SET leaseExpiresAt = ?, updatedAt = ? WHERE state = 'leased' AND workerId = ?",
+			(now + self.leaseTimeout, now, workerId)
+		).rowcount)
+
+	def complete(self, workerId, keys):
+		# a lease that expired and went to another worker is no longer this worker's to report
+		now = time()
+		self.transaction(lambda connection: connection.executemany(
+			"UPDATE items SET state = 'done', leaseExpiresAt = NULL, error = NULL, updatedAt = ? WHERE key = ? AND state = 'leased' AND workerId = ?",
+			((now, key, workerId) for key in keys)
+		))
+
+	def fail(self, workerId, key, error=None):
+		"""
+        Puts `key` back in the queue, or marks it failed after `maxAttempts` tries
+        """
+		self.transaction(lambda connection: connection.execute("""
+			UPDATE items SET
+				attempts = attempts + 1,
+				state = CASE WHEN attempts + 1 >= ? THEN 'failed' ELSE 'pending' END,
+				workerId = NULL, leaseExpiresAt = NULL, error = ?, updatedAt = ?
+			WHERE key = ? AND state = 'leased' AND workerId = ?
+		""", (self.maxAttempts, error, time(), key, workerId)))
+
+	def isLeasedElsewhere(self, workerId):
+		with self.lock:
+			row = self.connection.execute(
+				"SELECT 1 FROM items WHERE state = 'leased' AND workerId != ? AND leaseExpiresAt >= ? LIMIT 1", (workerId, time())
+			).fetchone()
+		return row is not None
+
+	def iterLeased(self, workerId, batchSize=1, pollInterval=5):
+		"""
+        Yields leased keys until nothing is pending. While other workers still
+        hold leases it keeps polling, since their items come back if they fail or die.
+        The leases are renewed in the background for as long as this is iterated,
+        so items taking longer than `leaseTimeout` aren't handed to another worker
+        """
+		heartbeat = LeaseHeartbeat(self, workerId).start()
+		try:
+			while True:
+				keys = self.lease(workerId, batchSize)
+				if len(keys) == 0:
+					if not self.isLeasedElsewhere(workerId): return
+					sleep(min(pollInterval, self.leaseTimeout))
+					continue
+				for key in keys:
+					yield key
+		finally:
+			heartbeat.stop()
+
+	def counts(self):
+		with self.lock:
+			return dict(self.connection.execute("SELECT state, COUNT(*) FROM items GROUP BY state").fetchall())
+
+	def progress(self):
+		counts = self.counts()
+		return counts.get('done', 0) + counts.get('failed', 0), sum(counts.values())
+
+	def close(self):
+		self.connection.close()
+
+class LeaseHeartbeat:
+	"""
+    Background thread renewing the leases of `workerId` three times per lease timeout
+    """
+	def __init__(self, queue, workerId):
+		self.queue = queue
+		self.workerId = workerId
+		self.interval = queue.leaseTimeout / 3
+		self.stopped = threading.Event()
+		self.thread = threading.Thread(target=self.run, daemon=True)
+
+	def run(self):
+		while not self.stopped.wait(self.interval):
+			try:
+				self.queue.renew(self.workerId)
+			except sqlite3.Error:
+				# a busy database only delays this renewal, the next one comes well before the leases run out
+				pass
+
+	def start(self):
+		self.thread.start()
+		return self
+
+	def stop(self):
+		self.stopped.set()
+
+def getDefaultWorkerId():
+	return "{}-{}".format(socket.gethostname(), os.getpid())
+
+def addQueueArguments(parser):
+	parser.add_argument("-q", "--queue", default=None, help="Shared SQLite work queue file, lets several workers split the list between them")
+	parser.add_argument("--worker-id", default=getDefaultWorkerId(), help="Name this worker leases queue items under")
+	parser.add_argument("--lease-timeout", type=float, default=30, help="Minutes before an item leased by an unresponsive worker is handed to another one")
+	parser.add_argument("--max-attempts", type=int, default=3, help="Failed attempts after which a queue item is given up on")
+
+def openQueueFromArgs(args):
+	if args.queue is None: return None
+	return WorkQueue(args.queue, leaseTimeout=args.lease_timeout * 60, maxAttempts=args.max_attempts)